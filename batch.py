@@ -0,0 +1,219 @@
+"""
+Headless batch reconstruction of a directory of recordings.
+
+Each video is processed by pipeline.process_video in a bounded process pool,
+without opening the Tk cropper. The ROI comes from a JSON file mapping video
+file names to [x1, y1, x2, y2] (a "default" entry applies to all others) or
+from --roi for a shared rectangle.
+
+Progress is recorded in batch_state.json inside the batch folder; rerunning
+with --resume <batch folder> skips videos that already completed. With
+--worker the videos are queued for a running worker.py instead, which
+skips the import and warm-up cost of a fresh process per video.
+
+Usage:
+    python batch.py recordings/ --roi-json rois.json --jobs 4
+    python batch.py recordings/ --roi 100 50 900 850
+    python batch.py recordings/ --roi-json rois.json --resume final_config/batch_20250101_120000
+    python batch.py recordings/ --roi-json rois.json --worker worker_spool
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import sys
+import time
+import traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+matplotlib.use('Agg')
+
+STATE_FILE = "batch_state.json"
+
+def find_videos(input_dir):
+    """
+    All .mov files in input_dir, sorted by name.
+    """
+    return sorted(p for p in Path(input_dir).iterdir() if p.is_file() and p.suffix.lower() == '.mov')
+
+def load_rois(roi_json=None, shared_roi=None):
+    """
+    Build the ROI lookup from a JSON file and/or a shared rectangle.
+
+    Args:
+        roi_json (str, optional): JSON object mapping file names to [x1, y1, x2, y2]
+        shared_roi (list, optional): Rectangle used for videos without their own entry
+
+    Returns:
+        dict: File name (or 'default') to crop rectangle tuple
+    """
+    rois = {}
+    if roi_json is not None:
+        with open(roi_json) as f:
+            rois = {name: tuple(int(v) for v in rect) for name, rect in json.load(f).items()}
+    if shared_roi is not None:
+        rois.setdefault('default', tuple(shared_roi))
+    return rois
+
+def roi_for(video_path, rois):
+    """
+    Crop rectangle for one video, looked up by file name, then stem, then 'default'.
+    """
+    for key in (video_path.name, video_path.stem, 'default'):
+        if key in rois:
+            return rois[key]
+    return None
+
+def _load_state(batch_dir):
+    state_path = batch_dir / STATE_FILE
+    if state_path.exists():
+        with open(state_path) as f:
+            return json.load(f)
+    return {'jobs': {}}
+
+def _save_state(batch_dir, state):
+    state_path = batch_dir / STATE_FILE
+    tmp_path = state_path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    tmp_path.replace(state_path)
+
+def run_job(video_path, crop_rect, output_dir, log_path):
+    """
+    Process one video in a worker process, logging its output to log_path.
+
+    Returns:
+        tuple: (video file name, 'done' or 'failed', elapsed seconds)
+    """
+    from pipeline import process_video
+
+    start = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            print(f"Video: {video_path}")
+            print(f"Crop rectangle: {crop_rect}")
+            process_video(str(video_path), output_dir, crop_rect=crop_rect)
+            status = 'done'
+        except Exception:
+            traceback.print_exc()
+            status = 'failed'
+    return Path(video_path).name, status, time.perf_counter() - start
+
+def _run_in_pool(pending, state, batch_dir, jobs):
+    """
+    Process the pending videos in a pool of fresh worker processes.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_job, *job) for job in pending]
+        for future in as_completed(futures):
+            try:
+                name, status, seconds = future.result()
+            except Exception as exc:
+                # The worker process itself died; its video stays pending for --resume
+                print(f"Worker failed: {exc}")
+                continue
+            state['jobs'][name].update(status=status, seconds=round(seconds, 1))
+            _save_state(batch_dir, state)
+            print(f"{name}: {status} in {seconds:.1f}s")
+
+def _run_on_worker(pending, state, batch_dir, spool_dir):
+    """
+    Queue the pending videos for worker.py and record their outcomes as they finish.
+    """
+    import worker
+
+    names = {}
+    for video_path, crop_rect, output_dir, _ in pending:
+        # Waits while the worker's queue is full
+        names[worker.submit(video_path, crop_rect, output_dir=output_dir, spool_dir=spool_dir, block=True)] = \
+            video_path.name
+    for record in worker.wait(names, spool_dir):
+        name = names[record['id']]
+        status = 'done' if record['state'] == 'done' else 'failed'
+        state['jobs'][name].update(status=status, seconds=round(record.get('seconds', 0.0), 1),
+                                   job_id=record['id'], timings=record.get('timings', {}))
+        if record.get('error'):
+            state['jobs'][name]['error'] = record['error']
+        _save_state(batch_dir, state)
+        print(f"{name}: {status} in {record.get('seconds', 0.0):.1f}s")
+
+def run_batch(input_dir, rois, output_root="final_config", jobs=1, batch_dir=None, worker_spool=None):
+    """
+    Process every video in input_dir through a pool of worker processes.
+
+    Args:
+        input_dir (str): Directory containing .mov recordings
+        rois (dict): ROI lookup from load_rois
+        output_root (str): Parent directory for a new batch folder
+        jobs (int): Number of worker processes
+        batch_dir (str, optional): Existing batch folder to resume
+        worker_spool (str, optional): Queue the videos for the worker.py serving this spool
+            instead of starting worker processes
+
+    Returns:
+        bool: True if every video completed successfully
+    """
+    from run_folders import run_folder_name
+
+    if batch_dir is None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        batch_dir = Path(output_root) / f"batch_{timestamp}"
+    batch_dir = Path(batch_dir)
+    log_dir = batch_dir / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    state = _load_state(batch_dir)
+    pending = []
+    for video_path in find_videos(input_dir):
+        job = state['jobs'].get(video_path.name)
+        if job is not None and job['status'] == 'done':
+            print(f"Skipping {video_path.name} (already done)")
+            continue
+        crop_rect = roi_for(video_path, rois)
+        if crop_rect is None:
+            print(f"Skipping {video_path.name} (no ROI given)")
+            state['jobs'][video_path.name] = {'status': 'failed', 'error': 'no ROI given'}
+            continue
+        output_dir = batch_dir / run_folder_name(video_path)
+        state['jobs'][video_path.name] = {'status': 'pending', 'crop_rect': list(crop_rect),
+                                          'output_dir': str(output_dir)}
+        pending.append((video_path, crop_rect, output_dir, log_dir / f"{video_path.stem}.log"))
+    _save_state(batch_dir, state)
+
+    if worker_spool is not None:
+        print(f"Queueing {len(pending)} videos for the worker at {worker_spool}; results go to {batch_dir}")
+        _run_on_worker(pending, state, batch_dir, worker_spool)
+    else:
+        print(f"Processing {len(pending)} videos with {jobs} workers into {batch_dir}")
+        _run_in_pool(pending, state, batch_dir, jobs)
+
+    failed = [name for name, job in state['jobs'].items() if job['status'] != 'done']
+    if failed:
+        print(f"{len(failed)} videos did not complete: {', '.join(failed)}")
+    return not failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruct a directory of recordings without the GUI.")
+    parser.add_argument('input_dir', help="Directory containing .mov recordings")
+    parser.add_argument('--roi-json', help="JSON object mapping file names to [x1, y1, x2, y2]; 'default' applies to all")
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                        help="Crop rectangle shared by videos without their own entry")
+    parser.add_argument('--output', default="final_config", help="Parent directory of the batch folder")
+    parser.add_argument('--jobs', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--resume', metavar='BATCH_DIR', help="Continue a previous batch folder")
+    parser.add_argument('--worker', metavar='SPOOL', help="Queue the videos for a running worker.py with this spool")
+    args = parser.parse_args()
+
+    if args.roi_json is None and args.roi is None:
+        parser.error("give --roi-json or --roi")
+
+    rois = load_rois(args.roi_json, args.roi)
+    ok = run_batch(args.input_dir, rois, output_root=args.output, jobs=args.jobs, batch_dir=args.resume,
+                   worker_spool=args.worker)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
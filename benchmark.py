@@ -0,0 +1,232 @@
+"""
+Synthetic-phantom benchmark of every pipeline stage.
+
+Renders shadow videos of a rotating Shepp-Logan phantom for a matrix of
+image_size, num_frames and projection storage precision, runs the pipeline
+stages on them with the CPU reconstruction backend, and records per-stage
+wall time, peak memory and the reconstruction error against the
+ground-truth phantom as JSON.
+
+Usage:
+    python benchmark.py --sizes 64 128 --frames 90 180
+    python benchmark.py --sizes 128 --frames 180 --precisions float32 float16 uint8
+    python benchmark.py --baseline benchmark_results/abc1234.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from pathlib import Path
+import matplotlib
+matplotlib.use('Agg')
+from config import RECONSTRUCTION_CONFIG, VIDEO_CONFIG, PHYSICAL_CONFIG, EXPORT_CONFIG
+from geometry_config import create_geometry, create_angles
+from video_processor import VideoProcessor
+from preprocessing import Preprocessor
+from reconstruction import reconstruct_volume, save_stl
+from geometry_tables import tables_for
+from volume_export import write_volume
+from precision import PROJECTION_DTYPES
+from phantom import phantom_ellipsoids, ground_truth_volume, attenuation_for_contrast, write_phantom_video
+
+def git_revision():
+    """
+    Short hash of the current commit, or 'unknown' outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def reconstruction_error(volume, truth):
+    """
+    Error of a reconstruction against the ground-truth phantom.
+
+    Returns:
+        dict: RMSE, RMSE relative to the phantom's value range, and correlation
+    """
+    volume = np.asarray(volume, dtype=np.float64)
+    truth = np.asarray(truth, dtype=np.float64)
+    rmse = float(np.sqrt(np.mean((volume - truth)**2)))
+    value_range = float(truth.max() - truth.min()) or 1.0
+    return {
+        'rmse': rmse,
+        'nrmse': rmse / value_range,
+        'correlation': float(np.corrcoef(volume.ravel(), truth.ravel())[0, 1]),
+    }
+
+def _timed(timings, stage, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+def run_case(image_size, num_frames, work_dir, repeats=1, projection_dtype='float32'):
+    """
+    Benchmark all stages for one image_size / num_frames combination.
+
+    Args:
+        image_size (int): Volume and detector size
+        num_frames (int): Number of projections
+        work_dir (Path): Scratch directory for videos and outputs
+        repeats (int): Runs per stage; the fastest is reported
+        projection_dtype (str): Projection stack storage (see precision.PROJECTION_DTYPES)
+
+    Returns:
+        dict: Stage timings (seconds), peak memory of extraction and
+            reconstruction (bytes allocated by numpy and Python) and reconstruction error
+    """
+    geo = create_geometry(image_size=image_size, detector_size=image_size)
+    geo.accuracy = 0.5
+    angles = create_angles(num_frames)
+    ellipsoids = phantom_ellipsoids(geo)
+    attenuation = attenuation_for_contrast(geo, ellipsoids)
+
+    case_dir = Path(work_dir) / f"size{image_size}_frames{num_frames}"
+    rendered = sorted(case_dir.glob("phantom.*"))
+    video_path = rendered[0] if rendered else None
+    render_seconds = 0.0
+    if video_path is None:
+        # The video does not depend on the storage precision, so it is shared across precisions
+        case_dir.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        video_path = write_phantom_video(case_dir / "phantom", geo, angles, ellipsoids, attenuation)
+        render_seconds = time.perf_counter() - start
+    case_dir = case_dir / projection_dtype
+    case_dir.mkdir(exist_ok=True)
+
+    # The mask is applied while decoding, as in the pipeline
+    mask = tables_for(geo).circular_mask() if RECONSTRUCTION_CONFIG.get('apply_circular_mask', False) else None
+    preprocessor = Preprocessor.standard(target_size=(image_size, image_size), mask=mask)
+
+    best = {}
+    peak_memory = None
+    for _ in range(repeats):
+        timings = {}
+        tracemalloc.start()
+        with VideoProcessor(video_path, target_size=(image_size, image_size),
+                            projection_dtype=projection_dtype, preprocessor=preprocessor) as processor:
+            projections = _timed(timings, 'extract_projection_frames', processor.extract_projection_frames,
+                                 num_frames=num_frames, num_workers=VIDEO_CONFIG.get('decode_workers', 1))
+
+        volume = _timed(timings, 'reconstruct_volume', reconstruct_volume, projections, geo, angles,
+                        mask_applied=True)
+        del projections
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        peak_memory = min(peak, peak_memory or peak)
+        _timed(timings, 'save_stl', save_stl, volume, case_dir, threshold=RECONSTRUCTION_CONFIG['stl_threshold'])
+
+        suffix = '.ome.tiff' if EXPORT_CONFIG.get('format', 'ome-tiff') == 'ome-tiff' else '.zarr'
+        _timed(timings, 'export_volume', write_volume, volume, case_dir / f"volume{suffix}",
+               format=EXPORT_CONFIG.get('format', 'ome-tiff'), codec=EXPORT_CONFIG.get('codec', 'zlib'),
+               quantization=EXPORT_CONFIG.get('quantization'), tile_size=EXPORT_CONFIG.get('tile_size', 256),
+               pyramid_levels=EXPORT_CONFIG.get('pyramid_levels', 4), num_workers=EXPORT_CONFIG.get('workers'),
+               pixel_size=(PHYSICAL_CONFIG['pixel_size_x'], PHYSICAL_CONFIG['pixel_size_y'],
+                           PHYSICAL_CONFIG['physical_size_z']), unit=PHYSICAL_CONFIG['unit'])
+
+        for stage, seconds in timings.items():
+            best[stage] = min(seconds, best.get(stage, seconds))
+
+    truth = ground_truth_volume(geo, ellipsoids, attenuation)
+    return {
+        'image_size': image_size,
+        'num_frames': num_frames,
+        'projection_dtype': projection_dtype,
+        'render_seconds': render_seconds,
+        'stages': best,
+        'peak_memory_bytes': peak_memory,
+        'total_seconds': sum(best.values()),
+        'error': reconstruction_error(volume, truth),
+    }
+
+def compare_to_baseline(results, baseline, time_tolerance=1.2, error_tolerance=1.05, min_delta=0.01):
+    """
+    Flag stages that got slower and cases whose reconstruction error grew.
+
+    Args:
+        results (dict): Current benchmark results
+        baseline (dict): Earlier benchmark results
+        time_tolerance (float): Allowed slowdown factor per stage
+        error_tolerance (float): Allowed growth factor of the NRMSE
+        min_delta (float): Slowdowns below this many seconds are treated as timer noise
+
+    Returns:
+        list: Human-readable regression messages
+    """
+    def case_key(case):
+        return case['image_size'], case['num_frames'], case.get('projection_dtype', 'float32')
+
+    previous = {case_key(c): c for c in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        key = case_key(case)
+        if key not in previous:
+            continue
+        label = f"size {key[0]}, frames {key[1]}, {key[2]}"
+        for stage, seconds in case['stages'].items():
+            old = previous[key]['stages'].get(stage)
+            if old and seconds > old * time_tolerance and seconds - old > min_delta:
+                regressions.append(f"{label}: {stage} {old:.3f}s -> {seconds:.3f}s ({seconds / old:.2f}x)")
+        old_error = previous[key]['error']['nrmse']
+        if case['error']['nrmse'] > old_error * error_tolerance:
+            regressions.append(f"{label}: NRMSE {old_error:.4f} -> {case['error']['nrmse']:.4f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic phantom videos.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 128], help="image_size values")
+    parser.add_argument('--frames', type=int, nargs='+', default=[90, 180], help="num_frames values")
+    parser.add_argument('--repeats', type=int, default=1, help="Runs per case; the fastest is kept")
+    parser.add_argument('--backend', default='cpu', help="Reconstruction backend to benchmark")
+    parser.add_argument('--precisions', nargs='+', default=['float32'], choices=PROJECTION_DTYPES,
+                        help="Projection storage precisions to compare")
+    parser.add_argument('--output', help="Results JSON (default: benchmark_results/<commit>.json)")
+    parser.add_argument('--baseline', help="Earlier results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=1.2, help="Allowed slowdown factor per stage")
+    args = parser.parse_args()
+
+    RECONSTRUCTION_CONFIG['backend'] = args.backend
+    revision = git_revision()
+    results = {
+        'revision': revision,
+        'backend': args.backend,
+        'filter_type': RECONSTRUCTION_CONFIG['filter_type'],
+        'machine': {'platform': platform.platform(), 'python': platform.python_version()},
+        'cases': [],
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for image_size in args.sizes:
+            for num_frames in args.frames:
+                for projection_dtype in args.precisions:
+                    print(f"Benchmarking image_size={image_size}, num_frames={num_frames}, {projection_dtype}...")
+                    case = run_case(image_size, num_frames, work_dir, repeats=args.repeats,
+                                    projection_dtype=projection_dtype)
+                    results['cases'].append(case)
+                    stages = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in case['stages'].items())
+                    print(f"  {stages}; peak {case['peak_memory_bytes'] / 1024**2:.1f} MiB; "
+                          f"NRMSE {case['error']['nrmse']:.4f}")
+
+    output = Path(args.output) if args.output else Path("benchmark_results") / f"{revision}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved in: {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), time_tolerance=args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
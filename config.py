@@ -8,7 +8,23 @@ RECONSTRUCTION_CONFIG = {
     # Available filters in TIGRE: 'ram_lak', 'shepp_logan', 'cosine', 'hamming', 'hann'
     'filter_type': 'hamming',  # Using Shepp-Logan to reduce ring artifacts
     'stl_threshold': 0.3,      # Threshold for STL conversion (0-1) 0.5
-    'apply_circular_mask': True #Apply a circular mask to projections
+    'stl_target_faces': None,  # Decimate model.stl to at most this many faces (None = full resolution)
+    'mesh_block_size': 64,     # Marching cubes in blocks of this many voxels, skipping empty/full ones (None = single pass)
+    'mesh_workers': 1,         # Worker processes for block marching cubes (1 = in this process, None = all cores)
+    'apply_circular_mask': True, #Apply a circular mask to projections
+    'backend': 'tigre',        # 'tigre' (CUDA GPU) or 'cpu' (multi-core numpy FDK)
+    'cpu_workers': None,       # Worker threads for the 'cpu' backend (None = all cores)
+    'slab_mode': False,        # Reconstruct in z-slabs into a memory-mapped reconstruction.npy
+    'slab_thickness': None,    # Slices per slab (None = planned from memory_budget_gb)
+    'memory_budget_gb': None,  # RAM budget for slab planning (None = half of available memory)
+    'algorithm': 'fdk',        # 'fdk' or 'os_sart' (iterative on the CPU, warm-started from FDK; for sparse-angle captures)
+    'iterations': 20,          # Maximum OS-SART passes over all subsets
+    'subsets': 10,             # Ordered subsets per pass (1 = SIRT)
+    'relaxation': 1.0,         # OS-SART relaxation factor
+    'tv_weight': 0.0,          # TV regularization step relative to the OS-SART update (0 = off)
+    'tv_iterations': 10,       # TV descent steps per pass
+    'convergence_tolerance': 1e-3,  # Stop once the relative residual improves by less than this
+    'streaming': False         # Backproject each frame as it is decoded (CPU FDK; needs a numeric rotation_period, else num_frames per revolution)
 }
 
 # Geometry parameters
@@ -23,7 +39,15 @@ GEOMETRY_CONFIG = {
 # Video processing parameters
 VIDEO_CONFIG = {
     'num_frames': 800,        # Number of frames to extract
-    'target_size': (GEOMETRY_CONFIG['image_size'], GEOMETRY_CONFIG['image_size'])  # Derived from image_size
+    'target_size': (GEOMETRY_CONFIG['image_size'], GEOMETRY_CONFIG['image_size']),  # Derived from image_size (worker.DERIVED_CONFIG follows overrides)
+    'memmap_projections': False,  # Store the projection stack as projections.npy on disk instead of in RAM
+    'write_cropped_preview': False,  # Also encode <name>_cropped.mp4 in the background while extracting
+    'decode_workers': 1,  # Parallel decode segments, each with its own VideoCapture (1 = sequential)
+    'flat_field': 256.0,  # Unattenuated backlight intensity for log inversion (256 = raw 8-bit range)
+    'background': None,   # Log-domain background subtracted from each projection: a number or a .npy of one (H, W) projection
+    'clip_range': None,   # (min, max) attenuation kept after background subtraction (None = no clipping)
+    'projection_dtype': 'float32',  # Projection stack storage: 'float32', 'float16' (half memory) or 'uint8' (quarter; decoded through the log table on read)
+    'rotation_period': 'auto'  # Frames per revolution: 'auto' = estimate from the video, None = first num_frames frames span 360 degrees
 }
 
 # Physical dimensions (in microns)
@@ -34,6 +58,40 @@ PHYSICAL_CONFIG = {
     'unit': 'um'
 }
 
+# Volume export (model/reconstructed_volume.ome.tiff or .zarr), read from the memory-mapped reconstruction.npy
+EXPORT_CONFIG = {
+    'format': 'ome-tiff',      # 'ome-tiff' (tiled, with a pyramid) or 'zarr' (chunked directory)
+    'codec': 'zlib',           # 'none', 'zlib', 'zstd' or 'lz4' (zstd needs zstandard, lz4 needs lz4 and 'zarr')
+    'quantization': None,      # None (float32), 'float16' ('zarr' only) or 'uint16' (scale and offset in the metadata)
+    'tile_size': 256,          # Tile/chunk edge in pixels
+    'pyramid_levels': 4,       # 2x downsampled OME-TIFF levels
+    'workers': None            # Compression threads (None = all cores)
+}
+
+# Stage cache: reruns reuse projections, filtered projections, volume and mesh
+# whose inputs (video content, crop, configs) are unchanged, and geometry tables
+# (ramp filter, cosine weights, detector mask) of the same rig
+CACHE_CONFIG = {
+    'enabled': True,
+    'cache_dir': 'stage_cache',  # Shared across runs, next to final_config/
+    'max_size_gb': 20            # Least recently used entries are evicted beyond this size
+}
+
+# Warm worker (worker.py): keeps the reconstruction stack imported and takes jobs from a spool directory
+WORKER_CONFIG = {
+    'spool_dir': 'worker_spool',  # Job queue shared by the worker and its clients
+    'workers': 1,                 # Jobs reconstructed at once, each in its own warm process
+    'max_queued': 32,             # submit() waits, or refuses, while this many jobs are queued
+    'poll_interval': 0.5          # Seconds between scans of the spool
+}
+
+# Per-stage metrics (wall/CPU time, peak RSS, I/O) written to metrics.json in each run folder
+INSTRUMENTATION_CONFIG = {
+    'enabled': True,
+    'profiler': None,          # None, 'cprofile' (profile.prof) or 'sampling' (profile_samples.txt)
+    'sample_interval': 0.01    # Seconds between stack samples for the sampling profiler
+}
+
 # Visualization parameters
 VISUALIZATION_CONFIG = {
     'auto_contrast': True,           # Automatically adjust contrast of saved slices
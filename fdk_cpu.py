@@ -0,0 +1,258 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from geometry_tables import tables_for
+
+# Filters understood by filter_projections, matching the names TIGRE accepts
+FILTER_TYPES = ('ram_lak', 'shepp_logan', 'cosine', 'hamming', 'hann')
+
+def _axis_coordinates(n, spacing, offset=0.0):
+    """
+    Centre coordinates of n samples with the given spacing, centred on offset.
+    """
+    return ((np.arange(n, dtype=np.float32) - (n - 1) / 2.0) * spacing + offset).astype(np.float32)
+
+def detector_coordinates(geo):
+    """
+    Compute detector pixel coordinates scaled to the rotation axis.
+
+    Args:
+        geo: Geometry object from geometry_config.create_geometry
+
+    Returns:
+        tuple: (v, u) coordinate vectors in mm at the isocenter plane
+    """
+    magnification = geo.DSO / geo.DSD
+    off_v, off_u = np.asarray(geo.offDetector, dtype=float)
+    v = _axis_coordinates(int(geo.nDetector[0]), geo.dDetector[0] * magnification, off_v * magnification)
+    u = _axis_coordinates(int(geo.nDetector[1]), geo.dDetector[1] * magnification, off_u * magnification)
+    return v, u
+
+def cosine_weights(geo):
+    """
+    Compute the FDK cosine pre-weighting for one projection.
+
+    Args:
+        geo: Geometry object from geometry_config.create_geometry
+
+    Returns:
+        numpy.ndarray: (nV, nU) float32 weights
+    """
+    v, u = detector_coordinates(geo)
+    weights = geo.DSO / np.sqrt(geo.DSO**2 + u[np.newaxis, :]**2 + v[:, np.newaxis]**2)
+    return weights.astype(np.float32)
+
+def ramp_filter(filter_type, num_pixels, spacing):
+    """
+    Build the frequency response of a windowed ramp filter.
+
+    The ramp is built from the band-limited spatial Ram-Lak kernel so the DC
+    term is correct, then apodized by the requested window.
+
+    Args:
+        filter_type (str): One of FILTER_TYPES
+        num_pixels (int): Number of detector columns
+        spacing (float): Column spacing at the isocenter (mm)
+
+    Returns:
+        numpy.ndarray: Real frequency response of length rfft(pad_length)
+    """
+    if filter_type not in FILTER_TYPES:
+        raise ValueError(f"Unknown filter type: {filter_type}. Available filters: {', '.join(FILTER_TYPES)}")
+
+    # Zero-pad to at least twice the detector width to avoid wrap-around
+    pad_length = max(64, int(2 ** np.ceil(np.log2(2 * num_pixels))))
+
+    # Spatial Ram-Lak kernel
+    n = np.concatenate((np.arange(0, pad_length // 2 + 1), np.arange(-pad_length // 2 + 1, 0)))
+    kernel = np.zeros(pad_length)
+    kernel[0] = 0.25
+    odd = n % 2 == 1
+    kernel[odd] = -1.0 / (np.pi * n[odd])**2
+    response = np.real(np.fft.rfft(kernel))
+
+    # Apodization window over normalized frequency w in [0, pi]
+    w = 2 * np.pi * np.fft.rfftfreq(pad_length)
+    if filter_type == 'shepp_logan':
+        response[1:] *= np.sin(w[1:] / 2) / (w[1:] / 2)
+    elif filter_type == 'cosine':
+        response *= np.cos(w / 2)
+    elif filter_type == 'hamming':
+        response *= 0.54 + 0.46 * np.cos(w)
+    elif filter_type == 'hann':
+        response *= (1 + np.cos(w)) / 2
+
+    return (response / spacing).astype(np.float32)
+
+def filter_projections(projections, geo, filter_type='ram_lak', batch_size=8):
+    """
+    Apply cosine weighting and ramp filtering along detector rows.
+
+    Projections are processed in batches so the padded FFT buffers stay small.
+
+    Args:
+        projections (numpy.ndarray): (num_angles, nV, nU) projection data of any
+            precision (or a precision.LutProjections); batches are read as float32
+        geo: Geometry object from geometry_config.create_geometry
+        filter_type (str): One of FILTER_TYPES
+        batch_size (int): Number of projections filtered per FFT call
+
+    Returns:
+        numpy.ndarray: Filtered float32 projections with the same shape
+    """
+    num_angles, num_rows, num_cols = projections.shape
+    # Built once per geometry; memory-mapped if the pipeline attached its stage cache
+    tables = tables_for(geo)
+    response = tables.ramp_filter(filter_type)
+    pad_length = 2 * (response.shape[0] - 1)
+    weights = tables.cosine_weights()
+
+    filtered = np.empty((num_angles, num_rows, num_cols), dtype=np.float32)
+    for start in range(0, num_angles, batch_size):
+        stop = min(start + batch_size, num_angles)
+        batch = np.asarray(projections[start:stop], dtype=np.float32) * weights
+        spectrum = np.fft.rfft(batch, n=pad_length, axis=-1)
+        spectrum *= response
+        filtered[start:stop] = np.fft.irfft(spectrum, n=pad_length, axis=-1)[..., :num_cols]
+
+    return filtered
+
+def angular_weights(angles):
+    """
+    Compute the angular integration step for each projection.
+
+    Uses half the span to the neighbouring angles so non-uniform sampling and
+    partial arcs are handled consistently.
+
+    Args:
+        angles (numpy.ndarray): Projection angles in radians
+
+    Returns:
+        numpy.ndarray: Integration weight per angle
+    """
+    angles = np.asarray(angles, dtype=float)
+    if angles.size < 2:
+        return np.full(angles.size, 2 * np.pi)
+    steps = np.abs(np.diff(angles))
+    weights = np.empty_like(angles)
+    weights[0] = steps[0]
+    weights[-1] = steps[-1]
+    weights[1:-1] = (steps[:-1] + steps[1:]) / 2
+    return weights
+
+def backproject_slab(filtered, geo, angles, weights, z_start, z_stop):
+    """
+    Voxel-driven backprojection of all angles into the slices [z_start, z_stop).
+
+    Args:
+        filtered (numpy.ndarray): Filtered projections (num_angles, nV, nU)
+        geo: Geometry object from geometry_config.create_geometry
+        angles (numpy.ndarray): Projection angles in radians
+        weights (numpy.ndarray): Weight of each projection (backproject uses angular_weights / 2)
+        z_start (int): First slice of the slab
+        z_stop (int): Slice after the last one
+
+    Returns:
+        numpy.ndarray: float32 slab (z_stop - z_start, ny, nx) to add into the volume
+    """
+    num_angles, num_rows, num_cols = filtered.shape
+    nz, ny, nx = (int(n) for n in geo.nVoxel)
+    off_z, off_y, off_x = np.asarray(geo.offOrigin, dtype=float)
+    z = _axis_coordinates(nz, geo.dVoxel[0], off_z)[z_start:z_stop]
+    y = _axis_coordinates(ny, geo.dVoxel[1], off_y)
+    x = _axis_coordinates(nx, geo.dVoxel[2], off_x)
+    xx, yy = np.meshgrid(x, y)
+
+    v_det, u_det = tables_for(geo).detector_coordinates()
+    du = u_det[1] - u_det[0] if num_cols > 1 else 1.0
+    dv = v_det[1] - v_det[0] if num_rows > 1 else 1.0
+
+    slab = np.zeros((z_stop - z_start, ny, nx), dtype=np.float32)
+    flat_size = num_rows * num_cols
+
+    for a in range(num_angles):
+        # Python floats keep the float32 coordinates from being promoted to float64
+        cos_a, sin_a = float(np.cos(angles[a])), float(np.sin(angles[a]))
+        # Distance along the central ray and lateral offset in the rotated frame
+        s = xx * cos_a + yy * sin_a
+        t = -xx * sin_a + yy * cos_a
+        magnification = (geo.DSO / (geo.DSO - s)).astype(np.float32)
+
+        # Column index depends only on (y, x); row index also on z
+        u_idx = (t * magnification - u_det[0]) / du
+        u0 = np.floor(u_idx).astype(np.int32)
+        fu = (u_idx - u0).astype(np.float32)
+        v_idx = (z[:, np.newaxis, np.newaxis] * magnification - v_det[0]) / dv
+        v0 = np.floor(v_idx).astype(np.int32)
+        fv = (v_idx - v0).astype(np.float32)
+
+        valid = (u0 >= 0) & (u0 < num_cols - 1) & (v0 >= 0) & (v0 < num_rows - 1)
+        base = np.where(valid, v0 * num_cols + u0, 0)
+        proj = filtered[a].reshape(flat_size)
+
+        top = proj[base] * (1 - fu) + proj[base + 1] * fu
+        bottom = proj[base + num_cols] * (1 - fu) + proj[base + num_cols + 1] * fu
+        sample = top * (1 - fv) + bottom * fv
+        sample[~valid] = 0
+
+        slab += sample * (float(weights[a]) * magnification**2)
+
+    return slab
+
+def backproject(filtered, geo, angles, num_workers=None):
+    """
+    Voxel-driven cone-beam backprojection split across CPU cores.
+
+    The volume is divided into z-slabs, one task per slab; numpy releases the
+    GIL for the arithmetic so the slabs run concurrently on a thread pool.
+
+    Args:
+        filtered (numpy.ndarray): Filtered projections (num_angles, nV, nU)
+        geo: Geometry object from geometry_config.create_geometry
+        angles (numpy.ndarray): Projection angles in radians
+        num_workers (int, optional): Number of worker threads (default: all cores)
+
+    Returns:
+        numpy.ndarray: Reconstructed float32 volume (nz, ny, nx)
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    angles = np.asarray(angles, dtype=float)
+    weights = angular_weights(angles) / 2
+    nz, ny, nx = (int(n) for n in geo.nVoxel)
+    volume = np.empty((nz, ny, nx), dtype=np.float32)
+
+    # Use several slabs per worker so uneven slabs do not stall the pool, and at
+    # most 8 slices per slab so the per-angle temporaries stay small
+    num_slabs = max(1, min(nz, max(num_workers * 4, -(-nz // 8))))
+    bounds = np.linspace(0, nz, num_slabs + 1).astype(int)
+
+    def run(z_start, z_stop):
+        volume[z_start:z_stop] = backproject_slab(filtered, geo, angles, weights, z_start, z_stop)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(run, z_start, z_stop)
+                   for z_start, z_stop in zip(bounds[:-1], bounds[1:]) if z_stop > z_start]
+        for future in futures:
+            future.result()
+
+    return volume
+
+def fdk(projections, geo, angles, filter='ram_lak', num_workers=None):
+    """
+    CPU implementation of the FDK cone-beam reconstruction.
+
+    Drop-in alternative to tigre.algorithms.fdk for machines without a CUDA GPU.
+
+    Args:
+        projections (numpy.ndarray): Projection data (num_angles, nV, nU)
+        geo: Geometry object from geometry_config.create_geometry
+        angles (numpy.ndarray): Projection angles in radians
+        filter (str): One of FILTER_TYPES
+        num_workers (int, optional): Number of worker threads (default: all cores)
+
+    Returns:
+        numpy.ndarray: Reconstructed float32 volume (nz, ny, nx)
+    """
+    filtered = filter_projections(projections, geo, filter_type=filter)
+    return backproject(filtered, geo, angles, num_workers=num_workers)
@@ -1,7 +1,18 @@
-import tigre
 import numpy as np
 from config import GEOMETRY_CONFIG
 
+try:
+    import tigre
+except ImportError:
+    # CPU-only machines reconstruct with the 'cpu' backend and need no TIGRE
+    tigre = None
+
+class Geometry:
+    """
+    Minimal stand-in for tigre.geometry when TIGRE is not installed.
+    """
+    pass
+
 def create_geometry(image_size=None, detector_size=None):
     """
     Create TIGRE geometry configuration for cone beam tomography.
@@ -11,7 +22,7 @@ def create_geometry(image_size=None, detector_size=None):
         detector_size (int, optional): Size of the detector (square)
         
     Returns:
-        tigre.geometry: Configured geometry object
+        tigre.geometry: Configured geometry object (Geometry if TIGRE is unavailable)
     """
     # Use config values if none provided
     if image_size is None:
@@ -19,7 +30,7 @@ def create_geometry(image_size=None, detector_size=None):
     if detector_size is None:
         detector_size = GEOMETRY_CONFIG['detector_size']
     
-    geo = tigre.geometry()
+    geo = tigre.geometry() if tigre is not None else Geometry()
     
     # Distances (in mm)
     geo.DSD = GEOMETRY_CONFIG['DSD']  # Distance Source Detector
@@ -48,6 +59,9 @@ def create_angles(num_angles=None):
     """
     Create projection angles for 360-degree rotation.
     
+    The angles are evenly spaced over [0, 2*pi); 2*pi itself would repeat
+    the first projection.
+    
     Args:
         num_angles (int, optional): Number of projection angles
         
@@ -58,4 +72,4 @@ def create_angles(num_angles=None):
         from config import VIDEO_CONFIG
         num_angles = VIDEO_CONFIG['num_frames']
     
-    return np.linspace(0, 2 * np.pi, num_angles) 
\ No newline at end of file
+    return np.linspace(0, 2 * np.pi, num_angles, endpoint=False) 
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Precomputed geometry tables, persisted under a hash of the geometry.
+
+The detector coordinates, FDK cosine weights, ramp filter responses and
+circular detector mask depend only on the rig geometry, which rarely
+changes.
+GeometryTables builds each table once and, when the pipeline hands it a
+stage cache, stores it there under a hash of the geometry, so later runs
+memory-map it instead of rebuilding it, and parallel workers share one
+read-only copy through the page cache. Without a cache (e.g. fdk_cpu called
+directly) the tables are built once per process and nothing is written.
+Only the most recently used geometries keep their tables in memory.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+from stage_cache import input_key
+
+# Geometry attributes the tables depend on
+GEOMETRY_FIELDS = ('DSD', 'DSO', 'nVoxel', 'dVoxel', 'offOrigin', 'nDetector', 'dDetector', 'offDetector')
+
+def circular_mask(h, w):
+    """
+    Boolean detector mask that is True inside the largest centred circle.
+
+    Args:
+        h (int): Detector rows
+        w (int): Detector columns
+
+    Returns:
+        numpy.ndarray: (h, w) boolean mask
+    """
+    center_x, center_y = w // 2, h // 2
+    radius = min(center_x, center_y)
+
+    y, x = np.ogrid[:h, :w]
+    dist_from_center = np.sqrt((x - center_x)**2 + (y - center_y)**2)
+    return dist_from_center <= radius
+
+def _geometry_fields(geo):
+    """
+    The geometry attributes the tables depend on, as a hashable tuple.
+    """
+    return tuple(tuple(np.ravel(getattr(geo, field)).tolist()) for field in GEOMETRY_FIELDS)
+
+def geometry_key(geo):
+    """
+    Hash of the geometry attributes the tables depend on.
+    """
+    return input_key(dict(zip(GEOMETRY_FIELDS, _geometry_fields(geo))))
+
+class GeometryTables:
+    """
+    Lazily built, cached tables for one geometry.
+
+    Each table is looked up in memory, then in the stage cache ('geometry'
+    entries, memory-mapped read-only), and only built on a miss.
+    """
+    def __init__(self, geo, cache=None):
+        """
+        Args:
+            geo: Geometry from geometry_config.create_geometry
+            cache (StageCache, optional): Where tables are persisted
+        """
+        self.geo = geo
+        self.key = geometry_key(geo)
+        self.cache = cache
+        self._tables = {}
+        # Reentrant: building the ramp filter looks up the detector coordinates
+        self._lock = threading.RLock()
+
+    def _table(self, name, build, *inputs, persist=True):
+        # Tables are looked up on every filtering call, so the in-memory key is
+        # a plain tuple and the content hash is only computed on a miss
+        memory_key = (name,) + inputs
+        table = self._tables.get(memory_key)
+        if table is not None:
+            return table
+        with self._lock:
+            table = self._tables.get(memory_key)
+            if table is None and persist and self.cache is not None:
+                key = input_key(self.key, name, *inputs)
+                table = self.cache.load('geometry', key)
+                if table is None:
+                    self.cache.store('geometry', key, build())
+                    table = self.cache.load('geometry', key)
+            if table is None:
+                table = build()
+                table.flags.writeable = False
+            self._tables[memory_key] = table
+        return table
+
+    def detector_coordinates(self):
+        """
+        (v, u) detector coordinates at the isocenter, as fdk_cpu.detector_coordinates.
+        """
+        import fdk_cpu
+        # Two short vectors: cheaper to rebuild once per process than to read from disk
+        return (self._table('detector_rows', lambda: fdk_cpu.detector_coordinates(self.geo)[0], persist=False),
+                self._table('detector_columns', lambda: fdk_cpu.detector_coordinates(self.geo)[1], persist=False))
+
+    def cosine_weights(self):
+        """
+        (nV, nU) FDK cosine pre-weighting.
+        """
+        import fdk_cpu
+        return self._table('cosine_weights', lambda: fdk_cpu.cosine_weights(self.geo))
+
+    def ramp_filter(self, filter_type):
+        """
+        Frequency response of the windowed ramp filter for the detector rows.
+        """
+        import fdk_cpu
+
+        def build():
+            _, u = self.detector_coordinates()
+            num_cols = int(self.geo.nDetector[1])
+            spacing = float(u[1] - u[0]) if num_cols > 1 else float(self.geo.dDetector[1] * self.geo.DSO / self.geo.DSD)
+            return fdk_cpu.ramp_filter(filter_type, num_cols, spacing)
+        return self._table('ramp_filter', build, filter_type)
+
+    def circular_mask(self):
+        """
+        (nV, nU) boolean detector mask, True inside the largest centred circle.
+        """
+        return self._table('circular_mask',
+                           lambda: circular_mask(int(self.geo.nDetector[0]), int(self.geo.nDetector[1])))
+
+# Geometries whose tables stay in memory, least recently used first
+MAX_GEOMETRIES = 4
+
+_tables = OrderedDict()
+_tables_lock = threading.Lock()
+
+def tables_for(geo, cache=None):
+    """
+    Shared GeometryTables for a geometry.
+
+    Tables are only persisted once a caller passes a cache; later calls for
+    the same geometry (e.g. from fdk_cpu) share it. Tables built before the
+    cache was attached stay in memory only. Beyond MAX_GEOMETRIES, the
+    least recently used geometry's tables are dropped.
+
+    Args:
+        geo: Geometry from geometry_config.create_geometry
+        cache (StageCache, optional): Stage cache to persist the tables in
+
+    Returns:
+        GeometryTables
+    """
+    key = _geometry_fields(geo)
+    with _tables_lock:
+        tables = _tables.get(key)
+        if tables is None:
+            tables = _tables[key] = GeometryTables(geo)
+            while len(_tables) > MAX_GEOMETRIES:
+                _tables.popitem(last=False)
+        else:
+            _tables.move_to_end(key)
+    if cache is not None:
+        tables.cache = cache
+    return tables
+
+def clear_tables():
+    """
+    Forget the shared tables, e.g. when the stage cache settings change.
+    """
+    with _tables_lock:
+        _tables.clear()
@@ -0,0 +1,289 @@
+"""
+Lightweight per-stage instrumentation for the reconstruction pipeline.
+
+Stages are marked with the stage() context manager or the instrumented()
+decorator. While a Recorder is active each stage records wall time, process
+CPU time, peak resident memory and bytes read/written, and stage listeners
+are told when stages start and end; with neither active both reduce to a
+single global check.
+"""
+import cProfile
+import collections
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_recorder = None
+_listeners = []
+_local = threading.local()
+
+def _read_proc_status(field):
+    """
+    Value in bytes of a kB field in /proc/self/status, or None.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss():
+    """
+    Reset the kernel's resident-set high-water mark (Linux 4.0+).
+
+    Returns:
+        bool: True if the peak now covers only what follows
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss():
+    peak = _read_proc_status('VmHWM')
+    if peak is None and resource is not None:
+        # ru_maxrss is in kB on Linux, bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return peak
+
+def _io_counters():
+    """
+    (bytes read, bytes written) by this process so far, or (None, None).
+    """
+    try:
+        counters = {}
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key] = int(value)
+        return counters['rchar'], counters['wchar']
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+class Recorder:
+    """
+    Collects stage metrics for one run and writes them as metrics.json.
+    """
+    def __init__(self):
+        self.stages = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def stage(self, name):
+        stack = self._stack()
+        if stack:
+            # The reset below clears the parent's high-water mark so far; keep it
+            stack[-1]['peak'] = max(stack[-1]['peak'], _peak_rss() or 0)
+        frame = {'name': name, 'peak': 0}
+        stack.append(frame)
+        reset = _reset_peak_rss()
+        read_start, written_start = _io_counters()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            read_end, written_end = _io_counters()
+            peak = max(_peak_rss() or 0, frame['peak'])
+            stack.pop()
+            # Nested stages reset the high-water mark, so hand the peak up
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            record = {
+                'stage': name,
+                'depth': len(stack),
+                'parent': stack[-1].get('name') if stack else None,
+                'wall_seconds': round(wall, 6),
+                'cpu_seconds': round(cpu, 6),
+                'peak_rss_bytes': peak or None,
+                'peak_rss_is_stage_local': reset,
+                'bytes_read': None if read_start is None else read_end - read_start,
+                'bytes_written': None if written_start is None else written_end - written_start,
+            }
+            with self.lock:
+                self.stages.append(record)
+
+    def summary(self):
+        return {
+            'total_wall_seconds': round(time.perf_counter() - self.started, 6),
+            'peak_rss_bytes': _peak_rss(),
+            'stages': list(self.stages),
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+class SamplingProfiler:
+    """
+    Periodically samples the stack of one thread and counts collapsed stacks.
+
+    The output (one 'frame;frame;frame count' line per stack) can be fed to
+    flamegraph tools.
+    """
+    def __init__(self, interval=0.01, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.counts = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+def add_stage_listener(callback):
+    """
+    Call callback(event, name, depth) with event 'start' or 'end' around every stage.
+
+    Listeners work with or without an active recorder, e.g. to report
+    progress from a worker process.
+    """
+    _listeners.append(callback)
+
+def remove_stage_listener(callback):
+    _listeners.remove(callback)
+
+@contextmanager
+def _observed(recorder, name):
+    depth = getattr(_local, 'depth', 0)
+    for callback in _listeners:
+        callback('start', name, depth)
+    _local.depth = depth + 1
+    try:
+        if recorder is None:
+            yield
+        else:
+            with recorder.stage(name):
+                yield
+    finally:
+        _local.depth = depth
+        for callback in _listeners:
+            callback('end', name, depth)
+
+@contextmanager
+def stage(name):
+    """
+    Record a pipeline stage when a recorder or listener is active; otherwise do nothing.
+    """
+    recorder = _recorder
+    if recorder is None and not _listeners:
+        yield
+        return
+    with _observed(recorder, name):
+        yield
+
+def instrumented(name=None):
+    """
+    Decorator recording each call of the function as a stage.
+
+    Args:
+        name (str, optional): Stage name (default: the function name)
+    """
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None and not _listeners:
+                return func(*args, **kwargs)
+            with _observed(recorder, stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+@contextmanager
+def recording(output_dir, enabled=True, profiler=None, sample_interval=0.01):
+    """
+    Activate instrumentation for one run and write the results to output_dir.
+
+    Writes metrics.json when enabled, plus profile.prof (profiler='cprofile')
+    or profile_samples.txt (profiler='sampling').
+
+    Args:
+        output_dir (Path): Run folder next to config.txt
+        enabled (bool): Record stage metrics
+        profiler (str, optional): None, 'cprofile' or 'sampling'
+        sample_interval (float): Seconds between samples for the sampling profiler
+
+    Yields:
+        Recorder or None
+    """
+    global _recorder
+    if profiler not in (None, 'cprofile', 'sampling'):
+        raise ValueError(f"Unknown profiler: {profiler}. Use 'cprofile' or 'sampling'")
+    if not enabled and profiler is None:
+        yield None
+        return
+
+    output_dir = Path(output_dir)
+    recorder = Recorder() if enabled else None
+    previous = _recorder
+    if recorder is not None:
+        _recorder = recorder
+
+    profile = None
+    sampler = None
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+    elif profiler == 'sampling':
+        sampler = SamplingProfiler(interval=sample_interval)
+        sampler.start()
+
+    try:
+        yield recorder
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(str(output_dir / "profile.prof"))
+        if sampler is not None:
+            sampler.stop()
+            sampler.write(output_dir / "profile_samples.txt")
+        _recorder = previous
+        if recorder is not None:
+            recorder.write(output_dir / "metrics.json")
@@ -0,0 +1,292 @@
+"""
+Ordered-subset SART reconstruction on the CPU for sparse-angle captures.
+
+Uses a matched voxel-driven projector pair: the forward projection splats
+each voxel into its four nearest detector pixels with bilinear weights and
+the backprojection gathers with the same weights, so A and A^T are exact
+transposes. Geometry and detector conventions follow fdk_cpu.
+"""
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from fdk_cpu import _axis_coordinates, detector_coordinates
+
+def supersampling_factor(geo):
+    """
+    Sub-voxels per axis needed for a voxel's footprint to stay within the
+    bilinear splat (about one detector pixel), avoiding aliasing when voxels
+    are larger than the detector pixels they project onto.
+    """
+    pixel = min(geo.dDetector) * geo.DSO / geo.DSD
+    radius = np.linalg.norm(np.asarray(geo.sVoxel[1:], dtype=float)) / 2.0
+    max_magnification = geo.DSO / max(geo.DSO - radius, 1e-6)
+    return max(1, int(np.ceil(max(geo.dVoxel) * max_magnification / pixel)))
+
+def _sub_voxel_offsets(geo, factor):
+    """
+    (dz, dy, dx) offsets of the sub-voxel centres within a voxel.
+    """
+    fractions = (np.arange(factor) + 0.5) / factor - 0.5
+    return [(fz * geo.dVoxel[0], fy * geo.dVoxel[1], fx * geo.dVoxel[2])
+            for fz in fractions for fy in fractions for fx in fractions]
+
+def _slab_footprints(geo, z_start, z_stop, offset=(0.0, 0.0, 0.0)):
+    """
+    Voxel (or sub-voxel) centres of a slab, shared by every angle.
+    """
+    nz, ny, nx = (int(n) for n in geo.nVoxel)
+    off_z, off_y, off_x = np.asarray(geo.offOrigin, dtype=float) + np.asarray(offset)
+    z = _axis_coordinates(nz, geo.dVoxel[0], off_z)[z_start:z_stop]
+    y = _axis_coordinates(ny, geo.dVoxel[1], off_y)
+    x = _axis_coordinates(nx, geo.dVoxel[2], off_x)
+    xx, yy = np.meshgrid(x, y)
+    return z, xx, yy
+
+def _angle_weights(geo, angle, z, xx, yy):
+    """
+    Bilinear detector footprint of every voxel in a slab at one angle.
+
+    Returns:
+        tuple: (base flat index, fu, fv, valid mask, line-integral scale)
+    """
+    num_rows, num_cols = (int(n) for n in geo.nDetector)
+    v_det, u_det = detector_coordinates(geo)
+    du = u_det[1] - u_det[0] if num_cols > 1 else geo.dDetector[1] * geo.DSO / geo.DSD
+    dv = v_det[1] - v_det[0] if num_rows > 1 else geo.dDetector[0] * geo.DSO / geo.DSD
+
+    cos_a, sin_a = np.cos(angle), np.sin(angle)
+    s = xx * cos_a + yy * sin_a
+    t = -xx * sin_a + yy * cos_a
+    magnification = (geo.DSO / (geo.DSO - s)).astype(np.float32)
+
+    u_idx = (t * magnification - u_det[0]) / du
+    u0 = np.floor(u_idx).astype(np.int32)
+    fu = (u_idx - u0).astype(np.float32)
+    v_idx = (z[:, np.newaxis, np.newaxis] * magnification - v_det[0]) / dv
+    v0 = np.floor(v_idx).astype(np.int32)
+    fv = (v_idx - v0).astype(np.float32)
+
+    valid = (u0 >= 0) & (u0 < num_cols - 1) & (v0 >= 0) & (v0 < num_rows - 1)
+    base = np.where(valid, v0 * num_cols + u0, 0)
+
+    # Voxel volume over the pixel's ray-bundle cross-section at the voxel's depth
+    voxel_volume = float(np.prod(geo.dVoxel))
+    scale = (voxel_volume / (du * dv)) * magnification**2
+    return base, fu, fv, valid, scale
+
+def _forward_slab(volume, geo, angles, z_start, z_stop, offsets):
+    num_rows, num_cols = (int(n) for n in geo.nDetector)
+    slab = volume[z_start:z_stop] / len(offsets)
+    out = np.zeros((len(angles), num_rows * num_cols), dtype=np.float64)
+
+    for offset in offsets:
+        z, xx, yy = _slab_footprints(geo, z_start, z_stop, offset)
+        for a, angle in enumerate(angles):
+            base, fu, fv, valid, scale = _angle_weights(geo, angle, z, xx, yy)
+            contribution = np.where(valid, slab * scale, 0).ravel()
+            # fu depends only on (y, x); fv and base also vary along z
+            fu = np.broadcast_to(fu, slab.shape).ravel()
+            fv, base = fv.ravel(), base.ravel()
+            index = np.concatenate([base, base + 1, base + num_cols, base + num_cols + 1])
+            weights = np.concatenate([
+                contribution * (1 - fu) * (1 - fv),
+                contribution * fu * (1 - fv),
+                contribution * (1 - fu) * fv,
+                contribution * fu * fv,
+            ])
+            out[a] += np.bincount(index, weights=weights, minlength=num_rows * num_cols)
+    return out.reshape(len(angles), num_rows, num_cols)
+
+def _back_slab(projections, geo, angles, z_start, z_stop, offsets):
+    num_rows, num_cols = (int(n) for n in geo.nDetector)
+    slab = None
+
+    for offset in offsets:
+        z, xx, yy = _slab_footprints(geo, z_start, z_stop, offset)
+        if slab is None:
+            slab = np.zeros((z_stop - z_start,) + xx.shape, dtype=np.float32)
+        for a, angle in enumerate(angles):
+            base, fu, fv, valid, scale = _angle_weights(geo, angle, z, xx, yy)
+            proj = projections[a].reshape(num_rows * num_cols)
+            top = proj[base] * (1 - fu) + proj[base + 1] * fu
+            bottom = proj[base + num_cols] * (1 - fu) + proj[base + num_cols + 1] * fu
+            sample = top * (1 - fv) + bottom * fv
+            sample[~valid] = 0
+            slab += sample * scale
+    slab /= len(offsets)
+    return slab
+
+def _slab_bounds(nz, num_workers):
+    num_slabs = max(1, min(nz, num_workers * 2))
+    bounds = np.linspace(0, nz, num_slabs + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def forward_project(volume, geo, angles, num_workers=None, supersampling=None):
+    """
+    Cone-beam forward projection (line integrals) of a volume.
+
+    Args:
+        volume (numpy.ndarray): (nz, ny, nx) volume
+        geo: Geometry from geometry_config.create_geometry
+        angles (numpy.ndarray): Projection angles in radians
+        num_workers (int, optional): Worker threads (default: all cores)
+        supersampling (int, optional): Sub-voxels per axis (default: supersampling_factor)
+
+    Returns:
+        numpy.ndarray: (num_angles, nV, nU) float32 projections
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    offsets = _sub_voxel_offsets(geo, supersampling or supersampling_factor(geo))
+    volume = np.asarray(volume, dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        partials = executor.map(lambda bounds: _forward_slab(volume, geo, angles, *bounds, offsets),
+                                _slab_bounds(int(geo.nVoxel[0]), num_workers))
+        return sum(partials).astype(np.float32)
+
+def back_project(projections, geo, angles, num_workers=None, supersampling=None):
+    """
+    Exact transpose of forward_project.
+
+    Args:
+        projections (numpy.ndarray): (num_angles, nV, nU) projections
+        geo: Geometry from geometry_config.create_geometry
+        angles (numpy.ndarray): Projection angles in radians
+        num_workers (int, optional): Worker threads (default: all cores)
+        supersampling (int, optional): Sub-voxels per axis (default: supersampling_factor)
+
+    Returns:
+        numpy.ndarray: (nz, ny, nx) float32 volume
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    offsets = _sub_voxel_offsets(geo, supersampling or supersampling_factor(geo))
+    projections = np.asarray(projections, dtype=np.float32)
+    nz, ny, nx = (int(n) for n in geo.nVoxel)
+    volume = np.empty((nz, ny, nx), dtype=np.float32)
+
+    def run(bounds):
+        z_start, z_stop = bounds
+        volume[z_start:z_stop] = _back_slab(projections, geo, angles, z_start, z_stop, offsets)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(run, _slab_bounds(nz, num_workers)))
+    return volume
+
+def tv_gradient(volume, eps=1e-8):
+    """
+    Gradient of the isotropic total variation of a volume.
+    """
+    diffs = []
+    for axis in range(3):
+        d = np.diff(volume, axis=axis, append=np.take(volume, [-1], axis=axis))
+        diffs.append(d)
+    norm = np.sqrt(sum(d * d for d in diffs) + eps)
+    gradient = np.zeros_like(volume)
+    for axis, d in enumerate(diffs):
+        p = d / norm
+        # Negative divergence with backward differences
+        gradient -= np.diff(p, axis=axis, prepend=np.zeros_like(np.take(p, [0], axis=axis)))
+    return gradient
+
+def tv_minimize(volume, step, iterations):
+    """
+    Reduce total variation by normalized gradient descent, in place.
+
+    Args:
+        volume (numpy.ndarray): Volume to regularize
+        step (float): Total step length per descent iteration
+        iterations (int): Number of descent iterations
+
+    Returns:
+        numpy.ndarray: volume
+    """
+    for _ in range(iterations):
+        gradient = tv_gradient(volume)
+        norm = np.linalg.norm(gradient)
+        if norm == 0:
+            break
+        volume -= (step / norm) * gradient
+    return volume
+
+def ordered_subsets(num_angles, num_subsets):
+    """
+    Interleaved subsets so consecutive updates use widely spread angles.
+    """
+    num_subsets = max(1, min(num_subsets, num_angles))
+    return [np.arange(start, num_angles, num_subsets) for start in range(num_subsets)]
+
+def os_sart(projections, geo, angles, iterations=20, subsets=10, relaxation=1.0, tv_weight=0.0,
+            tv_iterations=10, x0=None, tolerance=1e-3, nonnegative=True, num_workers=None, verbose=True):
+    """
+    Ordered-subset SART with optional TV regularization.
+
+    With subsets=1 this is SIRT. Each iteration runs one SART update per
+    subset; when tv_weight > 0 it is followed by TV descent steps scaled to
+    the size of the SART update (as in ASD-POCS). Iteration stops early
+    once the data residual improves by less than tolerance (relative).
+
+    Args:
+        projections (numpy.ndarray): (num_angles, nV, nU) projection data
+        geo: Geometry from geometry_config.create_geometry
+        angles (numpy.ndarray): Projection angles in radians
+        iterations (int): Maximum number of passes over all subsets
+        subsets (int): Number of ordered subsets
+        relaxation (float): SART relaxation factor
+        tv_weight (float): TV step as a fraction of the SART update norm (0 disables)
+        tv_iterations (int): TV descent steps per iteration
+        x0 (numpy.ndarray, optional): Initial volume, e.g. an FDK reconstruction
+        tolerance (float): Relative residual improvement below which to stop
+        nonnegative (bool): Clip negative attenuation after each update
+        num_workers (int, optional): Worker threads (default: all cores)
+        verbose (bool): Print the residual after each iteration
+
+    Returns:
+        numpy.ndarray: (nz, ny, nx) float32 volume
+    """
+    projections = np.asarray(projections, dtype=np.float32)
+    angles = np.asarray(angles, dtype=float)
+    nz, ny, nx = (int(n) for n in geo.nVoxel)
+    volume = np.zeros((nz, ny, nx), dtype=np.float32) if x0 is None else np.array(x0, dtype=np.float32)
+    if nonnegative:
+        np.maximum(volume, 0, out=volume)
+
+    subset_indices = ordered_subsets(len(angles), subsets)
+
+    # SART normalizations: ray lengths through the volume and per-subset voxel sensitivities
+    ones = np.ones((nz, ny, nx), dtype=np.float32)
+    row_sums = forward_project(ones, geo, angles, num_workers)
+    inverse_rows = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 1e-6)
+    inverse_columns = []
+    for indices in subset_indices:
+        column_sums = back_project(np.ones((len(indices),) + row_sums.shape[1:], dtype=np.float32),
+                                   geo, angles[indices], num_workers)
+        inverse_columns.append(np.divide(1.0, column_sums, out=np.zeros_like(column_sums),
+                                         where=column_sums > 1e-6))
+    del ones
+
+    data_norm = float(np.linalg.norm(projections)) or 1.0
+    previous_residual = None
+    for iteration in range(iterations):
+        before = volume.copy() if tv_weight > 0 else None
+        residual_sq = 0.0
+        for indices, inverse_column in zip(subset_indices, inverse_columns):
+            residual = projections[indices] - forward_project(volume, geo, angles[indices], num_workers)
+            residual_sq += float(np.sum(residual * residual))
+            residual *= inverse_rows[indices]
+            volume += relaxation * inverse_column * back_project(residual, geo, angles[indices], num_workers)
+            if nonnegative:
+                np.maximum(volume, 0, out=volume)
+
+        if tv_weight > 0:
+            update_norm = float(np.linalg.norm(volume - before))
+            tv_minimize(volume, tv_weight * update_norm / tv_iterations, tv_iterations)
+            if nonnegative:
+                np.maximum(volume, 0, out=volume)
+
+        relative_residual = np.sqrt(residual_sq) / data_norm
+        if verbose:
+            print(f"OS-SART iteration {iteration + 1}/{iterations}: relative residual {relative_residual:.5f}")
+        if previous_residual is not None and previous_residual - relative_residual < tolerance * previous_residual:
+            break
+        previous_residual = relative_residual
+
+    return volume
@@ -1,26 +1,237 @@
-import sys
-import os
-import os
-os.environ["PATH"] = r"C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v11.8\bin;C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v11.8\libnvvp;" + os.environ.get("PATH", "")
-# Prune the path to avoid using the TIGRE version from the wrong project.
-# This is a temporary fix; the root cause is likely a PYTHONPATH issue
-# or an editable install pointing to the wrong location.
-sys.path = [p for p in sys.path if os.path.join('Summerproj', 'TIGRE', 'Python') not in p]
-import matplotlib
-matplotlib.use('TkAgg')
+"""
+Video cropper GUI: draw the ROI, preview it, and queue full reconstructions.
+
+Reconstructions are submitted to the worker spool (see worker.py) and run
+by worker.run_job, like jobs from `worker.py submit`.
+Only what the window needs is imported at startup. The reconstruction
+stack is imported in the background while the user draws the ROI: the
+preview's on a thread, and the full pipeline's in a worker process that is
+started ahead of the next job. `python main.py --import-times` reports the
+import cost of each module.
+"""
+import argparse
 import os
 import datetime
+import multiprocessing
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
 from pathlib import Path
-from video_processor import VideoProcessor
-from geometry_config import create_geometry, create_angles
-from reconstruction import reconstruct_volume
-import numpy as np
-from numpy2ometiff import write_ome_tiff
+from run_folders import run_folder_name
+from config import RECONSTRUCTION_CONFIG
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 import cv2
 from PIL import Image, ImageTk
-from config import VIDEO_CONFIG, PHYSICAL_CONFIG, GEOMETRY_CONFIG, RECONSTRUCTION_CONFIG, VISUALIZATION_CONFIG
+
+CANVAS_WIDTH, CANVAS_HEIGHT = 800, 600
+
+# One queued reconstruction
+Job = namedtuple('Job', 'number video_path output_dir crop_rect')
+
+# Modules reported by --import-times: those the window opens with, then the
+# stacks imported in the background
+STARTUP_MODULES = ('tkinter', 'PIL.ImageTk', 'cv2', 'config', 'run_folders', 'main')
+BACKGROUND_MODULES = ('numpy', 'matplotlib.pyplot', 'skimage.measure', 'tifffile', 'tigre',
+                      'fdk_cpu', 'video_processor', 'preview', 'reconstruction', 'volume_export', 'pipeline', 'worker')
+
+def pipeline_steps():
+    """
+    Top-level stages of process_video, in order, used for the progress bar.
+    """
+    if RECONSTRUCTION_CONFIG.get('streaming', False):
+        return ['stream_video', 'export_volume']
+    # The circular mask is applied while extracting the projections
+    return ['extract_projection_frames', 'reconstruct_volume', 'export_volume']
+
+def reconstruction_process(assignments, events):
+    """
+    Worker process: warm up like worker.py, then run the one job it is given.
+
+    Started before its job arrives, so the imports are done by the time the
+    user has drawn the ROI.
+
+    Args:
+        assignments (multiprocessing.Queue): (job record, log path), or None to exit
+        events (multiprocessing.Queue): ('stage', event, name, depth) for every
+            stage, then ('finished', result of worker.run_job)
+    """
+    import signal
+    import traceback
+    import worker
+    from instrumentation import add_stage_listener
+
+    def stop(signum, frame):
+        # Unwind on cancel, so pools the job started (e.g. for meshing) are shut down
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        raise SystemExit(128 + signum)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        worker.warm_up()
+    except Exception:
+        # The job reports the error
+        traceback.print_exc()
+    assignment = assignments.get()
+    if assignment is not None:
+        add_stage_listener(lambda event, name, depth: events.put(('stage', event, name, depth)))
+        events.put(('finished', worker.run_job(*assignment)))
+
+class ProcessingQueue:
+    """
+    Runs queued videos one at a time, each in its own worker process.
+
+    Jobs go through the worker spool: submit() queues them with
+    worker.submit, so `worker.py status` lists them, and each is claimed and
+    run with worker.run_job in a separate process, which keeps the GUI
+    responsive (no shared GIL) and makes cancelling immediate. The process is
+    not daemonic, so the job can start process pools of its own; cancel()
+    and close() stop it and wait for it to exit. A job already claimed by a
+    running `worker.py serve` is followed in the spool instead.
+    The process for the next job is started while the GUI is idle, so it has
+    imported the pipeline when the job arrives.
+    Progress arrives on the messages queue as ('start', job),
+    ('stage', job, event, name, depth), ('done', job, output_dir),
+    ('error', job, message) or ('cancelled', job).
+    """
+    def __init__(self, spool_dir=None):
+        """
+        Args:
+            spool_dir (str or Path, optional): Job spool (default: WORKER_CONFIG['spool_dir'])
+        """
+        self.spool_dir = spool_dir
+        # Spawn: forking a process that runs Tk and worker threads is unsafe
+        self.context = multiprocessing.get_context('spawn')
+        self.jobs = queue.Queue()
+        self.messages = queue.Queue()
+        self.process = None
+        self.standby = None
+        self.cancelled = threading.Event()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _start_process(self):
+        """
+        Start a worker process that imports the pipeline and waits for its job.
+
+        Returns:
+            tuple: (process, assignments queue, events queue)
+        """
+        assignments, events = self.context.Queue(), self.context.Queue()
+        # Not daemonic: daemonic processes cannot start the job's process pools
+        process = self.context.Process(target=reconstruction_process, args=(assignments, events))
+        process.start()
+        return process, assignments, events
+
+    def submit(self, job, overrides=None):
+        """
+        Queue a job in the spool.
+
+        Args:
+            job (Job): Video, run folder and crop rectangle
+            overrides (dict, optional): Config values for this job, as for worker.submit
+
+        Raises:
+            worker.QueueFull: When the spool already holds max_queued jobs
+        """
+        import worker
+        job_id = worker.submit(job.video_path, job.crop_rect, overrides, output_dir=job.output_dir,
+                               spool_dir=self.spool_dir)
+        self.jobs.put((job, job_id))
+
+    def cancel(self):
+        """
+        Stop the running job; queued jobs continue.
+        """
+        self.cancelled.set()
+
+    def close(self, timeout=10):
+        """
+        Stop the running job and the standby process; queued jobs stay in the spool.
+        """
+        self.closed.set()
+        self.jobs.put(None)
+        self.cancel()
+        self.thread.join(timeout)
+
+    def _stop_standby(self):
+        if self.standby is None:
+            return
+        process, assignments, _ = self.standby
+        self.standby = None
+        assignments.put(None)
+        # It may still be importing the pipeline
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    def _run(self):
+        import worker
+        self.standby = self._start_process()
+        while True:
+            item = self.jobs.get()
+            if item is None or self.closed.is_set():
+                self._stop_standby()
+                return
+            job, job_id = item
+            self.cancelled.clear()
+            record = worker.claim_job(job_id, self.spool_dir)
+            self.messages.put(('start', job))
+            if record is None:
+                # A running `worker.py serve` took the job; follow it in the spool
+                record = next(worker.wait([job_id], self.spool_dir))
+                if record['state'] == 'done':
+                    self.messages.put(('done', job, record['output_dir']))
+                else:
+                    self.messages.put(('error', job, record['error']))
+                continue
+            self.process, assignments, events = self.standby
+            self.standby = None
+            start = time.perf_counter()
+            assignments.put((record, str(worker.job_log(job_id, self.spool_dir))))
+
+            result = None
+            terminated = False
+            while result is None:
+                if self.cancelled.is_set() and not terminated:
+                    self.process.terminate()
+                    terminated = True
+                try:
+                    event = events.get(timeout=0.2)
+                except queue.Empty:
+                    if self.process.is_alive():
+                        continue
+                    # The final event can still be in the pipe after the process exits
+                    try:
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        if self.cancelled.is_set():
+                            error = "cancelled"
+                        else:
+                            error = f"worker exited with code {self.process.exitcode}"
+                        result = {'output_dir': record['output_dir'], 'timings': {}, 'error': error,
+                                  'seconds': round(time.perf_counter() - start, 3)}
+                        continue
+                if event[0] == 'stage':
+                    self.messages.put(('stage', job) + tuple(event[1:]))
+                else:
+                    result = event[1]
+            self.process.join()
+            self.process = None
+            worker.finish_job(record, result, self.spool_dir)
+            if result['error'] is None:
+                self.messages.put(('done', job, result['output_dir']))
+            elif self.cancelled.is_set():
+                self.messages.put(('cancelled', job))
+            else:
+                self.messages.put(('error', job, result['error']))
+            # Warm up the process for the next job
+            if not self.closed.is_set():
+                self.standby = self._start_process()
 
 class VideoCropper:
     def __init__(self, root):
@@ -29,7 +240,6 @@ class VideoCropper:
         
         # Initialize variables
         self.video_path = None
-        self.cap = None
         self.current_frame = None
         self.line_start = None
         self.line_end = None
@@ -37,131 +247,259 @@ class VideoCropper:
         self.scale = 1.0  # Store the scale factor
         self.x_offset = 0
         self.y_offset = 0
-        self.cropped_path = None
-        self.output_dir = None
+        self.photo = None
+        self.job_count = 0
+        self.steps = []
+        self.finished_steps = set()
+        
+        # Low-resolution preview reconstructions run in the background; their
+        # reconstruction stack is imported on a thread so the window opens at once
+        self.preview = None
+        self.preview_photo = None
+        self.preview_loaded = queue.Queue()
+        threading.Thread(target=self.load_preview_worker, daemon=True).start()
+
+        # Full reconstructions run in worker processes, one video at a time
+        self.processing = ProcessingQueue()
         
         # Create GUI elements
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(100, self.poll)
         
     def create_widgets(self):
         # Create buttons
-        self.load_btn = tk.Button(self.root, text="Load Video", command=self.load_video)
-        self.load_btn.pack(pady=5)
+        buttons = tk.Frame(self.root)
+        buttons.pack(pady=5)
+        self.load_btn = tk.Button(buttons, text="Load Video", command=self.load_video)
+        self.load_btn.pack(side='left', padx=5)
         
-        self.crop_btn = tk.Button(self.root, text="Crop and Process", command=self.crop_video)
-        self.crop_btn.pack(pady=5)
+        self.crop_btn = tk.Button(buttons, text="Crop and Process", command=self.crop_video)
+        self.crop_btn.pack(side='left', padx=5)
         self.crop_btn.config(state='disabled')
         
+        self.cancel_btn = tk.Button(buttons, text="Cancel", command=self.cancel_job)
+        self.cancel_btn.pack(side='left', padx=5)
+        self.cancel_btn.config(state='disabled')
+
         # Create canvas for video display
-        self.canvas = tk.Canvas(self.root, width=800, height=600)
+        self.canvas = tk.Canvas(self.root, width=CANVAS_WIDTH, height=CANVAS_HEIGHT)
         self.canvas.pack(pady=5)
+
+        # Frame image and ROI overlay are created once and only moved afterwards
+        self.image_item = self.canvas.create_image(CANVAS_WIDTH // 2, CANVAS_HEIGHT // 2)
+        self.shade_item = self.canvas.create_rectangle(0, 0, CANVAS_WIDTH, CANVAS_HEIGHT, fill="gray",
+                                                       stipple="gray50", outline="", state='hidden')
+        self.line_item = self.canvas.create_line(0, 0, 0, 0, fill="red", width=2, state='hidden')
+        self.square_item = self.canvas.create_rectangle(0, 0, 0, 0, fill="", outline="red", width=2,
+                                                        state='hidden')
         
         # Bind mouse events
         self.canvas.bind("<ButtonPress-1>", self.on_mouse_down)
         self.canvas.bind("<B1-Motion>", self.on_mouse_move)
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_up)
         
+        # Preview of the reconstruction for the current line (axial, coronal, sagittal)
+        self.preview_status = tk.Label(self.root, text="Load a video to preview the reconstruction")
+        self.preview_status.pack()
+        self.preview_label = tk.Label(self.root)
+        self.preview_label.pack(pady=5)
+        
+        # Progress of the running reconstruction and the queue of videos
+        self.job_status = tk.Label(self.root, text="No reconstruction running")
+        self.job_status.pack()
+        self.progress = ttk.Progressbar(self.root, length=CANVAS_WIDTH, mode='determinate')
+        self.progress.pack(pady=5)
+        self.job_list = tk.Listbox(self.root, height=5, width=100)
+        self.job_list.pack(pady=5)
+
+    def load_preview_worker(self):
+        """
+        Import the preview's reconstruction stack and start its worker; runs on a background thread.
+        """
+        try:
+            import matplotlib
+            matplotlib.use('Agg')  # The window never shows matplotlib figures
+            # pipeline first: it sets up the CUDA path before anything imports TIGRE
+            import pipeline
+            from preview import PreviewWorker
+            self.preview_loaded.put(PreviewWorker())
+        except Exception as e:
+            self.preview_loaded.put(e)
+
     def load_video(self):
-        self.video_path = filedialog.askopenfilename(
+        video_path = filedialog.askopenfilename(
             filetypes=[("MOV files", "*.mov"), ("All files", "*.*")]
         )
         
-        if self.video_path:
-            self.cap = cv2.VideoCapture(self.video_path)
-            ret, frame = self.cap.read()
+        if video_path:
+            cap = cv2.VideoCapture(video_path)
+            ret, frame = cap.read()
+            cap.release()
             if ret:
+                self.video_path = video_path
                 self.current_frame = frame
+                self.line_start = self.line_end = None
                 self.display_frame()
+                self.update_overlay()
                 self.crop_btn.config(state='normal')
+                if self.preview is not None:
+                    self.preview.load(self.video_path)
             else:
                 messagebox.showerror("Error", "Could not read video file")
                 
     def display_frame(self):
-        if self.current_frame is not None:
-            # Convert frame to RGB
-            frame_rgb = cv2.cvtColor(self.current_frame, cv2.COLOR_BGR2RGB)
-            
-            # Calculate scale to fit frame in canvas while maintaining aspect ratio
-            height, width = frame_rgb.shape[:2]
-            self.scale = min(800/width, 600/height)
-            new_width = int(width * self.scale)
-            new_height = int(height * self.scale)
-            
-            # Calculate offsets to center the frame
-            self.x_offset = (800 - new_width) // 2
-            self.y_offset = (600 - new_height) // 2
-            
-            # Resize frame
-            frame_resized = cv2.resize(frame_rgb, (new_width, new_height))
-            
-            # Convert to PhotoImage
-            self.photo = ImageTk.PhotoImage(image=Image.fromarray(frame_resized))
-            
-            # Update canvas
-            self.canvas.delete("all")
-            self.canvas.create_image(400, 300, image=self.photo)
+        """
+        Render the scaled first frame once per video.
+        """
+        # Convert frame to RGB
+        frame_rgb = cv2.cvtColor(self.current_frame, cv2.COLOR_BGR2RGB)
+        
+        # Calculate scale to fit frame in canvas while maintaining aspect ratio
+        height, width = frame_rgb.shape[:2]
+        self.scale = min(CANVAS_WIDTH / width, CANVAS_HEIGHT / height)
+        new_width = int(width * self.scale)
+        new_height = int(height * self.scale)
+        
+        # Calculate offsets to center the frame
+        self.x_offset = (CANVAS_WIDTH - new_width) // 2
+        self.y_offset = (CANVAS_HEIGHT - new_height) // 2
+        
+        # Resize frame
+        frame_resized = cv2.resize(frame_rgb, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        
+        # Convert to PhotoImage
+        self.photo = ImageTk.PhotoImage(image=Image.fromarray(frame_resized))
+        self.canvas.itemconfig(self.image_item, image=self.photo)
+        
+    def update_overlay(self):
+        """
+        Move the line and square preview to the current line.
+        """
+        if not (self.line_start and self.line_end):
+            for item in (self.shade_item, self.line_item, self.square_item):
+                self.canvas.itemconfig(item, state='hidden')
+            return
             
-            # Draw line if exists
-            if self.line_start and self.line_end:
-                # Draw the horizontal line
-                self.canvas.create_line(
-                    self.line_start[0], self.line_start[1],
-                    self.line_end[0], self.line_end[1],
-                    fill="red", width=2
-                )
-                
-                # Calculate square dimensions based on line length
-                line_length = abs(self.line_end[0] - self.line_start[0])
-                center_x = (self.line_start[0] + self.line_end[0]) // 2
-                center_y = self.line_start[1]
-                
-                # Draw the square preview
-                square_size = line_length
-                x1 = center_x - square_size // 2
-                y1 = center_y - square_size // 2
-                x2 = center_x + square_size // 2
-                y2 = center_y + square_size // 2
-                
-                # Draw semi-transparent overlay
-                self.canvas.create_rectangle(0, 0, 800, 600, fill="gray", stipple="gray50", outline="")
-                self.canvas.create_rectangle(
-                    x1, y1, x2, y2,
-                    fill="", outline="red", width=2
-                )
+        # Calculate square dimensions based on line length
+        line_length = abs(self.line_end[0] - self.line_start[0])
+        center_x = (self.line_start[0] + self.line_end[0]) // 2
+        center_y = self.line_start[1]
+        half = line_length // 2
+        
+        self.canvas.coords(self.line_item, self.line_start[0], self.line_start[1],
+                           self.line_end[0], self.line_end[1])
+        self.canvas.coords(self.square_item, center_x - half, center_y - half, center_x + half, center_y + half)
+        for item in (self.shade_item, self.line_item, self.square_item):
+            self.canvas.itemconfig(item, state='normal')
     
     def on_mouse_down(self, event):
+        if self.current_frame is None:
+            return
         self.is_drawing = True
         self.line_start = (event.x, event.y)
         self.line_end = (event.x, event.y)
+        self.update_overlay()
         
     def on_mouse_move(self, event):
         if self.is_drawing:
             # Only update x coordinate to keep line horizontal
             self.line_end = (event.x, self.line_start[1])
-            self.display_frame()
+            self.update_overlay()
             
     def on_mouse_up(self, event):
-        self.is_drawing = False
-        self.display_frame()
-        
-    def crop_video(self):
-        if not self.video_path or not self.line_start or not self.line_end:
-            messagebox.showerror("Error", "Please load a video and draw a horizontal line")
+        if not self.is_drawing:
             return
+        self.is_drawing = False
+        crop_rect = self.selected_crop_rect()
+        if crop_rect is not None and self.preview is not None:
+            self.preview.request(crop_rect)
             
-        # Create timestamped output directory
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_name = os.path.splitext(os.path.basename(self.video_path))[0]
-        filter_type = RECONSTRUCTION_CONFIG['filter_type']
-        threshold = RECONSTRUCTION_CONFIG['stl_threshold']
-        mask_status = "maskTrue" if RECONSTRUCTION_CONFIG.get('apply_circular_mask', False) else "maskFalse"
+    def poll(self):
+        """
+        Apply messages from the preview and processing workers; runs on the Tk thread.
+        """
+        self.poll_preview()
+        self.poll_processing()
+        self.root.after(100, self.poll)
         
-        # Create the new directory structure
-        self.output_dir = Path("final_config") / f"{base_name}_{filter_type}_{threshold}_{mask_status}_{timestamp}"
-        os.makedirs(self.output_dir, exist_ok=True)
+    def poll_preview(self):
+        if self.preview is None:
+            try:
+                loaded = self.preview_loaded.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(loaded, Exception):
+                self.preview_status.config(text=f"Preview unavailable: {type(loaded).__name__}: {loaded}")
+                return
+            # Catch up with what the user did while the preview was loading
+            self.preview = loaded
+            if self.video_path:
+                self.preview.load(self.video_path)
+                crop_rect = self.selected_crop_rect()
+                if crop_rect is not None:
+                    self.preview.request(crop_rect)
+        while not self.preview.results.empty():
+            message = self.preview.results.get()
+            if message[0] == 'preview':
+                _, crop_rect, slices = message
+                # Ignore results for a line that has since been redrawn
+                if crop_rect == self.selected_crop_rect():
+                    slices = cv2.resize(slices, None, fx=2, fy=2, interpolation=cv2.INTER_NEAREST)
+                    self.preview_photo = ImageTk.PhotoImage(image=Image.fromarray(slices))
+                    self.preview_label.config(image=self.preview_photo)
+                    self.preview_status.config(text="Preview (axial, coronal, sagittal)")
+            elif message[0] == 'error':
+                self.preview_status.config(text=f"Preview failed: {message[1]}")
+            else:
+                self.preview_status.config(text=message[1])
+        
+    def poll_processing(self):
+        while not self.processing.messages.empty():
+            kind, job, *details = self.processing.messages.get()
+            name = Path(job.video_path).name
+            if kind == 'start':
+                self.steps = pipeline_steps()
+                self.finished_steps = set()
+                self.progress['value'] = 0
+                self.cancel_btn.config(state='normal')
+                self.job_status.config(text=f"Processing {name}...")
+                self.set_job_state(job, "running")
+            elif kind == 'stage':
+                event, stage_name, depth = details
+                if event == 'start':
+                    self.job_status.config(text=f"Processing {name}: {stage_name}")
+                elif depth == 1 and stage_name in self.steps:
+                    self.finished_steps.add(stage_name)
+                    # Steps skipped by the stage cache count as finished
+                    done = max(self.steps.index(step) for step in self.finished_steps) + 1
+                    self.progress['value'] = 100 * done / len(self.steps)
+            else:
+                self.cancel_btn.config(state='disabled')
+                if kind == 'done':
+                    self.progress['value'] = 100
+                    self.job_status.config(text=f"Finished {name}: results in {details[0]}")
+                    self.set_job_state(job, "done")
+                elif kind == 'cancelled':
+                    self.job_status.config(text=f"Cancelled {name}")
+                    self.set_job_state(job, "cancelled")
+                else:
+                    self.job_status.config(text=f"Failed {name}: {details[0]}")
+                    self.set_job_state(job, f"failed: {details[0]}")
+        
+    def set_job_state(self, job, state):
+        self.job_list.delete(job.number)
+        self.job_list.insert(job.number, f"{Path(job.video_path).name} -> {job.output_dir} [{state}]")
         
-        # Get output filename
-        output_path = self.output_dir / f"{base_name}_cropped.mp4"
+    def selected_crop_rect(self):
+        """
+        Square crop region in source video pixels for the drawn line, or None.
+        
+        Returns:
+            tuple: (x1, y1, x2, y2) clamped to the frame
+        """
+        if self.current_frame is None or not self.line_start or not self.line_end:
+            return None
         
         # Calculate square dimensions based on line length
         line_length = abs(self.line_end[0] - self.line_start[0])
@@ -179,143 +517,101 @@ class VideoCropper:
         x2 = x1 + square_size
         y2 = y1 + square_size
         
-        # Create video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(str(output_path), fourcc, self.cap.get(cv2.CAP_PROP_FPS), (square_size, square_size))
-        
-        # Reset video capture
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        # Keep the square inside the frame
+        height, width = self.current_frame.shape[:2]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+        return (x1, y1, x2, y2)
         
-        # Process video
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                break
-                
-            # Crop frame to square
-            cropped_frame = frame[y1:y2, x1:x2]
-            out.write(cropped_frame)
+    def crop_video(self):
+        crop_rect = self.selected_crop_rect()
+        if not self.video_path or crop_rect is None:
+            messagebox.showerror("Error", "Please load a video and draw a horizontal line")
+            return
             
-        # Release resources
-        out.release()
-        self.cropped_path = str(output_path)
+        # Create timestamped output directory
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        # Create the new directory structure
+        output_dir = Path("final_config") / run_folder_name(self.video_path, timestamp)
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # The crop is applied frame by frame during projection extraction,
+        # so the source video is decoded only once
+        job = Job(self.job_count, self.video_path, output_dir, crop_rect)
+        import worker
+        try:
+            self.processing.submit(job)
+        except worker.QueueFull as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.job_count += 1
+        self.job_list.insert(tk.END, "")
+        self.set_job_state(job, "queued")
         
-        # Close the cropping window
+    def cancel_job(self):
+        self.processing.cancel()
+
+    def on_close(self):
+        if self.processing.process is not None or not self.processing.jobs.empty():
+            if not messagebox.askokcancel("Quit", "Reconstructions are still running or queued. Queued jobs stay in "
+                                          "the worker spool for `python worker.py serve`. Quit anyway?"):
+                return
+        self.processing.close()
+        if self.preview is not None:
+            self.preview.close()
         self.root.destroy()
 
-def process_video(video_path, output_dir):
+def measure_import_times(modules):
     """
-    Process the cropped video and perform reconstruction.
+    Import time of each module on its own, in a fresh interpreter (python -X importtime).
+
+    Args:
+        modules (list): Module names
+
+    Returns:
+        dict: Module name to seconds, including its dependencies, or None if it cannot be imported
     """
-    # Save configuration and video info
-    config_info = {
-        'Video Information': {
-            'Original Video': str(video_path),
-            'Cropped Video': str(Path(video_path).name),
-            'Processing Date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        },
-        'Reconstruction Parameters': RECONSTRUCTION_CONFIG,
-        'Geometry Parameters': GEOMETRY_CONFIG,
-        'Video Processing Parameters': VIDEO_CONFIG,
-        'Physical Parameters': PHYSICAL_CONFIG,
-        'Visualization Parameters': VISUALIZATION_CONFIG
-    }
-    
-    # Save config to text file
-    config_path = output_dir / 'config.txt'
-    with open(config_path, 'w') as f:
-        for section, params in config_info.items():
-            f.write(f"\n{section}\n")
-            f.write("=" * len(section) + "\n")
-            for key, value in params.items():
-                f.write(f"{key}: {value}\n")
-    
-    # Processing parameters
-    image_size = GEOMETRY_CONFIG['image_size']
-    detector_size = GEOMETRY_CONFIG['detector_size']
-    
-    # Channel configuration
-    channel_names = ['shadow']
+    times = {}
+    for module in modules:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        times[module] = None
+        if result.returncode != 0:
+            continue
+        times[module] = 0.0  # Already imported by the interpreter itself
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split('|')
+            if line.startswith('import time:') and len(fields) == 3 and fields[2].strip() == module:
+                times[module] = int(fields[1]) / 1e6
+    return times
     
-    # Process video and extract projections
-    print("Processing video and extracting projections...")
-    with VideoProcessor(video_path, target_size=VIDEO_CONFIG['target_size']) as processor:
-        projections = processor.extract_projection_frames(
-            num_frames=VIDEO_CONFIG['num_frames'], 
-            output_dir=output_dir
-        )
-    
-    # Apply a circular mask to the projections to remove artifacts from the corners
-    if RECONSTRUCTION_CONFIG['apply_circular_mask']:
-        print("Applying circular mask to projections...")
-        detector_rows, detector_cols = projections.shape[1], projections.shape[2]
-        center_y, center_x = detector_rows // 2, detector_cols // 2
-        radius = min(center_x, center_y)
-        
-        y, x = np.ogrid[:detector_rows, :detector_cols]
-        mask = (x - center_x)**2 + (y - center_y)**2 > radius**2
-        
-        # The background should correspond to 0 attenuation.
-        # We set the area outside the circle to 0.
-        projections[:, mask] = 0
-    
-    # Create geometry and angles for reconstruction
-    print("Setting up reconstruction geometry...")
-    geo = create_geometry(image_size=image_size, detector_size=detector_size)
-    geo.accuracy = 0.5  # Add accuracy attribute to satisfy TIGRE's internal print command
-    angles = create_angles()
-    
-    # Perform tomographic reconstruction
-    print("Performing volume reconstruction...")
-    reconstructed = reconstruct_volume(
-        projections=projections,
-        geo=geo,
-        angles=angles,
-        output_dir=output_dir
-    )
-    
-    # Prepare data for OME-TIFF writing
-    print("Preparing data for OME-TIFF export...")
-    Ddata = np.expand_dims(np.asarray(reconstructed), axis=1)
-    
-    # Create model directory if it doesn't exist
-    model_dir = output_dir / "model"
-    model_dir.mkdir(exist_ok=True)
-    
-    # Define OME-TIFF output path
-    output_filename = model_dir / 'reconstructed_volume.ome.tiff'
-    
-    # Write the OME-TIFF file
-    print("Writing OME-TIFF file...")
-    write_ome_tiff(
-        data=Ddata,
-        output_filename=str(output_filename),
-        channel_names=channel_names,
-        pixel_size_x=PHYSICAL_CONFIG['pixel_size_x'],
-        pixel_size_y=PHYSICAL_CONFIG['pixel_size_y'],
-        physical_size_z=PHYSICAL_CONFIG['physical_size_z'],
-        Unit=PHYSICAL_CONFIG['unit'],
-        imagej=False,
-        create_pyramid=True,
-        compression='zlib'
-    )
-    
-    print(f"Processing complete. All results saved in: {output_dir}")
+def print_import_times():
+    for title, modules in (("Cropper window", STARTUP_MODULES), ("Loaded in the background", BACKGROUND_MODULES)):
+        print(f"{title}:")
+        for module, seconds in measure_import_times(modules).items():
+            cost = "cannot be imported" if seconds is None else f"{seconds * 1000:7.1f} ms"
+            print(f"  {module:<20} {cost}")
+    print("Each module is timed alone with its dependencies; 'main' is everything the window imports.")
 
 def main():
     """
-    Main function that handles the complete pipeline from cropping to reconstruction.
+    Main function: crop videos and queue their reconstructions from one window.
     """
-    # Create and run the cropper
+    parser = argparse.ArgumentParser(description="Crop videos and queue their reconstructions.")
+    parser.add_argument('--import-times', action='store_true',
+                        help="Report the import time of each module instead of opening the window")
+    args = parser.parse_args()
+    if args.import_times:
+        print_import_times()
+        return
+
     root = tk.Tk()
-    cropper = VideoCropper(root)
+    VideoCropper(root)
     root.mainloop()
-    
-    # If a video was cropped, process it
-    if cropper.cropped_path and cropper.output_dir:
-        process_video(cropper.cropped_path, cropper.output_dir)
-    else:
-        print("No video was cropped. Exiting...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
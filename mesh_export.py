@@ -0,0 +1,146 @@
+import numpy as np
+from pathlib import Path
+
+# Binary STL record: normal, three vertices, attribute byte count (50 bytes)
+STL_RECORD_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vectors', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+
+def face_normals(triangles):
+    """
+    Compute unit normals for an (F, 3, 3) triangle array.
+
+    Args:
+        triangles (numpy.ndarray): Triangle vertex coordinates
+
+    Returns:
+        numpy.ndarray: (F, 3) float32 normals (zero for degenerate faces)
+    """
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return normals.astype(np.float32)
+
+def write_binary_stl(path, vertices, faces, header=b'Shadow CT reconstruction'):
+    """
+    Write an indexed triangle mesh to a binary STL file.
+
+    The triangle array is built with a single fancy-indexing operation and
+    written as one block of packed records.
+
+    Args:
+        path (str or Path): Output file
+        vertices (numpy.ndarray): (V, 3) vertex coordinates
+        faces (numpy.ndarray): (F, 3) vertex indices per face
+        header (bytes): Up to 80 bytes of header text
+    """
+    triangles = np.asarray(vertices, dtype=np.float32)[np.asarray(faces)]
+    records = np.zeros(triangles.shape[0], dtype=STL_RECORD_DTYPE)
+    records['vectors'] = triangles
+    records['normal'] = face_normals(triangles)
+
+    with open(Path(path), 'wb') as f:
+        f.write(header[:80].ljust(80, b'\0'))
+        f.write(np.uint32(records.shape[0]).tobytes())
+        records.tofile(f)
+
+def _vertex_quadrics(vertices, faces):
+    """
+    Accumulate area-weighted plane quadrics of the faces around each vertex.
+    """
+    triangles = vertices[faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    double_area = np.linalg.norm(normals, axis=1)
+    unit = normals / np.maximum(double_area, 1e-12)[:, np.newaxis]
+    planes = np.concatenate([unit, -np.einsum('ij,ij->i', unit, triangles[:, 0])[:, np.newaxis]], axis=1)
+    face_quadrics = (planes[:, :, np.newaxis] * planes[:, np.newaxis, :]) * (double_area / 2)[:, np.newaxis, np.newaxis]
+
+    quadrics = np.zeros((vertices.shape[0], 4, 4))
+    for corner in range(3):
+        np.add.at(quadrics, faces[:, corner], face_quadrics)
+    return quadrics
+
+def _cluster_mesh(vertices, faces, quadrics, cell_size):
+    """
+    Collapse all vertices within each grid cell to their quadric-optimal point.
+    """
+    cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    _, labels, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    labels = labels.reshape(-1)
+    num_clusters = counts.shape[0]
+
+    cluster_quadrics = np.zeros((num_clusters, 4, 4))
+    np.add.at(cluster_quadrics, labels, quadrics)
+    centroids = np.zeros((num_clusters, 3))
+    np.add.at(centroids, labels, vertices)
+    centroids /= counts[:, np.newaxis]
+
+    # Minimize the quadric error, regularized towards the centroid so flat
+    # or degenerate clusters stay well-posed
+    A = cluster_quadrics[:, :3, :3]
+    b = cluster_quadrics[:, :3, 3]
+    reg = 1e-3 * np.trace(A, axis1=1, axis2=2)[:, np.newaxis, np.newaxis] + 1e-9
+    positions = np.linalg.solve(A + reg * np.eye(3), (-b + reg[:, :, 0] * centroids)[:, :, np.newaxis])[:, :, 0]
+
+    # Move the positions back inside their cells if the solve overshoots
+    cell_min = np.floor((centroids - vertices.min(axis=0)) / cell_size) * cell_size + vertices.min(axis=0)
+    positions = np.clip(positions, cell_min, cell_min + cell_size)
+
+    new_faces = labels[faces]
+    keep = (new_faces[:, 0] != new_faces[:, 1]) & (new_faces[:, 1] != new_faces[:, 2]) & (new_faces[:, 0] != new_faces[:, 2])
+    new_faces = new_faces[keep]
+
+    # Drop faces that collapsed onto the same vertex triple
+    _, unique_idx = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    new_faces = new_faces[np.sort(unique_idx)]
+
+    # Remove clusters no longer referenced by any face
+    used, remap = np.unique(new_faces, return_inverse=True)
+    return positions[used], remap.reshape(new_faces.shape)
+
+def decimate_mesh(vertices, faces, target_faces, max_iterations=12):
+    """
+    Reduce a triangle mesh to at most target_faces faces.
+
+    Uses quadric-error vertex clustering: vertices are grouped on a uniform
+    grid and each group collapses to the point minimizing the summed plane
+    quadrics of its faces. The grid size is found by bisection so the result
+    lands as close to the target as possible without exceeding it.
+
+    Args:
+        vertices (numpy.ndarray): (V, 3) vertex coordinates
+        faces (numpy.ndarray): (F, 3) vertex indices per face
+        target_faces (int): Maximum number of faces in the output
+        max_iterations (int): Number of bisection steps on the grid size
+
+    Returns:
+        tuple: (vertices, faces) of the decimated mesh
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    if target_faces is None or faces.shape[0] <= target_faces:
+        return vertices, faces
+
+    quadrics = _vertex_quadrics(vertices, faces)
+
+    # Face count scales roughly with 1 / cell_size**2 on a surface
+    edges = vertices[faces[:, 1]] - vertices[faces[:, 0]]
+    mean_edge = np.linalg.norm(edges, axis=1).mean()
+    low = mean_edge
+    high = mean_edge * np.sqrt(faces.shape[0] / max(target_faces, 1)) * 4
+
+    best = None
+    for _ in range(max_iterations):
+        cell_size = np.sqrt(low * high)
+        candidate = _cluster_mesh(vertices, faces, quadrics, cell_size)
+        if candidate[1].shape[0] <= target_faces:
+            best = candidate
+            high = cell_size
+        else:
+            low = cell_size
+
+    if best is None:
+        best = _cluster_mesh(vertices, faces, quadrics, high)
+    return best
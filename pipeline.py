@@ -0,0 +1,273 @@
+"""
+Headless reconstruction pipeline: projections, FDK, STL and volume export for one video.
+
+Used by the GUI in main.py and by the batch and sweep entry points.
+"""
+import sys
+import os
+if os.name == 'nt':
+    # CUDA runtime for TIGRE on the Windows workstation
+    os.environ["PATH"] = r"C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v11.8\bin;C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v11.8\libnvvp;" + os.environ.get("PATH", "")
+# Prune the path to avoid using the TIGRE version from the wrong project.
+# This is a temporary fix; the root cause is likely a PYTHONPATH issue
+# or an editable install pointing to the wrong location.
+sys.path = [p for p in sys.path if os.path.join('Summerproj', 'TIGRE', 'Python') not in p]
+import datetime
+from pathlib import Path
+from video_processor import VideoProcessor, save_first_frame_comparison
+from geometry_config import create_geometry
+from reconstruction import reconstruct_volume, export_model
+from geometry_tables import tables_for
+from stage_cache import StageCache, file_hash
+from precision import wrap_projections, stored_array
+from preprocessing import configured_preprocessor
+from instrumentation import recording, stage, instrumented
+from streaming import VideoFileSource, reconstruct_stream, streaming_period
+import numpy as np
+from volume_export import write_volume
+from run_folders import run_folder_name
+from config import VIDEO_CONFIG, PHYSICAL_CONFIG, GEOMETRY_CONFIG, RECONSTRUCTION_CONFIG, VISUALIZATION_CONFIG, CACHE_CONFIG, INSTRUMENTATION_CONFIG, EXPORT_CONFIG
+
+# VIDEO_CONFIG keys that change how projections are produced but not their values
+PROJECTION_CACHE_IGNORED = ('memmap_projections', 'write_cropped_preview', 'decode_workers')
+
+def process_video(video_path, output_dir, crop_rect=None):
+    """
+    Process the video and perform reconstruction.
+    
+    Per-stage metrics are written to metrics.json in output_dir when
+    INSTRUMENTATION_CONFIG is enabled.
+    
+    Args:
+        video_path (str): Source video
+        output_dir (Path): Run output directory
+        crop_rect (tuple, optional): (x1, y1, x2, y2) square ROI in source pixels;
+            cropping happens in memory while the projections are extracted
+    """
+    with recording(output_dir,
+                   enabled=INSTRUMENTATION_CONFIG.get('enabled', False),
+                   profiler=INSTRUMENTATION_CONFIG.get('profiler'),
+                   sample_interval=INSTRUMENTATION_CONFIG.get('sample_interval', 0.01)):
+        with stage('process_video'):
+            _process_video(video_path, output_dir, crop_rect)
+
+def _process_video(video_path, output_dir, crop_rect):
+    preview_path = None
+    if crop_rect is not None and VIDEO_CONFIG.get('write_cropped_preview', False):
+        preview_path = output_dir / f"{Path(video_path).stem}_cropped.mp4"
+    
+    # Save configuration and video info
+    config_info = {
+        'Video Information': {
+            'Original Video': str(video_path),
+            'Crop Rectangle': str(crop_rect),
+            'Cropped Video': str(preview_path.name) if preview_path else 'not written',
+            'Processing Date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        },
+        'Reconstruction Parameters': RECONSTRUCTION_CONFIG,
+        'Geometry Parameters': GEOMETRY_CONFIG,
+        'Video Processing Parameters': VIDEO_CONFIG,
+        'Physical Parameters': PHYSICAL_CONFIG,
+        'Visualization Parameters': VISUALIZATION_CONFIG,
+        'Export Parameters': EXPORT_CONFIG,
+        'Cache Parameters': CACHE_CONFIG
+    }
+    
+    # Save config to text file
+    config_path = output_dir / 'config.txt'
+    with open(config_path, 'w') as f:
+        for section, params in config_info.items():
+            f.write(f"\n{section}\n")
+            f.write("=" * len(section) + "\n")
+            for key, value in params.items():
+                f.write(f"{key}: {value}\n")
+    
+    if RECONSTRUCTION_CONFIG.get('streaming', False):
+        _stream_video(video_path, output_dir, crop_rect, config_path)
+        cache = None
+    else:
+        # Only the cache is kept; the in-memory volume is released before export
+        cache = _batch_video(video_path, output_dir, crop_rect, preview_path, config_path)[1]
+    
+    # Export from the saved reconstruction.npy so the volume is paged in tile by tile, never copied
+    model_dir = output_dir / "model"
+    reconstructed = np.load(model_dir / "reconstruction.npy", mmap_mode='r')
+    export_format = EXPORT_CONFIG.get('format', 'ome-tiff')
+    suffix = '.ome.tiff' if export_format == 'ome-tiff' else '.zarr'
+    output_filename = model_dir / f"reconstructed_volume{suffix}"
+    
+    print(f"Writing {output_filename.name}...")
+    with stage('export_volume'):
+        export = write_volume(
+            reconstructed,
+            output_filename,
+            format=export_format,
+            codec=EXPORT_CONFIG.get('codec', 'zlib'),
+            quantization=EXPORT_CONFIG.get('quantization'),
+            tile_size=EXPORT_CONFIG.get('tile_size', 256),
+            pyramid_levels=EXPORT_CONFIG.get('pyramid_levels', 4),
+            num_workers=EXPORT_CONFIG.get('workers'),
+            pixel_size=(PHYSICAL_CONFIG['pixel_size_x'], PHYSICAL_CONFIG['pixel_size_y'],
+                        PHYSICAL_CONFIG['physical_size_z']),
+            unit=PHYSICAL_CONFIG['unit'],
+            channel_name='shadow'
+        )
+    del reconstructed
+    
+    # Stored values map back to the reconstruction as value = stored * scale + offset
+    with open(config_path, 'a') as f:
+        section = 'Volume Export'
+        f.write(f"\n{section}\n")
+        f.write("=" * len(section) + "\n")
+        f.write(f"File: {output_filename.name}\n")
+        for key, value in export.items():
+            f.write(f"{key}: {value}\n")
+    
+    # Record which stages were reused
+    if cache is not None:
+        with open(config_path, 'a') as f:
+            section = 'Stage Cache'
+            f.write(f"\n{section}\n")
+            f.write("=" * len(section) + "\n")
+            for stage_name, outcome in cache.summary().items():
+                f.write(f"{stage_name}: {outcome}\n")
+    
+    print(f"Processing complete. All results saved in: {output_dir}")
+
+def _write_rotation(config_path, period, num_projections):
+    with open(config_path, 'a') as f:
+        section = 'Rotation'
+        f.write(f"\n{section}\n")
+        f.write("=" * len(section) + "\n")
+        f.write(f"Frames per revolution: {'assumed to be the first frames' if period is None else f'{period:.2f}'}\n")
+        f.write(f"Projections used: {num_projections}\n")
+
+def projection_preprocessor(crop_rect, geo):
+    """
+    Per-frame preprocessing of a run, including the circular mask if enabled.
+    """
+    mask = tables_for(geo).circular_mask() if RECONSTRUCTION_CONFIG['apply_circular_mask'] else None
+    return configured_preprocessor(crop_rect, mask=mask)
+
+def _write_preprocessing(config_path, preprocessor):
+    with open(config_path, 'a') as f:
+        section = 'Preprocessing'
+        f.write(f"\n{section}\n")
+        f.write("=" * len(section) + "\n")
+        for number, op in enumerate(preprocessor.describe(), 1):
+            f.write(f"{number}: {op}\n")
+
+def _batch_video(video_path, output_dir, crop_rect, preview_path, config_path):
+    """
+    Extract the full projection stack, then reconstruct it.
+    
+    Returns:
+        tuple: (reconstructed volume, StageCache or None)
+    """
+    # Processing parameters
+    image_size = GEOMETRY_CONFIG['image_size']
+    detector_size = GEOMETRY_CONFIG['detector_size']
+    
+    # Create geometry for reconstruction; the detector mask is applied while decoding
+    print("Setting up reconstruction geometry...")
+    with stage('geometry'):
+        geo = create_geometry(image_size=image_size, detector_size=detector_size)
+        geo.accuracy = 0.5  # Add accuracy attribute to satisfy TIGRE's internal print command
+    
+    # Stage cache shared across runs; it also holds the geometry tables
+    cache = None
+    if CACHE_CONFIG.get('enabled', False):
+        cache = StageCache(CACHE_CONFIG['cache_dir'], max_bytes=CACHE_CONFIG['max_size_gb'] * 1024**3)
+    tables_for(geo, cache=cache)
+    preprocessor = projection_preprocessor(crop_rect, geo)
+    _write_preprocessing(config_path, preprocessor)
+    
+    projections_key = None
+    projections = None
+    if cache is not None:
+        video_settings = {k: v for k, v in VIDEO_CONFIG.items() if k not in PROJECTION_CACHE_IGNORED}
+        projections_key = cache.key('projections', file_hash(video_path), crop_rect, video_settings,
+                                    preprocessor.ops)
+        # Copy-on-write, so nothing downstream can modify the cache file
+        projections = cache.load('projections', projections_key, mmap_mode='c')
+        # The angles belong to the extracted frames; without them the projections are unusable
+        cached_angles = cache.load('angles', projections_key) if projections is not None else None
+        if cached_angles is None:
+            if projections is not None:
+                # The stack is extracted again, so report it as a miss in config.txt
+                cache.events['projections'] = 'miss'
+            projections = None
+        else:
+            angles, period = cached_angles[0], (float(cached_angles[1][0]) if cached_angles[1].size else None)
+    
+    # Process video and extract projections
+    print("Processing video and extracting projections...")
+    with VideoProcessor(video_path, target_size=VIDEO_CONFIG['target_size'], preview_path=preview_path,
+                        projection_dtype=VIDEO_CONFIG.get('projection_dtype', 'float32'),
+                        preprocessor=preprocessor) as processor:
+        if projections is not None:
+            print("Reusing cached projections...")
+            projections = wrap_projections(projections, processor.lut)
+            ret, frame = processor.cap.read()
+            if ret:
+                save_first_frame_comparison(projections[0], processor.crop_frame(frame), output_dir)
+        else:
+            memmap_path = output_dir / 'projections.npy' if VIDEO_CONFIG.get('memmap_projections', False) else None
+            projections, angles, period = processor.extract_revolution(
+                num_frames=VIDEO_CONFIG['num_frames'], 
+                output_dir=output_dir,
+                memmap_path=memmap_path,
+                num_workers=VIDEO_CONFIG.get('decode_workers', 1),
+                rotation_period=VIDEO_CONFIG.get('rotation_period', 'auto')
+            )
+            if cache is not None:
+                cache.store('projections', projections_key, stored_array(projections))
+                cache.store('angles', projections_key, (angles, np.array([] if period is None else [period])))
+    
+    _write_rotation(config_path, period, projections.shape[0])
+    
+    # Perform tomographic reconstruction
+    print("Performing volume reconstruction...")
+    reconstructed = reconstruct_volume(
+        projections=projections,
+        geo=geo,
+        angles=angles,
+        output_dir=output_dir,
+        cache=cache,
+        cache_key=projections_key,
+        mask_applied=True
+    )
+    
+    return reconstructed, cache
+
+@instrumented('stream_video')
+def _stream_video(video_path, output_dir, crop_rect, config_path):
+    """
+    Reconstruct while decoding: each frame is backprojected as soon as it is read.
+    
+    Projections, volume and mesh are not cached in this mode.
+    
+    Returns:
+        numpy.ndarray: Reconstructed volume
+    """
+    if RECONSTRUCTION_CONFIG.get('algorithm', 'fdk') != 'fdk':
+        raise ValueError("streaming only supports the 'fdk' algorithm")
+    print("Streaming reconstruction while decoding the video...")
+    geo = create_geometry(image_size=GEOMETRY_CONFIG['image_size'], detector_size=GEOMETRY_CONFIG['detector_size'])
+    preprocessor = projection_preprocessor(crop_rect, geo)
+    _write_preprocessing(config_path, preprocessor)
+    
+    processor = VideoProcessor(video_path, target_size=VIDEO_CONFIG['target_size'], preprocessor=preprocessor)
+    period = streaming_period(processor)
+    with VideoFileSource(video_path) as source:
+        engine, angles = reconstruct_stream(source, processor, geo, period, VIDEO_CONFIG['num_frames'],
+                                            RECONSTRUCTION_CONFIG['filter_type'],
+                                            num_workers=RECONSTRUCTION_CONFIG.get('cpu_workers'))
+    _write_rotation(config_path, period, len(angles))
+    
+    model_dir = output_dir / "model"
+    model_dir.mkdir(parents=True, exist_ok=True)
+    reconstructed = engine.volume
+    np.save(model_dir / "reconstruction.npy", reconstructed)
+    export_model(reconstructed, model_dir, RECONSTRUCTION_CONFIG['stl_threshold'])
+    return reconstructed
@@ -0,0 +1,104 @@
+"""
+Storage precision of projection stacks.
+
+Projections are float32 by default, and the volume is float32 from
+reconstruction through export. VIDEO_CONFIG['projection_dtype'] can store
+the projection stack as float16 (half the memory) or as the uint8 source
+intensities plus the log lookup table (a quarter), decoded to float32 only
+for the slices a consumer reads.
+"""
+import numpy as np
+
+PROJECTION_DTYPES = ('float32', 'float16', 'uint8')
+
+def storage_dtype(projection_dtype):
+    """
+    numpy dtype of a projection stack stored with the given precision.
+    """
+    if projection_dtype not in PROJECTION_DTYPES:
+        raise ValueError(f"Unknown projection_dtype '{projection_dtype}'. Valid options are: {PROJECTION_DTYPES}")
+    return np.dtype(projection_dtype)
+
+class LutProjections:
+    """
+    Projection stack stored as uint8 intensities and a float32 lookup table.
+
+    Indexing decodes only the selected part, so consumers that read the
+    stack in batches or row ranges (CPU filtering, slab reconstruction)
+    never hold a decoded copy of the whole stack; np.asarray decodes all of
+    it. Detector masks are applied in place with stack[:, mask] = 0, which
+    stores the table's zero-attenuation code.
+    """
+    ndim = 3
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, codes, lut):
+        """
+        Args:
+            codes (numpy.ndarray): (angles, nV, nU) uint8 intensities, may be a memmap
+            lut (numpy.ndarray): (256,) projection value of each intensity
+        """
+        self.codes = codes
+        self.lut = np.array(lut, dtype=np.float32)
+        self.zero_code = zero_code(self.lut)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def size(self):
+        return self.codes.size
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        return self.lut[self.codes[key]]
+
+    def __setitem__(self, key, value):
+        if np.any(np.asarray(value) != 0):
+            raise ValueError("uint8 projections can only be set to 0 (masked)")
+        if self.zero_code is None:
+            raise ValueError("The log table has no zero-attenuation entry, so uint8 projections cannot be masked")
+        self.codes[key] = self.zero_code
+
+    def __array__(self, dtype=None, copy=None):
+        decoded = self.lut[self.codes]
+        return decoded if dtype is None else decoded.astype(dtype, copy=False)
+
+    def copy(self):
+        return LutProjections(np.array(self.codes), self.lut)
+
+def zero_code(lut):
+    """
+    Code whose table entry is exactly zero attenuation, or None if there is none.
+
+    Masked pixels are stored as this code. Pinning the nearest entry to 0
+    instead would change the value of every real pixel with that intensity.
+    """
+    codes = np.flatnonzero(lut == 0)
+    return int(codes[-1]) if codes.size else None
+
+def wrap_projections(stack, lut):
+    """
+    Projection stack for a stored array: uint8 arrays are wrapped with the table.
+
+    Args:
+        stack (numpy.ndarray): Stored projections (float32, float16 or uint8)
+        lut (numpy.ndarray): Log lookup table of the preprocessor (Preprocessor.lut)
+
+    Returns:
+        numpy.ndarray or LutProjections
+    """
+    return LutProjections(stack, lut) if stack.dtype == np.uint8 else stack
+
+def stored_array(projections):
+    """
+    The array backing a projection stack, as written to disk or the stage cache.
+    """
+    return projections.codes if isinstance(projections, LutProjections) else projections
@@ -0,0 +1,380 @@
+"""
+Composable, fused preprocessing of video frames into projections.
+
+A Preprocessor is an ordered list of operations: image operations (crop,
+gray, rotate, resize) on the uint8 frame, one log lookup table that turns
+intensities into attenuation, then projection operations (background
+subtraction, clipping, masks) on the float projection. Each frame runs
+through all of them in one pass, straight into the caller's output buffer:
+scalar operations directly after the log table are folded into the table,
+and the rest work in place on the frame while it is still in cache, so no
+operation makes its own pass over, or copy of, the whole stack. The
+operation list is recorded in config.txt.
+"""
+import cv2
+import numpy as np
+from config import VIDEO_CONFIG
+from precision import zero_code
+
+def log_lut(flat_field=256.0):
+    """
+    Build the 256-entry log-attenuation lookup table for uint8 intensities.
+
+    Entry i holds -log((i + 1) / flat_field), so indexing a uint8 frame with
+    the table gives the log-inverted projection without per-pixel logs.
+
+    Args:
+        flat_field (float): Unattenuated (backlight) intensity; 256 for raw 8-bit video
+
+    Returns:
+        numpy.ndarray: float32 table of shape (256,)
+    """
+    intensities = np.arange(256, dtype=np.float64) + 1
+    return (-np.log(intensities / float(flat_field))).astype(np.float32)
+
+class Crop:
+    """
+    Region (x1, y1, x2, y2) of the source frame, as a view.
+    """
+    kind = 'image'
+
+    def __init__(self, rect):
+        self.rect = tuple(int(v) for v in rect)
+
+    def __call__(self, image):
+        x1, y1, x2, y2 = self.rect
+        return image[y1:y2, x1:x2]
+
+    def __repr__(self):
+        return f"crop{self.rect}"
+
+class Gray:
+    """
+    BGR to grayscale; gray frames pass through.
+    """
+    kind = 'image'
+
+    def __call__(self, image):
+        return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    def __repr__(self):
+        return "gray"
+
+class Rotate:
+    """
+    Clockwise rotation by a multiple of 90 degrees.
+    """
+    kind = 'image'
+    CODES = {90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+    def __init__(self, degrees=90):
+        if degrees not in self.CODES:
+            raise ValueError(f"Rotation must be one of {tuple(self.CODES)} degrees, got {degrees}")
+        self.degrees = degrees
+
+    def __call__(self, image):
+        return cv2.rotate(image, self.CODES[self.degrees])
+
+    def __repr__(self):
+        return f"rotate({self.degrees} cw)"
+
+class Resize:
+    """
+    Resize to (width, height) with bilinear interpolation.
+    """
+    kind = 'image'
+
+    def __init__(self, size):
+        self.size = (int(size[0]), int(size[1]))
+
+    def __call__(self, image):
+        return cv2.resize(image, self.size)
+
+    def __repr__(self):
+        return f"resize({self.size[0]}x{self.size[1]})"
+
+class LogLut:
+    """
+    Log inversion of uint8 intensities through a 256-entry table.
+    """
+    kind = 'lut'
+
+    def __init__(self, flat_field=256.0):
+        self.flat_field = float(flat_field)
+
+    def table(self):
+        return log_lut(self.flat_field)
+
+    def __repr__(self):
+        return f"log_lut(flat_field={self.flat_field:g})"
+
+class SubtractBackground:
+    """
+    Subtract a log-domain background: a number, or an (H, W) projection.
+
+    A scalar background is folded into the log table.
+    """
+    kind = 'projection'
+
+    def __init__(self, background):
+        self.background = np.asarray(background, dtype=np.float32)
+        self.foldable = self.background.ndim == 0
+
+    def fold(self, lut):
+        return lut - self.background
+
+    def apply(self, projection):
+        np.subtract(projection, self.background, out=projection)
+
+    def __repr__(self):
+        if self.foldable:
+            return f"subtract_background({float(self.background):g})"
+        return f"subtract_background({self.background.shape[0]}x{self.background.shape[1]} projection)"
+
+class Clip:
+    """
+    Clip attenuation values to [minimum, maximum]; folded into the log table.
+    """
+    kind = 'projection'
+    foldable = True
+
+    def __init__(self, minimum, maximum):
+        self.minimum, self.maximum = float(minimum), float(maximum)
+
+    def fold(self, lut):
+        return np.clip(lut, self.minimum, self.maximum)
+
+    def apply(self, projection):
+        np.clip(projection, self.minimum, self.maximum, out=projection)
+
+    def __repr__(self):
+        return f"clip({self.minimum:g}, {self.maximum:g})"
+
+class Mask:
+    """
+    Zero (no attenuation) every pixel outside a boolean (H, W) mask.
+    """
+    kind = 'projection'
+    foldable = False
+
+    def __init__(self, mask, name='mask'):
+        self.shape = mask.shape
+        self.outside = np.flatnonzero(~np.asarray(mask, dtype=bool))
+        self.name = name
+
+    def apply(self, projection):
+        projection.reshape(-1)[self.outside] = 0
+
+    def apply_codes(self, codes, zero_code):
+        codes.reshape(-1)[self.outside] = zero_code
+
+    def __repr__(self):
+        return f"{self.name}({self.outside.size} of {self.shape[0] * self.shape[1]} pixels zeroed)"
+
+class Preprocessor:
+    """
+    Ordered preprocessing operations, fused into one pass per frame.
+
+    Image operations come first, then exactly one LogLut, then projection
+    operations. With 'uint8' projection storage the stack keeps the
+    intensities before the log table; the folded operations live in the
+    table, and a Mask as the last operation writes the table's zero code,
+    so the stored intensities decode to the same projections. That needs a
+    table entry of exactly zero attenuation (an integer flat_field up to
+    256, or a clip at 0).
+    """
+    def __init__(self, ops):
+        """
+        Args:
+            ops (list): Operations in the order they are applied
+        """
+        self.ops = list(ops)
+        kinds = [op.kind for op in self.ops]
+        if kinds.count('lut') != 1:
+            raise ValueError("A preprocessor needs exactly one LogLut operation")
+        lut_position = kinds.index('lut')
+        if any(kind != 'image' for kind in kinds[:lut_position]) or \
+                any(kind != 'projection' for kind in kinds[lut_position + 1:]):
+            raise ValueError("Image operations must come before the LogLut and projection operations after it")
+        self.image_ops = self.ops[:lut_position]
+        projection_ops = self.ops[lut_position + 1:]
+
+        # Fold the leading run of scalar operations into the table
+        lut = self.ops[lut_position].table()
+        folded = 0
+        while folded < len(projection_ops) and projection_ops[folded].foldable:
+            lut = projection_ops[folded].fold(lut)
+            folded += 1
+        self.pixel_ops = projection_ops[folded:]
+        self.lut = np.ascontiguousarray(lut, dtype=np.float32)
+
+        # Masks write this code into uint8 stacks, here or later on the stored stack
+        self.zero_code = zero_code(self.lut)
+        self.encodes_intensities = self.zero_code is not None and \
+            all(isinstance(op, Mask) for op in self.pixel_ops)
+
+    @classmethod
+    def standard(cls, crop_rect=None, target_size=(512, 512), flat_field=256.0, background=None,
+                 clip_range=None, mask=None):
+        """
+        The pipeline's preprocessing: crop, gray, rotate 90 degrees, resize,
+        log inversion, then the optional corrections.
+
+        Args:
+            crop_rect (tuple, optional): (x1, y1, x2, y2) region cropped from each source frame
+            target_size (tuple): (width, height) of the projections
+            flat_field (float): Unattenuated intensity used for log inversion
+            background (float, str or numpy.ndarray, optional): Log-domain background
+                to subtract: a number, an (H, W) projection or a .npy file of one
+            clip_range (tuple, optional): (min, max) attenuation after background subtraction
+            mask (numpy.ndarray, optional): (H, W) boolean detector mask; pixels outside are zeroed
+
+        Returns:
+            Preprocessor
+        """
+        ops = [Crop(crop_rect)] if crop_rect is not None else []
+        ops += [Gray(), Rotate(90), Resize(target_size), LogLut(flat_field)]
+        if background is not None:
+            ops.append(SubtractBackground(np.load(background) if isinstance(background, str) else background))
+        if clip_range is not None:
+            ops.append(Clip(*clip_range))
+        if mask is not None:
+            # Last, so masked pixels are exactly zero attenuation
+            ops.append(Mask(mask, name='circular_mask'))
+        return cls(ops)
+
+    @property
+    def crop_rect(self):
+        crops = [op.rect for op in self.image_ops if isinstance(op, Crop)]
+        return crops[0] if crops else None
+
+    def describe(self):
+        """
+        The operations in order, one string each, for config.txt.
+        """
+        return [repr(op) for op in self.ops]
+
+    def intensities(self, frame):
+        """
+        Run the image operations, keeping uint8 intensities.
+        """
+        for op in self.image_ops:
+            frame = op(frame)
+        return frame
+
+    def __call__(self, frame, out=None):
+        """
+        Preprocess one source frame into a float32 projection.
+
+        Args:
+            frame (numpy.ndarray): BGR (or gray) source frame
+            out (numpy.ndarray, optional): (H, W) float32 buffer written in place
+
+        Returns:
+            numpy.ndarray: (H, W) float32 projection
+        """
+        intensities = self.intensities(frame)
+        if out is None:
+            out = np.empty(intensities.shape, dtype=np.float32)
+        cv2.LUT(intensities, self.lut, dst=out)
+        for op in self.pixel_ops:
+            op.apply(out)
+        return out
+
+    def process_block(self, intensities, out=None):
+        """
+        Projections of a block of frames, with one table lookup for the whole block.
+
+        Args:
+            intensities (numpy.ndarray): (N, H, W) uint8 intensities from intensities()
+            out (numpy.ndarray, optional): (N, H, W) C-contiguous float32 buffer written in place
+
+        Returns:
+            numpy.ndarray: (N, H, W) float32 projections
+        """
+        intensities = np.ascontiguousarray(intensities)
+        if out is None:
+            out = np.empty(intensities.shape, dtype=np.float32)
+        num_frames, height, width = intensities.shape
+        # The stacked (N*H, W) block goes through the table in a single call
+        cv2.LUT(intensities.reshape(num_frames * height, width), self.lut,
+                dst=out.reshape(num_frames * height, width))
+        for projection in out:
+            for op in self.pixel_ops:
+                op.apply(projection)
+        return out
+
+    def uint8_error(self):
+        """
+        Why this preprocessing cannot be stored as uint8 intensities.
+        """
+        if self.zero_code is None:
+            return ("uint8 projection storage needs a log table entry of exactly zero attenuation "
+                    "(an integer flat_field up to 256, or a clip at 0); use float32 or float16")
+        return f"uint8 projection storage cannot hold {self.pixel_ops}; use float32 or float16"
+
+    def encode_block(self, intensities, out, scratch=None):
+        """
+        Store a block of intensities in stack slots of the storage precision, as encode.
+
+        Args:
+            intensities (numpy.ndarray): (N, H, W) uint8 intensities from intensities()
+            out (numpy.ndarray): (N, H, W) slice of a float32, float16 or uint8 stack
+            scratch (numpy.ndarray, optional): (N, H, W) float32 buffer for float16 slots
+        """
+        if out.dtype == np.uint8:
+            if not self.encodes_intensities:
+                raise ValueError(self.uint8_error())
+            out[...] = intensities
+            for codes in out:
+                for op in self.pixel_ops:
+                    op.apply_codes(codes, self.zero_code)
+        elif out.dtype == np.float32 and out.flags.c_contiguous:
+            self.process_block(intensities, out=out)
+        else:
+            out[...] = self.process_block(intensities, out=scratch)
+
+    def encode(self, frame, out, scratch=None):
+        """
+        Preprocess one source frame into a stack slot in its storage precision.
+
+        Args:
+            frame (numpy.ndarray): BGR (or gray) source frame
+            out (numpy.ndarray): (H, W) slot of a float32, float16 or uint8 stack
+            scratch (numpy.ndarray, optional): (H, W) float32 buffer for float16 slots
+        """
+        if out.dtype == np.uint8:
+            if not self.encodes_intensities:
+                raise ValueError(self.uint8_error())
+            out[...] = self.intensities(frame)
+            for op in self.pixel_ops:
+                op.apply_codes(out, self.zero_code)
+        elif out.dtype == np.float32 and out.flags.c_contiguous:
+            self(frame, out=out)
+        else:
+            out[...] = self(frame, out=scratch)
+
+    def decode(self, stored):
+        """
+        float32 projection of a frame stored by encode.
+        """
+        if stored.dtype == np.uint8:
+            return cv2.LUT(stored, self.lut)
+        return np.asarray(stored, dtype=np.float32)
+
+def configured_preprocessor(crop_rect=None, mask=None, target_size=None):
+    """
+    The standard preprocessing with the corrections configured in VIDEO_CONFIG.
+
+    Args:
+        crop_rect (tuple, optional): (x1, y1, x2, y2) region cropped from each source frame
+        mask (numpy.ndarray, optional): (H, W) boolean detector mask, applied last
+        target_size (tuple, optional): (width, height); defaults to VIDEO_CONFIG['target_size']
+
+    Returns:
+        Preprocessor
+    """
+    return Preprocessor.standard(crop_rect, target_size or VIDEO_CONFIG['target_size'],
+                                 flat_field=VIDEO_CONFIG.get('flat_field', 256.0),
+                                 background=VIDEO_CONFIG.get('background'),
+                                 clip_range=VIDEO_CONFIG.get('clip_range'), mask=mask)
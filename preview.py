@@ -0,0 +1,255 @@
+"""
+Fast low-resolution preview reconstructions for choosing the crop region.
+
+Source frames are decoded once per video at low resolution in a background
+thread; each crop region is then previewed from a few dozen of them with a
+coarse CPU FDK, so a new region only costs cropping and a small
+reconstruction. Newer requests make older preview jobs stale and they stop
+at their next checkpoint.
+"""
+import queue
+import threading
+import cv2
+import numpy as np
+import fdk_cpu
+from config import VIDEO_CONFIG, RECONSTRUCTION_CONFIG
+from geometry_config import create_geometry
+from geometry_tables import tables_for
+from video_processor import find_revolution, select_revolution_frames
+from preprocessing import log_lut
+
+class PreviewCancelled(Exception):
+    """
+    Raised inside a preview job that a newer request has superseded.
+    """
+
+def preview_geometry(size):
+    """
+    The configured geometry resampled to size voxels and detector pixels.
+
+    Args:
+        size (int): Voxels per axis and detector pixels per side
+
+    Returns:
+        Geometry with the same physical extent as create_geometry()
+    """
+    geo = create_geometry()
+    geo.nVoxel = np.array([size, size, size])
+    geo.dVoxel = geo.sVoxel / geo.nVoxel
+    geo.nDetector = np.array([size, size])
+    geo.dDetector = geo.sDetector / geo.nDetector
+    return geo
+
+def load_preview_frames(video_path, max_frames, short_side=192, max_samples=400, check=None):
+    """
+    Decode low-resolution gray copies of a strided subset of frames.
+
+    Skipped frames are only grabbed, never retrieved or converted.
+
+    Args:
+        video_path (str or Path): Source video
+        max_frames (int): Source frames to cover
+        short_side (int): Short side of the stored frames in pixels
+        max_samples (int): Upper bound on stored frames
+        check (callable, optional): Called between frames; raises to abort
+
+    Returns:
+        tuple: (frames (N, H, W) uint8, source frame index of each, scale of the stored frames)
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {video_path}")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_count > 0:
+        max_frames = min(max_frames, frame_count)
+    stride = max(1, int(np.ceil(max_frames / max_samples)))
+
+    frames, indices = [], []
+    scale = 1.0
+    try:
+        for index in range(max_frames):
+            if check is not None:
+                check()
+            if index % stride:
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            scale = min(1.0, short_side / min(gray.shape))
+            frames.append(cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+            indices.append(index)
+    finally:
+        cap.release()
+    if not frames:
+        raise ValueError(f"Could not read video file: {video_path}")
+    return np.stack(frames), np.array(indices), scale
+
+def preview_volume(frames, indices, scale, crop_rect, size=64, num_projections=36, check=None):
+    """
+    Coarse FDK reconstruction of one crop region.
+
+    Args:
+        frames (numpy.ndarray): Low-resolution frames from load_preview_frames
+        indices (numpy.ndarray): Source frame index of each stored frame
+        scale (float): Scale of the stored frames relative to the source
+        crop_rect (tuple): (x1, y1, x2, y2) in source frame pixels
+        size (int): Voxels per axis of the preview volume
+        num_projections (int): Projections used
+        check (callable, optional): Called between steps; raises to abort
+
+    Returns:
+        numpy.ndarray: (size, size, size) float32 volume
+    """
+    x1, y1, x2, y2 = (int(round(c * scale)) for c in crop_rect)
+    crops = frames[:, y1:max(y2, y1 + 1), x1:max(x2, x1 + 1)]
+
+    # Pick frames within one revolution, as the full pipeline does
+    period = VIDEO_CONFIG.get('rotation_period', 'auto')
+    if period == 'auto':
+        thumbnails = np.stack([cv2.resize(crop, (32, 32), interpolation=cv2.INTER_AREA) for crop in crops])
+        thumbnails = np.rot90(thumbnails.astype(np.float32), k=-1, axes=(1, 2))
+        thumbnails -= thumbnails.mean(axis=(1, 2), keepdims=True)
+        thumbnails /= np.maximum(np.linalg.norm(thumbnails, axis=(1, 2), keepdims=True), 1e-6)
+        correlation = np.einsum('nij,ij->n', thumbnails, thumbnails[0])
+        mirror_correlation = np.einsum('nij,ij->n', thumbnails, thumbnails[0][:, ::-1])
+        samples = find_revolution(correlation, mirror_correlation)
+        stride = indices[1] - indices[0] if len(indices) > 1 else 1
+        period = None if samples is None else samples * stride
+    if period is None:
+        period = VIDEO_CONFIG['num_frames']
+    wanted, _ = select_revolution_frames(period, num_projections)
+    # Nearest stored frame to each wanted source frame, with its true angle
+    chosen = np.unique(np.clip(np.searchsorted(indices, wanted), 0, len(indices) - 1))
+    angles = 2 * np.pi * indices[chosen] / period
+    if check is not None:
+        check()
+
+    lut = log_lut(VIDEO_CONFIG.get('flat_field', 256.0))
+    projections = np.stack([cv2.LUT(cv2.resize(cv2.rotate(crops[i], cv2.ROTATE_90_CLOCKWISE), (size, size),
+                                               interpolation=cv2.INTER_AREA), lut) for i in chosen])
+    geo = preview_geometry(size)
+    if RECONSTRUCTION_CONFIG.get('apply_circular_mask', False):
+        projections[:, ~tables_for(geo).circular_mask()] = 0
+    if check is not None:
+        check()
+    return fdk_cpu.fdk(projections, geo, angles, filter=RECONSTRUCTION_CONFIG['filter_type'])
+
+def orthogonal_slices(volume):
+    """
+    Middle axial, coronal and sagittal slices side by side as one uint8 image.
+    """
+    nz, ny, nx = volume.shape
+    slices = [volume[nz // 2], volume[:, ny // 2, :], volume[:, :, nx // 2]]
+    low, high = np.percentile(volume, [1, 99.5])
+    image = np.concatenate(slices, axis=1)
+    return (np.clip((image - low) / max(high - low, 1e-6), 0, 1) * 255).astype(np.uint8)
+
+class PreviewWorker:
+    """
+    Background thread computing preview volumes for the latest crop region.
+
+    load() and request() return immediately; results arrive on the results
+    queue as ('status', message), ('preview', crop_rect, slices_image) or
+    ('error', message), to be polled from the GUI thread. A new crop region
+    cancels the running preview but not the loading of frames; a new video
+    cancels both.
+    """
+    def __init__(self, size=64, num_projections=36):
+        self.size = size
+        self.num_projections = num_projections
+        self.results = queue.Queue()
+        self.condition = threading.Condition()
+        self.video_generation = 0
+        self.generation = 0
+        self.video_path = None
+        self.crop_rect = None
+        self.frames = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def load(self, video_path):
+        """
+        Start decoding preview frames for a new video, cancelling older work.
+        """
+        with self.condition:
+            self.video_generation += 1
+            self.generation += 1
+            self.video_path = video_path
+            self.crop_rect = None
+            self.frames = None
+            self.condition.notify()
+
+    def request(self, crop_rect):
+        """
+        Preview a crop region, superseding any pending or running preview.
+        """
+        with self.condition:
+            self.generation += 1
+            self.crop_rect = crop_rect
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.video_generation += 1
+            self.generation += 1
+            self.closed = True
+            self.condition.notify()
+
+    def _pending(self, served):
+        if self.video_path is not None and self.frames is None:
+            return True
+        return self.frames is not None and self.crop_rect is not None and served != self.generation
+
+    def _run(self):
+        served = None
+        while True:
+            with self.condition:
+                while not self.closed and not self._pending(served):
+                    self.condition.wait()
+                if self.closed:
+                    return
+                video_generation, generation = self.video_generation, self.generation
+                video_path, crop_rect, frames = self.video_path, self.crop_rect, self.frames
+
+            if frames is None:
+                def check_load():
+                    if self.video_generation != video_generation:
+                        raise PreviewCancelled()
+                self.results.put(('status', "Loading preview frames..."))
+                span = VIDEO_CONFIG['num_frames']
+                if VIDEO_CONFIG.get('rotation_period', 'auto') == 'auto':
+                    span *= 2  # Room to find where the revolution ends
+                try:
+                    frames = load_preview_frames(video_path, span, check=check_load)
+                except PreviewCancelled:
+                    continue
+                except Exception as e:
+                    self.results.put(('error', str(e)))
+                    frames = None
+                with self.condition:
+                    if self.video_generation == video_generation:
+                        self.frames = frames
+                        if frames is None:
+                            self.video_path = None
+                if frames is not None:
+                    self.results.put(('status', "Draw a line to preview the crop"))
+                continue
+
+            def check():
+                if self.generation != generation:
+                    raise PreviewCancelled()
+            served = generation
+            try:
+                self.results.put(('status', "Computing preview..."))
+                volume = preview_volume(*frames, crop_rect, size=self.size,
+                                        num_projections=self.num_projections, check=check)
+                check()
+                self.results.put(('preview', crop_rect, orthogonal_slices(volume)))
+            except PreviewCancelled:
+                pass
+            except Exception as e:
+                self.results.put(('error', str(e)))
@@ -1,24 +1,33 @@
-import tigre
 import numpy as np
-import tigre.algorithms as algs
 from pathlib import Path
-import datetime
+import copy
 import os
+import shutil
 import matplotlib.pyplot as plt
-from stl import mesh
 from skimage import measure
+from mesh_export import write_binary_stl, decimate_mesh
+from surface_extraction import SurfaceIndex, marching_cubes_blocks
+from geometry_tables import tables_for
+from instrumentation import instrumented, stage
 from config import RECONSTRUCTION_CONFIG, VISUALIZATION_CONFIG
 
-def reconstruct_volume(projections, geo, angles, output_dir=None, stl_threshold=None):
+@instrumented()
+def reconstruct_volume(projections, geo, angles, output_dir=None, stl_threshold=None, cache=None, cache_key=None,
+                       mask_applied=False):
     """
     Perform FDK reconstruction on the projection data.
     
     Args:
-        projections (numpy.ndarray): Projection data
+        projections (numpy.ndarray): Projection data (float32, float16 or precision.LutProjections);
+            with apply_circular_mask it is masked in place unless mask_applied
         geo (tigre.geometry): Geometry configuration
         angles (numpy.ndarray): Projection angles
         output_dir (str, optional): Directory to save results
         stl_threshold (float, optional): Threshold value for STL conversion (0-1)
+        cache (StageCache, optional): Reuse filtered projections, volume and mesh from earlier runs
+        cache_key (str, optional): Cache key of the projections
+        mask_applied (bool): The projections were already masked while preprocessing
+            (preprocessing.Mask), so the mask pass is skipped
         
     Returns:
         numpy.ndarray: Reconstructed volume
@@ -28,44 +37,347 @@ def reconstruct_volume(projections, geo, angles, output_dir=None, stl_threshold=
         stl_threshold = RECONSTRUCTION_CONFIG['stl_threshold']
     
     # Optionally apply a circular mask
-    if RECONSTRUCTION_CONFIG.get('apply_circular_mask', False):
-        h, w = projections.shape[1], projections.shape[2]
-        center_x, center_y = w // 2, h // 2
-        radius = min(center_x, center_y)
-        
-        y, x = np.ogrid[:h, :w]
-        dist_from_center = np.sqrt((x - center_x)**2 + (y - center_y)**2)
-        mask = dist_from_center <= radius
-        
-        projections = projections * mask[np.newaxis, :, :]
+    apply_mask = RECONSTRUCTION_CONFIG.get('apply_circular_mask', False)
+    mask = None
+    if apply_mask and not mask_applied:
+        mask = tables_for(geo).circular_mask()
     
-    # Perform FDK reconstruction
-    reconstructed = algs.fdk(projections, geo, angles, filter=RECONSTRUCTION_CONFIG['filter_type'])
-    
-    # Create timestamped output directory if specified
+    model_dir = None
     if output_dir is not None:
         # Create model directory
         model_dir = Path(output_dir) / "model"
         model_dir.mkdir(parents=True, exist_ok=True)
+    
+    use_cache = cache is not None and cache_key is not None
+    reconstructed = None
+    if use_cache:
+        filter_type = RECONSTRUCTION_CONFIG['filter_type']
+        filtered_key = cache.key('filtered', cache_key, geo, filter_type, apply_mask)
+        volume_key = cache.key('volume', cache_key, geo, angles, filter_type, apply_mask,
+                               RECONSTRUCTION_CONFIG.get('backend', 'tigre'), iterative_settings())
+        reconstructed = cache.load('volume', volume_key)
+        if reconstructed is not None:
+            print("Reusing cached reconstruction...")
+            if model_dir is not None:
+                shutil.copyfile(cache.path('volume', volume_key), model_dir / "reconstruction.npy")
+    
+    if reconstructed is None:
+        reconstructed = _compute_volume(projections, geo, angles, mask, model_dir,
+                                        cache=cache if use_cache else None,
+                                        filtered_key=filtered_key if use_cache else None)
+        if use_cache:
+            cache.store('volume', volume_key, reconstructed)
+    
+    if model_dir is not None:
+        export_model(reconstructed, model_dir, stl_threshold,
+                     cache=cache if use_cache else None, volume_key=volume_key if use_cache else None)
         
+    return reconstructed
+
+def export_model(reconstructed, model_dir, stl_threshold, cache=None, volume_key=None):
+    """
+    Save the middle slices and model.stl of a reconstructed volume.
+    
+    Args:
+        reconstructed (numpy.ndarray): Reconstructed volume
+        model_dir (Path): Model directory of the run
+        stl_threshold (float): Threshold value for STL conversion (0-1)
+        cache (StageCache, optional): Reuse the mesh from earlier runs
+        volume_key (str, optional): Cache key of the volume
+    """
+    # Save visualization slices
+    save_visualization_slices(reconstructed, model_dir)
+    
+    # Save as STL
+    target_faces = RECONSTRUCTION_CONFIG.get('stl_target_faces')
+    index = None
+    block_size = RECONSTRUCTION_CONFIG.get('mesh_block_size')
+    volume_path = model_dir / "reconstruction.npy"
+    if block_size and volume_path.exists():
+        # Saved next to reconstruction.npy for re-extraction at other thresholds
+        index = SurfaceIndex.for_volume_file(volume_path, block_size)
+    mesh_data = None
+    if cache is not None:
+        mesh_key = cache.key('mesh', volume_key, stl_threshold, target_faces)
+        mesh_data = cache.load('mesh', mesh_key)
+    if mesh_data is None:
+        mesh_data = extract_surface(reconstructed, threshold=stl_threshold, target_faces=target_faces,
+                                    index=index)
+        if cache is not None:
+            cache.store('mesh', mesh_key, mesh_data)
+    with stage('write_stl'):
+        write_binary_stl(model_dir / "model.stl", *mesh_data)
+
+def _compute_volume(projections, geo, angles, mask, model_dir, cache=None, filtered_key=None):
+    """
+    Run FDK for reconstruct_volume, in slabs or in one pass.
+    
+    With a cache and the CPU backend the filtered projections are cached
+    separately, so only the backprojection reruns when the angles change.
+    With algorithm 'os_sart' the FDK volume is refined iteratively.
+    """
+    filter_type = RECONSTRUCTION_CONFIG['filter_type']
+    algorithm = RECONSTRUCTION_CONFIG.get('algorithm', 'fdk')
+    if algorithm not in ('fdk', 'os_sart'):
+        raise ValueError(f"Unknown reconstruction algorithm: {algorithm}. Use 'fdk' or 'os_sart'")
+    
+    if RECONSTRUCTION_CONFIG.get('slab_mode', False):
+        if algorithm != 'fdk':
+            # Every ray crosses all slabs, so iterative updates cannot be split along z
+            raise ValueError("slab_mode only supports the 'fdk' algorithm")
+        # Reconstruct z-slab by z-slab straight into a memory-mapped volume
+        nz, ny, nx = (int(n) for n in geo.nVoxel)
+        if model_dir is not None:
+            reconstructed = np.lib.format.open_memmap(
+                str(model_dir / "reconstruction.npy"), mode='w+', dtype=np.float32, shape=(nz, ny, nx))
+        else:
+            reconstructed = np.empty((nz, ny, nx), dtype=np.float32)
+        reconstruct_slabs(projections, geo, angles, reconstructed,
+                          filter_type=filter_type, mask=mask,
+                          slab_thickness=RECONSTRUCTION_CONFIG.get('slab_thickness'))
+        if isinstance(reconstructed, np.memmap):
+            reconstructed.flush()
+        return reconstructed
+    
+    if mask is not None:
+        # In place: a masked copy would double the stack in memory
+        projections[:, ~mask] = 0
+    
+    # Perform FDK reconstruction
+    if cache is not None and RECONSTRUCTION_CONFIG.get('backend', 'tigre') == 'cpu':
+        import fdk_cpu
+        filtered = cache.load('filtered', filtered_key)
+        if filtered is None:
+            with stage('filter_projections'):
+                filtered = fdk_cpu.filter_projections(projections, geo, filter_type=filter_type)
+            cache.store('filtered', filtered_key, filtered)
+        with stage('backproject'):
+            reconstructed = fdk_cpu.backproject(filtered, geo, angles,
+                                                num_workers=RECONSTRUCTION_CONFIG.get('cpu_workers'))
+    else:
+        reconstructed = run_fdk(projections, geo, angles, filter_type=filter_type)
+    
+    if algorithm == 'os_sart':
+        reconstructed = run_os_sart(projections, geo, angles, x0=reconstructed)
+    
+    if model_dir is not None:
         # Save as numpy array
         np.save(model_dir / "reconstruction.npy", reconstructed)
+    return reconstructed
+
+@instrumented('fdk')
+def run_fdk(projections, geo, angles, filter_type, backend=None):
+    """
+    Run FDK reconstruction on the configured backend.
+    
+    Args:
+        projections (numpy.ndarray): Projection data
+        geo: Geometry configuration from create_geometry
+        angles (numpy.ndarray): Projection angles
+        filter_type (str): Ramp filter name
+        backend (str, optional): 'tigre' (CUDA) or 'cpu' (multi-core numpy)
         
-        # Save visualization slices
-        save_visualization_slices(reconstructed, model_dir)
+    Returns:
+        numpy.ndarray: Reconstructed volume
+    """
+    if backend is None:
+        backend = RECONSTRUCTION_CONFIG.get('backend', 'tigre')
+    
+    if backend == 'tigre':
+        import tigre.algorithms as algs
+        # TIGRE needs one contiguous float32 stack; reduced-precision stacks are decoded here
+        return algs.fdk(np.ascontiguousarray(projections, dtype=np.float32), geo, angles, filter=filter_type)
+    if backend == 'cpu':
+        import fdk_cpu
+        return fdk_cpu.fdk(projections, geo, angles, filter=filter_type,
+                           num_workers=RECONSTRUCTION_CONFIG.get('cpu_workers'))
+    raise ValueError(f"Unknown reconstruction backend: {backend}. Use 'tigre' or 'cpu'")
+
+def iterative_settings():
+    """
+    Iterative reconstruction parameters that affect the volume, or None for FDK.
+    """
+    if RECONSTRUCTION_CONFIG.get('algorithm', 'fdk') == 'fdk':
+        return None
+    keys = ('algorithm', 'iterations', 'subsets', 'relaxation', 'tv_weight', 'tv_iterations',
+            'convergence_tolerance')
+    return {key: RECONSTRUCTION_CONFIG.get(key) for key in keys}
+
+@instrumented('os_sart')
+def run_os_sart(projections, geo, angles, x0=None):
+    """
+    Refine a reconstruction with ordered-subset SART on the CPU.
+    
+    Args:
+        projections (numpy.ndarray): Projection data
+        geo: Geometry configuration from create_geometry
+        angles (numpy.ndarray): Projection angles
+        x0 (numpy.ndarray, optional): Warm start, normally the FDK volume
         
-        # Save as STL
-        save_stl(reconstructed, model_dir, threshold=stl_threshold)
+    Returns:
+        numpy.ndarray: Reconstructed volume
+    """
+    import iterative_cpu
+    print("Refining reconstruction with OS-SART...")
+    return iterative_cpu.os_sart(
+        projections, geo, angles,
+        iterations=RECONSTRUCTION_CONFIG.get('iterations', 20),
+        subsets=RECONSTRUCTION_CONFIG.get('subsets', 10),
+        relaxation=RECONSTRUCTION_CONFIG.get('relaxation', 1.0),
+        tv_weight=RECONSTRUCTION_CONFIG.get('tv_weight', 0.0),
+        tv_iterations=RECONSTRUCTION_CONFIG.get('tv_iterations', 10),
+        tolerance=RECONSTRUCTION_CONFIG.get('convergence_tolerance', 1e-3),
+        x0=x0, num_workers=RECONSTRUCTION_CONFIG.get('cpu_workers'))
+
+def available_memory():
+    """
+    Estimate the physical memory currently available to this process in bytes.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        # Conservative default when the platform gives no answer
+        return 4 * 1024**3
+
+def slab_detector_rows(geo, z_start, z_stop):
+    """
+    Detector rows that voxels in slices [z_start, z_stop) project onto.
+    
+    Uses the extreme magnifications across the in-plane field of view, plus
+    one row of margin on each side for interpolation.
+    
+    Args:
+        geo: Geometry configuration from create_geometry
+        z_start (int): First slice of the slab
+        z_stop (int): One past the last slice of the slab
         
-    return reconstructed
+    Returns:
+        tuple: (row_start, row_stop) detector row range
+    """
+    nz = int(geo.nVoxel[0])
+    num_rows = int(geo.nDetector[0])
+    off_z, off_y, off_x = np.asarray(geo.offOrigin, dtype=float)
+    
+    # Slab extent along z (voxel edges) and in-plane radius of the volume
+    z_low = (z_start - nz / 2.0) * geo.dVoxel[0] + off_z
+    z_high = (z_stop - nz / 2.0) * geo.dVoxel[0] + off_z
+    radius = np.hypot(geo.sVoxel[1] / 2.0 + abs(off_y), geo.sVoxel[2] / 2.0 + abs(off_x))
+    magnifications = np.array([geo.DSD / (geo.DSO + radius), geo.DSD / (geo.DSO - radius)])
+    
+    v = np.concatenate([z_low * magnifications, z_high * magnifications])
+    first_row_v = -(num_rows - 1) / 2.0 * geo.dDetector[0] + geo.offDetector[0]
+    row_start = int(np.floor((v.min() - first_row_v) / geo.dDetector[0])) - 1
+    row_stop = int(np.ceil((v.max() - first_row_v) / geo.dDetector[0])) + 2
+    return max(0, row_start), min(num_rows, row_stop)
+
+def slab_geometry(geo, z_start, z_stop, row_start, row_stop):
+    """
+    Geometry for reconstructing slices [z_start, z_stop) from detector rows [row_start, row_stop).
+    
+    The sub-volume and sub-detector keep their positions in the full
+    geometry through offOrigin and offDetector.
+    """
+    sub = copy.deepcopy(geo)
+    nz, num_rows = int(geo.nVoxel[0]), int(geo.nDetector[0])
+    
+    sub.nVoxel = np.array([z_stop - z_start, geo.nVoxel[1], geo.nVoxel[2]])
+    sub.sVoxel = sub.nVoxel * geo.dVoxel
+    sub.offOrigin = np.array(geo.offOrigin, dtype=float)
+    sub.offOrigin[0] += ((z_start + z_stop - 1) / 2.0 - (nz - 1) / 2.0) * geo.dVoxel[0]
+    
+    sub.nDetector = np.array([row_stop - row_start, geo.nDetector[1]])
+    sub.sDetector = sub.nDetector * geo.dDetector
+    sub.offDetector = np.array(geo.offDetector, dtype=float)
+    sub.offDetector[0] += ((row_start + row_stop - 1) / 2.0 - (num_rows - 1) / 2.0) * geo.dDetector[0]
+    return sub
+
+def plan_slab_thickness(geo, num_angles, memory_budget=None):
+    """
+    Choose the thickest z-slab whose working set fits in the memory budget.
+    
+    Counts the slab's projection rows three times (copy, masked, filtered)
+    and the slab volume with headroom for backprojection temporaries.
+    
+    Args:
+        geo: Geometry configuration from create_geometry
+        num_angles (int): Number of projections
+        memory_budget (float, optional): Bytes to use; defaults to half the available RAM
+        
+    Returns:
+        int: Number of slices per slab
+    """
+    if memory_budget is None:
+        memory_budget = available_memory() / 2
+    nz, ny, nx = (int(n) for n in geo.nVoxel)
+    num_cols = int(geo.nDetector[1])
+    
+    def slab_bytes(thickness):
+        row_start, row_stop = slab_detector_rows(geo, 0, thickness)
+        projection_bytes = 3 * num_angles * (row_stop - row_start) * num_cols * 4
+        volume_bytes = 12 * thickness * ny * nx * 4
+        return projection_bytes + volume_bytes
+    
+    low, high = 1, nz
+    while low < high:
+        mid = (low + high + 1) // 2
+        if slab_bytes(mid) <= memory_budget:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+@instrumented()
+def reconstruct_slabs(projections, geo, angles, out, filter_type, mask=None, slab_thickness=None):
+    """
+    Reconstruct the volume in z-slabs, reading only the detector rows each slab needs.
+    
+    Args:
+        projections (numpy.ndarray): Projection data, may be a memmap
+        geo: Geometry configuration from create_geometry
+        angles (numpy.ndarray): Projection angles
+        out (numpy.ndarray): (nz, ny, nx) output volume, typically a memmap
+        filter_type (str): Ramp filter name
+        mask (numpy.ndarray, optional): (H, W) boolean detector mask
+        slab_thickness (int, optional): Slices per slab; planned from RAM if None
+        
+    Returns:
+        numpy.ndarray: out
+    """
+    nz = int(geo.nVoxel[0])
+    if slab_thickness is None:
+        budget_gb = RECONSTRUCTION_CONFIG.get('memory_budget_gb')
+        slab_thickness = plan_slab_thickness(geo, len(angles), budget_gb * 1024**3 if budget_gb else None)
+    
+    for z_start in range(0, nz, slab_thickness):
+        z_stop = min(z_start + slab_thickness, nz)
+        row_start, row_stop = slab_detector_rows(geo, z_start, z_stop)
+        print(f"Reconstructing slab {z_start}-{z_stop} of {nz} (detector rows {row_start}-{row_stop})")
+        
+        slab_projections = np.array(projections[:, row_start:row_stop, :], dtype=np.float32)
+        if mask is not None:
+            slab_projections *= mask[np.newaxis, row_start:row_stop, :]
+        
+        sub_geo = slab_geometry(geo, z_start, z_stop, row_start, row_stop)
+        out[z_start:z_stop] = run_fdk(slab_projections, sub_geo, angles, filter_type=filter_type)
+    
+    return out
 
-def save_visualization_slices(volume, output_path):
+@instrumented()
+def save_visualization_slices(volume, output_path=None, slices_dir=None):
     """
-    Save visualization slices of the reconstructed volume.
+    Save visualization slices of the reconstructed volume as middle_slices.png.
     
     Args:
         volume (numpy.ndarray): Reconstructed volume
-        output_path (Path): Path to save visualizations (parent directory)
+        output_path (Path, optional): Model directory of a run; the image goes in its parent
+        slices_dir (Path, optional): Directory for the image, instead of output_path's parent
     """
     # Plot and save slices
     plt.figure(figsize=(15, 5))
@@ -92,36 +404,71 @@ def save_visualization_slices(volume, output_path):
     plt.colorbar()
     
     plt.tight_layout()
-    # Save in parent directory
-    plt.savefig(output_path.parent / "middle_slices.png")
+    # Save next to the model directory unless told otherwise
+    plt.savefig((Path(slices_dir) if slices_dir is not None else output_path.parent) / "middle_slices.png")
     plt.close()
 
-def save_stl(volume, output_path, threshold=0.5):
+@instrumented()
+def extract_surface(volume, threshold=0.5, target_faces=None, index=None, executor=None):
     """
-    Convert volume to STL file using marching cubes.
+    Extract the thresholded surface of a volume with marching cubes.
+    
+    With RECONSTRUCTION_CONFIG['mesh_block_size'] set, the volume is meshed
+    in blocks, on a process pool if 'mesh_workers' allows (see
+    surface_extraction.py); the stitched mesh has the same triangles as a
+    single pass.
     
     Args:
         volume (numpy.ndarray): Reconstructed volume
-        output_path (Path): Path to save STL file
         threshold (float): Threshold value for surface extraction (0-1)
+        target_faces (int, optional): Decimate the mesh to at most this many faces
+        index (SurfaceIndex, optional): Saved block ranges of the volume, so only
+            the blocks containing the threshold are read
+        executor (ProcessPoolExecutor, optional): Mesh pool from
+            surface_extraction.mesh_pool, reused across calls
+        
+    Returns:
+        tuple: (vertices, faces) of the surface mesh
     """
-    # Normalize volume to 0-1 range
-    vmin, vmax = volume.min(), volume.max()
-    normalized_volume = (volume - vmin) / (vmax - vmin)
-
-    # Remove 3D cylindrical mask: use the full normalized volume
-    # Apply threshold
-    binary_volume = normalized_volume > threshold
+    block_size = RECONSTRUCTION_CONFIG.get('mesh_block_size')
+    if block_size:
+        # The block ranges give the volume's range and the blocks to skip without another pass
+        if index is None:
+            index = SurfaceIndex.build(volume, block_size)
+        vertices, faces = marching_cubes_blocks(volume, index.level(threshold),
+                                                num_workers=RECONSTRUCTION_CONFIG.get('mesh_workers'),
+                                                index=index, executor=executor)
+    else:
+        # Threshold relative to the volume's range without building a normalized copy.
+        # Works slab by slab so memory-mapped volumes are never loaded as floats.
+        vmin, vmax = float(volume.min()), float(volume.max())
+        level = vmin + threshold * (vmax - vmin)
+        binary_volume = np.empty(volume.shape, dtype=bool)
+        step = max(1, volume.shape[0] // 16)
+        for start in range(0, volume.shape[0], step):
+            np.greater(volume[start:start + step], level, out=binary_volume[start:start + step])
+        
+        # Generate mesh using marching cubes
+        vertices, faces, normals, values = measure.marching_cubes(binary_volume, level=0.5)
     
-    # Generate mesh using marching cubes
-    vertices, faces, normals, values = measure.marching_cubes(binary_volume, level=0.5)
+    # Optionally reduce the face count for printers and viewers
+    if target_faces is not None:
+        vertices, faces = decimate_mesh(vertices, faces, target_faces)
     
-    # Create the mesh
-    surface_mesh = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
-    for i, face in enumerate(faces):
-        for j in range(3):
-            surface_mesh.vectors[i][j] = vertices[face[j]]
+    return vertices, faces
+
+def save_stl(volume, output_path, threshold=0.5, target_faces=None):
+    """
+    Convert volume to STL file using marching cubes.
+    
+    Args:
+        volume (numpy.ndarray): Reconstructed volume
+        output_path (Path): Path to save STL file
+        threshold (float): Threshold value for surface extraction (0-1)
+        target_faces (int, optional): Decimate the mesh to at most this many faces
+    """
+    vertices, faces = extract_surface(volume, threshold=threshold, target_faces=target_faces)
     
     # Save the STL file
     stl_path = output_path / "model.stl"
-    surface_mesh.save(str(stl_path)) 
\ No newline at end of file
+    write_binary_stl(stl_path, vertices, faces)
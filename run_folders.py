@@ -0,0 +1,26 @@
+"""
+Names of the run folders in final_config/.
+
+Kept apart from pipeline.py so the GUI and the job clients can name a run
+without importing the reconstruction stack.
+"""
+import os
+from config import RECONSTRUCTION_CONFIG
+
+def run_folder_name(video_path, timestamp=None):
+    """
+    Name of the final_config/ folder for one run of video_path.
+    
+    Args:
+        video_path (str): Source video
+        timestamp (str, optional): Run timestamp; omitted for deterministic batch folders
+        
+    Returns:
+        str: <name>_<filter>_<threshold>_<mask>[_<timestamp>]
+    """
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    filter_type = RECONSTRUCTION_CONFIG['filter_type']
+    threshold = RECONSTRUCTION_CONFIG['stl_threshold']
+    mask_status = "maskTrue" if RECONSTRUCTION_CONFIG.get('apply_circular_mask', False) else "maskFalse"
+    name = f"{base_name}_{filter_type}_{threshold}_{mask_status}"
+    return f"{name}_{timestamp}" if timestamp else name
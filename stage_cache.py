@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import numpy as np
+from pathlib import Path
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    Content hash of a file, read in chunks.
+
+    Args:
+        path (str or Path): File to hash
+        chunk_size (int): Bytes read per chunk
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _canonical(value):
+    """
+    Convert a stage input into a JSON-serializable, order-independent form.
+    """
+    if isinstance(value, np.ndarray):
+        return {'ndarray': hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=20).hexdigest(),
+                'dtype': str(value.dtype), 'shape': list(value.shape)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, '__dict__'):
+        # Geometry objects: hash their attributes
+        return _canonical(vars(value))
+    return str(value)
+
+def input_key(*inputs):
+    """
+    Hash of any mix of configs, arrays, geometry and previous keys.
+    """
+    payload = json.dumps(_canonical(list(inputs)), sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+class StageCache:
+    """
+    Content-addressed on-disk cache for pipeline stage outputs.
+
+    Each entry lives at <cache_dir>/<stage>/<key>.npy (arrays) or .npz (tuples
+    of arrays), where the key hashes every input of the stage. Access times
+    are tracked through file mtimes and the least recently used entries are
+    evicted once the directory grows past max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.events = {}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, *inputs):
+        """
+        Build a cache key from any mix of configs, arrays, geometry and previous keys.
+        """
+        return input_key(*inputs)
+
+    def path(self, stage, key, suffix='.npy'):
+        return self.cache_dir / stage / f"{key}{suffix}"
+
+    def _find(self, stage, key):
+        for suffix in ('.npy', '.npz'):
+            path = self.path(stage, key, suffix)
+            if path.exists():
+                return path
+        return None
+
+    def load(self, stage, key, mmap_mode='r'):
+        """
+        Return a cached stage output, or None on a miss.
+
+        Arrays are memory-mapped (use mmap_mode='c' for a writable
+        copy-on-write view); tuples come back as tuples of arrays.
+        """
+        path = self._find(stage, key)
+        if path is None:
+            self.events[stage] = 'miss'
+            return None
+        self.events[stage] = 'hit'
+        os.utime(path)
+        if path.suffix == '.npz':
+            with np.load(path) as data:
+                return tuple(data[f'arr_{i}'] for i in range(len(data.files)))
+        return np.load(path, mmap_mode=mmap_mode)
+
+    def store(self, stage, key, value):
+        """
+        Store a stage output (array or tuple of arrays) and enforce the size bound.
+
+        Returns:
+            Path: Location of the cached entry
+        """
+        suffix = '.npz' if isinstance(value, tuple) else '.npy'
+        path = self.path(stage, key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary name and rename, so concurrent runs never see partial files
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp{suffix}")
+        if isinstance(value, tuple):
+            np.savez(tmp_path, *value)
+        else:
+            np.save(tmp_path, value)
+        os.replace(tmp_path, path)
+
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for path in self.cache_dir.glob('*/*'):
+            if path.suffix in ('.npy', '.npz') and '.tmp' not in path.name:
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    # Evicted by a concurrent run
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def summary(self):
+        """
+        Hit/miss outcome per stage for the current run.
+        """
+        return dict(self.events)
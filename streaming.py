@@ -0,0 +1,342 @@
+"""
+Streaming FDK: filter and backproject each projection as soon as it is decoded.
+
+A FrameSource yields source frames (from a video file, optionally paced at
+the recording frame rate, or from a camera); reconstruct_stream turns the
+frames of one revolution into projections with a VideoProcessor and feeds
+them to a StreamingReconstructor, which accumulates the volume so a partial
+reconstruction can be read at any time.
+
+Usage:
+    python streaming.py video.mov --crop 100 0 1180 1080 --realtime --output stream_out
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import fdk_cpu
+from config import VIDEO_CONFIG, RECONSTRUCTION_CONFIG
+from instrumentation import instrumented
+from video_processor import VideoProcessor, select_revolution_frames
+
+class FrameSource:
+    """
+    Iterable of (frame index, BGR frame) pairs.
+
+    Subclasses implement __iter__. After select(frame_indices) a source only
+    yields those frames, may skip the others without retrieving or
+    converting them, and stops after the last one.
+    """
+    fps = None
+
+    def __init__(self):
+        self.frame_indices = None
+        self.last_index = None
+
+    def select(self, frame_indices):
+        self.frame_indices = set(int(i) for i in frame_indices)
+        self.last_index = max(self.frame_indices)
+
+    def wanted(self, index):
+        return self.frame_indices is None or index in self.frame_indices
+
+    def finished(self, index):
+        return self.last_index is not None and index > self.last_index
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class VideoFileSource(FrameSource):
+    """
+    Frames of a video file, optionally delivered at the recording frame rate
+    to stand in for a live camera.
+    """
+    def __init__(self, video_path, realtime=False):
+        super().__init__()
+        self.video_path = Path(video_path)
+        self.realtime = realtime
+        self.cap = cv2.VideoCapture(str(self.video_path))
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video file: {self.video_path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    def __iter__(self):
+        start = time.perf_counter()
+        index = 0
+        while not self.finished(index):
+            if self.realtime:
+                # Frame i of a live stream would not exist before i / fps seconds
+                delay = start + index / self.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if not self.wanted(index):
+                if not self.cap.grab():
+                    return
+            else:
+                ret, frame = self.cap.read()
+                if not ret:
+                    return
+                yield index, frame
+            index += 1
+
+    def close(self):
+        self.cap.release()
+
+class CameraSource(FrameSource):
+    """
+    Live frames from a camera opened through cv2.VideoCapture.
+    """
+    def __init__(self, device=0):
+        super().__init__()
+        self.cap = cv2.VideoCapture(device)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open camera: {device}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or None
+
+    def __iter__(self):
+        index = 0
+        while not self.finished(index):
+            # Unused frames still have to be read off the device to keep up
+            ret, frame = self.cap.read()
+            if not ret:
+                return
+            if self.wanted(index):
+                yield index, frame
+            index += 1
+
+    def close(self):
+        self.cap.release()
+
+class StreamingReconstructor:
+    """
+    FDK reconstruction that accumulates one projection at a time.
+
+    Each projection is cosine weighted, ramp filtered and backprojected into
+    the volume z-slab by z-slab on a thread pool, using the same kernels as
+    fdk_cpu, so after all projections of an evenly sampled revolution the
+    volume equals fdk_cpu.fdk of the full stack.
+    """
+    def __init__(self, geo, num_projections, filter_type='ram_lak', num_workers=None):
+        """
+        Args:
+            geo: Geometry from geometry_config.create_geometry
+            num_projections (int): Projections expected over the full revolution
+            filter_type (str): One of fdk_cpu.FILTER_TYPES
+            num_workers (int, optional): Backprojection threads (default: all cores)
+        """
+        self.geo = geo
+        self.num_projections = num_projections
+        self.filter_type = filter_type
+        self.num_workers = num_workers or os.cpu_count() or 1
+        nz, ny, nx = (int(n) for n in geo.nVoxel)
+        self.volume = np.zeros((nz, ny, nx), dtype=np.float32)
+        self.count = 0
+        self.lock = threading.Lock()
+
+        # Even angular sampling: each projection covers 2*pi / num_projections (halved as in fdk_cpu.backproject)
+        self.weight = np.pi / num_projections
+        num_slabs = max(1, min(nz, self.num_workers * 4))
+        bounds = np.linspace(0, nz, num_slabs + 1).astype(int)
+        self.slabs = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        self.executor = ThreadPoolExecutor(max_workers=self.num_workers)
+
+    def add(self, projection, angle):
+        """
+        Filter one (nV, nU) projection and backproject it into the volume.
+        """
+        filtered = fdk_cpu.filter_projections(projection[np.newaxis], self.geo, filter_type=self.filter_type)
+        angles = np.array([angle], dtype=float)
+        weights = np.array([self.weight])
+
+        def run(bounds):
+            z_start, z_stop = bounds
+            slab = fdk_cpu.backproject_slab(filtered, self.geo, angles, weights, z_start, z_stop)
+            with self.lock:
+                self.volume[z_start:z_stop] += slab
+
+        list(self.executor.map(run, self.slabs))
+        with self.lock:
+            self.count += 1
+
+    def snapshot(self, normalize=True):
+        """
+        Copy of the partial volume.
+
+        Args:
+            normalize (bool): Scale by the fraction of projections seen, so
+                intensities are comparable to the finished volume
+
+        Returns:
+            numpy.ndarray: (nz, ny, nx) float32 volume
+        """
+        with self.lock:
+            volume = self.volume.copy()
+            count = self.count
+        if normalize and 0 < count < self.num_projections:
+            volume *= self.num_projections / count
+        return volume
+
+    def close(self):
+        self.executor.shutdown()
+
+def streaming_period(processor=None):
+    """
+    Frames per revolution for streaming.
+
+    With rotation_period 'auto' the revolution is found in the first frames
+    of the video file before streaming starts. A camera cannot be read
+    ahead, so it (like a video without a full revolution) falls back to
+    num_frames with a warning.
+
+    Args:
+        processor (VideoProcessor, optional): Processor of the video file; None for a camera
+
+    Returns:
+        float: Frames per revolution
+    """
+    period = VIDEO_CONFIG.get('rotation_period', 'auto')
+    if isinstance(period, (int, float)) and not isinstance(period, bool):
+        return float(period)
+    num_frames = VIDEO_CONFIG['num_frames']
+    if period == 'auto':
+        estimated = None
+        if processor is not None:
+            print("Estimating rotation period...")
+            estimated = processor.estimate_rotation_period()
+        if estimated is not None:
+            print(f"One revolution takes {estimated:.2f} frames")
+            return estimated
+        reason = "no revolution detected in the video" if processor is not None else \
+            "a camera stream cannot be searched for the revolution"
+        print(f"Warning: {reason}; assuming the first {num_frames} frames span 360 degrees")
+    return float(num_frames)
+
+@instrumented()
+def reconstruct_stream(source, processor, geo, period, num_frames, filter_type,
+                       num_workers=None, on_projection=None, max_queued=16):
+    """
+    Reconstruct one revolution from a frame source while it is being read.
+
+    Decoding runs on its own thread and hands frames over through a bounded
+    queue, so decoding and backprojection overlap.
+
+    Args:
+        source (FrameSource): Source of the video frames
+        processor (VideoProcessor): Turns source frames into projections (its preprocessor
+            applies any detector mask)
+        geo: Geometry from geometry_config.create_geometry
+        period (float): Frames per revolution
+        num_frames (int): Requested number of projections
+        filter_type (str): One of fdk_cpu.FILTER_TYPES
+        num_workers (int, optional): Backprojection threads
+        on_projection (callable, optional): Called as on_projection(engine) after each projection
+        max_queued (int): Frames buffered between decoding and backprojection
+
+    Returns:
+        tuple: (StreamingReconstructor, angles of the projections used)
+    """
+    frame_indices, angles = select_revolution_frames(period, num_frames)
+    angle_of = dict(zip(frame_indices.tolist(), angles))
+    source.select(frame_indices)
+
+    engine = StreamingReconstructor(geo, len(frame_indices), filter_type=filter_type, num_workers=num_workers)
+    frames = queue.Queue(maxsize=max_queued)
+    stop = threading.Event()
+
+    def read():
+        try:
+            for index, frame in source:
+                if stop.is_set():
+                    break
+                frames.put((index, frame))
+        except Exception as e:
+            frames.put(e)
+        finally:
+            frames.put(None)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    used = []
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            index, frame = item
+            projection = processor.process_frame(frame)
+            engine.add(projection, angle_of[index])
+            used.append(angle_of[index])
+            if on_projection is not None:
+                on_projection(engine)
+    finally:
+        stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while reader.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        engine.close()
+    return engine, np.array(used)
+
+def main():
+    from geometry_config import create_geometry
+    from geometry_tables import tables_for
+    from preprocessing import configured_preprocessor
+    from reconstruction import save_visualization_slices
+
+    parser = argparse.ArgumentParser(description="Reconstruct a video while it is being read.")
+    parser.add_argument('video', help="Video file, or a camera index with --camera")
+    parser.add_argument('--camera', action='store_true', help="Read from the camera with this index")
+    parser.add_argument('--crop', type=int, nargs=4, metavar=('X1', 'Y1', 'X2', 'Y2'), help="Crop rectangle")
+    parser.add_argument('--realtime', action='store_true', help="Read the file at its recording frame rate")
+    parser.add_argument('--snapshot-every', type=int, default=0,
+                        help="Save middle slices of the partial volume every N projections")
+    parser.add_argument('--output', default='stream_output', help="Output directory")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    geo = create_geometry()
+    mask = None
+    if RECONSTRUCTION_CONFIG.get('apply_circular_mask', False):
+        mask = tables_for(geo).circular_mask()
+    preprocessor = configured_preprocessor(tuple(args.crop) if args.crop else None, mask=mask)
+
+    def on_projection(engine):
+        if args.snapshot_every and engine.count % args.snapshot_every == 0:
+            print(f"{engine.count}/{engine.num_projections} projections backprojected")
+            save_visualization_slices(engine.snapshot(), slices_dir=output_dir)
+
+    source = CameraSource(int(args.video)) if args.camera else VideoFileSource(args.video, realtime=args.realtime)
+    processor = VideoProcessor(args.video, target_size=VIDEO_CONFIG['target_size'], preprocessor=preprocessor)
+    start = time.perf_counter()
+    with source:
+        period = streaming_period(None if args.camera else processor)
+        engine, angles = reconstruct_stream(source, processor, geo, period, VIDEO_CONFIG['num_frames'],
+                                            RECONSTRUCTION_CONFIG['filter_type'],
+                                            num_workers=RECONSTRUCTION_CONFIG.get('cpu_workers'),
+                                            on_projection=on_projection)
+    print(f"Reconstructed {len(angles)} projections in {time.perf_counter() - start:.1f}s")
+    np.save(output_dir / "reconstruction.npy", engine.volume)
+    save_visualization_slices(engine.volume, slices_dir=output_dir)
+    print(f"Results saved in: {output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Block-parallel marching cubes with seam-correct stitching.
+
+The volume is cut into blocks that share a one-voxel layer with their
+neighbours, so every marching-cubes cell belongs to exactly one block and
+each block's triangles are exactly the ones a single pass over the whole
+volume produces for those cells. Blocks whose min/max range does not
+straddle the level hold no surface and are skipped; the rest are meshed in
+a process pool. On a thresholded volume every vertex lies at the midpoint
+of a voxel edge, so the copies of a seam vertex made by neighbouring
+blocks have identical coordinates and are merged exactly, giving the same
+indexed mesh as the single pass (up to vertex and face order).
+
+The block ranges form a span-space index (SurfaceIndex) that is saved next
+to reconstruction.npy, so extracting the surface at another threshold only
+reads the blocks containing the new level; IsosurfaceScrubber keeps a
+worker pool open for interactive threshold changes.
+"""
+import multiprocessing
+import os
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from skimage import measure
+
+def block_ranges(volume, block_size=64):
+    """
+    Minimum and maximum of every block of a volume.
+
+    Reads one slab of blocks at a time, so memory-mapped volumes are never
+    loaded whole.
+
+    Args:
+        volume (numpy.ndarray): (nz, ny, nx) volume, may be a memmap
+        block_size (int): Cells per block edge
+
+    Returns:
+        tuple: (mins, maxs) float32 arrays with one entry per block, shaped like the block grid
+    """
+    grid = tuple(-(-(n - 1) // block_size) for n in volume.shape)
+    mins = np.empty(grid, dtype=np.float32)
+    maxs = np.empty(grid, dtype=np.float32)
+    for iz in range(grid[0]):
+        slab = np.asarray(volume[iz * block_size:(iz + 1) * block_size + 1])
+        for iy in range(grid[1]):
+            for ix in range(grid[2]):
+                block = slab[:, iy * block_size:(iy + 1) * block_size + 1,
+                             ix * block_size:(ix + 1) * block_size + 1]
+                mins[iz, iy, ix] = block.min()
+                maxs[iz, iy, ix] = block.max()
+    return mins, maxs
+
+def _mesh_block(inside, origin):
+    """
+    Marching cubes of one thresholded block, with vertices in volume coordinates.
+    """
+    vertices, faces, _, _ = measure.marching_cubes(inside, level=0.5)
+    return vertices + np.asarray(origin, dtype=vertices.dtype), faces
+
+def _merge_vertices(vertices, faces, shape):
+    """
+    Merge vertices with identical coordinates and reindex the faces.
+
+    Vertices sit on half-voxel positions, so doubled coordinates are exact
+    integers and give each position a unique scalar key.
+    """
+    doubled = np.rint(vertices * 2).astype(np.int64)
+    extent = 2 * np.asarray(shape, dtype=np.int64)
+    keys = (doubled[:, 0] * extent[1] + doubled[:, 1]) * extent[2] + doubled[:, 2]
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return vertices[first], inverse.reshape(-1)[faces]
+
+class SurfaceIndex:
+    """
+    Span-space index of a volume: the min/max range of every block.
+
+    Blocks are kept sorted by their minimum, so the blocks containing a level
+    are found with a binary search over the minima and a check of the
+    maxima, without reading the volume.
+    """
+    def __init__(self, mins, maxs, block_size, shape):
+        """
+        Args:
+            mins (numpy.ndarray): Per-block minima, shaped like the block grid
+            maxs (numpy.ndarray): Per-block maxima, shaped like the block grid
+            block_size (int): Cells per block edge
+            shape (tuple): (nz, ny, nx) shape of the indexed volume
+        """
+        self.mins = np.asarray(mins, dtype=np.float32)
+        self.maxs = np.asarray(maxs, dtype=np.float32)
+        self.block_size = int(block_size)
+        self.shape = tuple(int(n) for n in shape)
+        self._order = np.argsort(self.mins, axis=None, kind='stable')
+        self._sorted_mins = self.mins.ravel()[self._order]
+
+    @classmethod
+    def build(cls, volume, block_size=64):
+        """
+        Index a volume (one pass over it, slab by slab).
+        """
+        return cls(*block_ranges(volume, block_size), block_size, volume.shape)
+
+    @staticmethod
+    def path_for(volume_path):
+        """
+        Index file saved next to a volume, e.g. reconstruction.blocks.npz.
+        """
+        volume_path = Path(volume_path)
+        return volume_path.with_name(f"{volume_path.stem}.blocks.npz")
+
+    @classmethod
+    def for_volume_file(cls, volume_path, block_size=64):
+        """
+        Load the index saved next to a .npy volume, or build and save it.
+
+        The index records the size and modification time of the volume file
+        and is rebuilt when either has changed or the block size differs.
+
+        Args:
+            volume_path (str or Path): .npy volume, e.g. model/reconstruction.npy
+            block_size (int): Cells per block edge
+
+        Returns:
+            SurfaceIndex
+        """
+        volume_path = Path(volume_path)
+        index_path = cls.path_for(volume_path)
+        status = volume_path.stat()
+        fingerprint = np.array([status.st_size, status.st_mtime_ns], dtype=np.int64)
+        if index_path.exists():
+            with np.load(index_path) as saved:
+                if int(saved['block_size']) == block_size and np.array_equal(saved['fingerprint'], fingerprint):
+                    return cls(saved['mins'], saved['maxs'], block_size, saved['shape'])
+        index = cls.build(np.load(volume_path, mmap_mode='r'), block_size)
+        np.savez(index_path, mins=index.mins, maxs=index.maxs, block_size=block_size,
+                 shape=np.array(index.shape), fingerprint=fingerprint)
+        return index
+
+    @property
+    def value_range(self):
+        """
+        (min, max) of the whole volume.
+        """
+        return float(self.mins.min()), float(self.maxs.max())
+
+    def level(self, threshold):
+        """
+        Isovalue for a threshold relative to the volume's range (0-1).
+        """
+        vmin, vmax = self.value_range
+        return vmin + threshold * (vmax - vmin)
+
+    def blocks_at(self, level):
+        """
+        Voxel slices of the blocks whose range contains a level, in z, y, x order.
+        """
+        candidates = self._order[:np.searchsorted(self._sorted_mins, level, side='right')]
+        active = np.sort(candidates[self.maxs.ravel()[candidates] > level])
+        grid = self.mins.shape
+        return [tuple(slice(i * self.block_size, min((i + 1) * self.block_size + 1, n))
+                      for i, n in zip(block, self.shape))
+                for block in zip(*np.unravel_index(active, grid))]
+
+def _mesh_blocks(volume, level, blocks, executor=None, max_pending=1):
+    """
+    Mesh the given blocks, on an executor if one is given, and stitch them.
+    """
+    def thresholded(block):
+        return np.greater(volume[block], level), tuple(s.start for s in block)
+
+    meshes = []
+    if executor is None or len(blocks) <= 1:
+        meshes = [_mesh_block(*thresholded(block)) for block in blocks]
+    else:
+        # Only a few blocks are thresholded ahead of the workers, so memory stays bounded
+        pending = deque()
+        for block in blocks:
+            pending.append(executor.submit(_mesh_block, *thresholded(block)))
+            if len(pending) >= max_pending:
+                meshes.append(pending.popleft().result())
+        meshes.extend(future.result() for future in pending)
+
+    if not meshes:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int64)
+
+    offsets = np.cumsum([0] + [len(vertices) for vertices, _ in meshes[:-1]])
+    vertices = np.concatenate([vertices for vertices, _ in meshes])
+    faces = np.concatenate([faces + offset for (_, faces), offset in zip(meshes, offsets)])
+    return _merge_vertices(vertices, faces, volume.shape)
+
+def mesh_pool(num_workers=None):
+    """
+    Process pool for meshing blocks, or None to mesh in the calling process.
+
+    Daemonic processes (e.g. the GUI's reconstruction worker) cannot start
+    children, so they always mesh in-process.
+
+    Args:
+        num_workers (int, optional): Worker processes (None = all cores)
+
+    Returns:
+        ProcessPoolExecutor or None
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1 or multiprocessing.current_process().daemon:
+        return None
+    # Forked workers would inherit the caller's threads and locks (Tk, readers)
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'))
+
+def marching_cubes_blocks(volume, level, block_size=64, num_workers=None, index=None, executor=None):
+    """
+    Marching cubes over the blocks of a volume containing a level, in parallel.
+
+    Equivalent to marching cubes over the whole binary volume (volume > level)
+    at 0.5, which is how extract_surface builds its mesh.
+
+    Args:
+        volume (numpy.ndarray): (nz, ny, nx) volume, may be a memmap
+        level (float): Voxels above this value are inside the object
+        block_size (int): Cells per block edge (ignored when an index is given)
+        num_workers (int, optional): Worker processes (None = all cores), or the
+            size of the given executor
+        index (SurfaceIndex, optional): Block ranges of the volume, if already known
+        executor (ProcessPoolExecutor, optional): Pool from mesh_pool to reuse
+            across calls, e.g. for several thresholds
+
+    Returns:
+        tuple: (vertices, faces) of the stitched mesh
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    if index is None:
+        index = SurfaceIndex.build(volume, block_size)
+    # A block entirely inside or entirely outside the object has no surface
+    blocks = index.blocks_at(level)
+    if executor is not None:
+        return _mesh_blocks(volume, level, blocks, executor, max_pending=num_workers * 2)
+    executor = mesh_pool(num_workers) if len(blocks) > 1 else None
+    if executor is None:
+        return _mesh_blocks(volume, level, blocks)
+    with executor:
+        return _mesh_blocks(volume, level, blocks, executor, max_pending=num_workers * 2)
+
+class IsosurfaceScrubber:
+    """
+    Interactive surface extraction at changing thresholds.
+
+    Keeps the volume memory-mapped, its span-space index and a worker pool
+    open, so each new threshold only reads and meshes the blocks that
+    contain its level. Recent meshes are kept for stepping back and forth.
+
+    Example:
+        with IsosurfaceScrubber("model/reconstruction.npy") as scrubber:
+            vertices, faces = scrubber.surface(0.3)
+    """
+    def __init__(self, volume_path, block_size=64, num_workers=None, cached_meshes=8):
+        """
+        Args:
+            volume_path (str or Path): .npy volume, e.g. model/reconstruction.npy
+            block_size (int): Cells per block edge
+            num_workers (int, optional): Worker processes (None = all cores)
+            cached_meshes (int): Number of recent meshes to keep
+        """
+        self.volume = np.load(volume_path, mmap_mode='r')
+        self.index = SurfaceIndex.for_volume_file(volume_path, block_size)
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.cached_meshes = cached_meshes
+        self._meshes = {}
+        self._executor = mesh_pool(self.num_workers)
+
+    def surface(self, threshold):
+        """
+        Mesh of the surface at a threshold relative to the volume's range.
+
+        Args:
+            threshold (float): Threshold value (0-1), as stl_threshold
+
+        Returns:
+            tuple: (vertices, faces) of the surface mesh
+        """
+        if not 0 <= threshold <= 1:
+            raise ValueError(f"threshold must be in the 0-1 range, got {threshold}")
+        if threshold not in self._meshes:
+            level = self.index.level(threshold)
+            self._meshes[threshold] = _mesh_blocks(self.volume, level, self.index.blocks_at(level),
+                                                   self._executor, max_pending=self.num_workers * 2)
+            if len(self._meshes) > self.cached_meshes:
+                del self._meshes[next(iter(self._meshes))]
+        return self._meshes[threshold]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
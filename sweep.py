@@ -0,0 +1,225 @@
+"""
+Parameter sweep over filter_type, stl_threshold and apply_circular_mask.
+
+The video is decoded into projections once. Every (filter, mask) pair is
+reconstructed once, in parallel where memory allows, and every threshold is
+extracted from each volume, so a 5-filter x 6-threshold sweep costs one
+decode plus five backprojections.
+
+Usage:
+    python sweep.py recording.mov --roi 100 50 900 850 \
+        --filters ram_lak hamming hann --thresholds 0.2 0.3 0.4 --masks true false
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import time
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from video_processor import VideoProcessor
+from preprocessing import configured_preprocessor
+from geometry_config import create_geometry
+from reconstruction import (run_fdk, extract_surface, save_visualization_slices,
+                            available_memory)
+from mesh_export import write_binary_stl
+from surface_extraction import SurfaceIndex, mesh_pool
+from geometry_tables import tables_for
+from config import VIDEO_CONFIG, GEOMETRY_CONFIG, RECONSTRUCTION_CONFIG
+
+def plan_parallel_reconstructions(projections, geo, num_jobs, memory_budget=None):
+    """
+    Number of reconstructions that can run at once within the memory budget.
+
+    Each job holds a masked and a filtered copy of the projections plus the
+    output volume and its working copy.
+
+    Args:
+        projections (numpy.ndarray): Shared projection stack
+        geo: Geometry configuration from create_geometry
+        num_jobs (int): Number of reconstructions in the sweep
+        memory_budget (float, optional): Bytes to use; defaults to half the available RAM
+
+    Returns:
+        int: Number of concurrent reconstructions (at least 1)
+    """
+    if memory_budget is None:
+        memory_budget = available_memory() / 2
+    volume_bytes = int(np.prod(geo.nVoxel)) * 4
+    job_bytes = 2 * projections.size * 4 + 2 * volume_bytes
+    return max(1, min(num_jobs, int(memory_budget // job_bytes)))
+
+def _write_config(path, sections):
+    """
+    Write sections in the same layout as the run config.txt.
+    """
+    with open(path, 'w') as f:
+        for section, params in sections.items():
+            f.write(f"\n{section}\n")
+            f.write("=" * len(section) + "\n")
+            for key, value in params.items():
+                f.write(f"{key}: {value}\n")
+
+def run_sweep(video_path, crop_rect, filters, thresholds, masks, output_root="final_config", max_parallel=None):
+    """
+    Reconstruct every combination of filters, thresholds and mask settings.
+
+    Args:
+        video_path (str): Source video
+        crop_rect (tuple): (x1, y1, x2, y2) square ROI in source pixels, or None
+        filters (list): Filter names
+        thresholds (list): STL thresholds (0-1)
+        masks (list): apply_circular_mask values
+        output_root (str): Parent directory of the sweep folder
+        max_parallel (int, optional): Upper bound on concurrent reconstructions
+
+    Returns:
+        Path: Sweep folder containing per-combination results and sweep_index.json
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_name = Path(video_path).stem
+    sweep_dir = Path(output_root) / f"{base_name}_sweep_{timestamp}"
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+
+    # Decode once
+    print("Processing video and extracting projections...")
+    start = time.perf_counter()
+    # Masks vary per setting, so they are applied to copies below
+    with VideoProcessor(video_path, target_size=VIDEO_CONFIG['target_size'],
+                        projection_dtype=VIDEO_CONFIG.get('projection_dtype', 'float32'),
+                        preprocessor=configured_preprocessor(crop_rect)) as processor:
+        projections, angles, _ = processor.extract_revolution(
+            num_frames=VIDEO_CONFIG['num_frames'],
+            output_dir=sweep_dir,
+            num_workers=VIDEO_CONFIG.get('decode_workers', 1),
+            rotation_period=VIDEO_CONFIG.get('rotation_period', 'auto')
+        )
+    decode_seconds = time.perf_counter() - start
+
+    geo = create_geometry(image_size=GEOMETRY_CONFIG['image_size'], detector_size=GEOMETRY_CONFIG['detector_size'])
+    geo.accuracy = 0.5  # Add accuracy attribute to satisfy TIGRE's internal print command
+
+    # One masked stack per mask setting, shared by all filters
+    stacks = {}
+    for apply_mask in masks:
+        if apply_mask:
+            masked = projections.copy()
+            masked[:, ~tables_for(geo).circular_mask()] = 0
+            stacks[apply_mask] = masked
+        else:
+            stacks[apply_mask] = projections
+
+    jobs = [(filter_type, apply_mask) for apply_mask in masks for filter_type in filters]
+    workers = plan_parallel_reconstructions(projections, geo, len(jobs))
+    if max_parallel is not None:
+        workers = max(1, min(workers, max_parallel))
+
+    def reconstruct(job):
+        filter_type, apply_mask = job
+        mask_status = "maskTrue" if apply_mask else "maskFalse"
+        print(f"Reconstructing with {filter_type} ({mask_status})...")
+        start = time.perf_counter()
+        volume = run_fdk(stacks[apply_mask], geo, angles, filter_type=filter_type)
+        return job, np.asarray(volume, dtype=np.float32), time.perf_counter() - start
+
+    index = {
+        'video': str(video_path),
+        'crop_rect': list(crop_rect) if crop_rect is not None else None,
+        'num_projections': int(projections.shape[0]),
+        'decode_seconds': decode_seconds,
+        'parallel_reconstructions': workers,
+        'results': []
+    }
+
+    print(f"Running {len(jobs)} reconstructions, {workers} at a time...")
+    # One mesh pool for every threshold of every volume, instead of one per surface
+    mesh_executor = None
+    if RECONSTRUCTION_CONFIG.get('mesh_block_size'):
+        mesh_executor = mesh_pool(RECONSTRUCTION_CONFIG.get('mesh_workers'))
+    with ThreadPoolExecutor(max_workers=workers) as executor, mesh_executor or contextlib.nullcontext():
+        # Submit in batches so finished volumes never pile up beyond the budget
+        results = (result for batch_start in range(0, len(jobs), workers)
+                   for result in executor.map(reconstruct, jobs[batch_start:batch_start + workers]))
+        for (filter_type, apply_mask), volume, reconstruct_seconds in results:
+            mask_status = "maskTrue" if apply_mask else "maskFalse"
+            volume_dir = sweep_dir / "volumes" / f"{filter_type}_{mask_status}"
+            volume_dir.mkdir(parents=True, exist_ok=True)
+            np.save(volume_dir / "reconstruction.npy", volume)
+            # The slices depend only on the volume, so they are rendered once for all thresholds
+            save_visualization_slices(volume, slices_dir=volume_dir)
+            slices_path = volume_dir / "middle_slices.png"
+            # Every threshold of this volume reads only the blocks containing its level
+            surface_index = None
+            if RECONSTRUCTION_CONFIG.get('mesh_block_size'):
+                surface_index = SurfaceIndex.for_volume_file(volume_dir / "reconstruction.npy",
+                                                             RECONSTRUCTION_CONFIG['mesh_block_size'])
+
+            for threshold in thresholds:
+                run_dir = sweep_dir / f"{base_name}_{filter_type}_{threshold}_{mask_status}"
+                model_dir = run_dir / "model"
+                model_dir.mkdir(parents=True, exist_ok=True)
+
+                start = time.perf_counter()
+                vertices, faces = extract_surface(volume, threshold=threshold,
+                                                  target_faces=RECONSTRUCTION_CONFIG.get('stl_target_faces'),
+                                                  index=surface_index, executor=mesh_executor)
+                write_binary_stl(model_dir / "model.stl", vertices, faces)
+
+                _write_config(run_dir / "config.txt", {
+                    'Sweep Combination': {
+                        'Original Video': str(video_path),
+                        'Crop Rectangle': str(crop_rect),
+                        'filter_type': filter_type,
+                        'stl_threshold': threshold,
+                        'apply_circular_mask': apply_mask,
+                        'Volume': str(volume_dir / "reconstruction.npy"),
+                        'Middle Slices': str(slices_path)
+                    },
+                    'Geometry Parameters': GEOMETRY_CONFIG,
+                    'Video Processing Parameters': VIDEO_CONFIG
+                })
+
+                index['results'].append({
+                    'filter_type': filter_type,
+                    'stl_threshold': threshold,
+                    'apply_circular_mask': apply_mask,
+                    'folder': str(run_dir.relative_to(sweep_dir)),
+                    'volume': str(volume_dir.relative_to(sweep_dir)),
+                    'slices': str(slices_path.relative_to(sweep_dir)),
+                    'faces': int(len(faces)),
+                    'reconstruct_seconds': reconstruct_seconds,
+                    'surface_seconds': time.perf_counter() - start
+                })
+
+    with open(sweep_dir / "sweep_index.json", 'w') as f:
+        json.dump(index, f, indent=2)
+
+    print(f"Sweep complete. All results saved in: {sweep_dir}")
+    return sweep_dir
+
+def _parse_bool(value):
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise argparse.ArgumentTypeError(f"Expected true or false, got {value}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep reconstruction parameters over one decoded video.")
+    parser.add_argument('video', help="Source video (.mov)")
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                        help="Crop rectangle in source pixels (default: full frame)")
+    parser.add_argument('--filters', nargs='+', default=[RECONSTRUCTION_CONFIG['filter_type']])
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[RECONSTRUCTION_CONFIG['stl_threshold']])
+    parser.add_argument('--masks', type=_parse_bool, nargs='+',
+                        default=[RECONSTRUCTION_CONFIG.get('apply_circular_mask', False)])
+    parser.add_argument('--output', default="final_config", help="Parent directory of the sweep folder")
+    parser.add_argument('--jobs', type=int, default=None, help="Maximum concurrent reconstructions")
+    args = parser.parse_args()
+
+    run_sweep(args.video, tuple(args.roi) if args.roi else None, args.filters, args.thresholds, args.masks,
+              output_root=args.output, max_parallel=args.jobs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import numpy as np
+
+import fdk_cpu
+from geometry_config import create_angles, create_geometry
+from phantom import ground_truth_volume, phantom_ellipsoids, render_projection
+from reconstruction import run_fdk
+
+def test_phantom_reconstruction_quality():
+    geo = create_geometry(image_size=48, detector_size=48)
+    angles = create_angles(90)
+    ellipsoids = phantom_ellipsoids(geo)
+    truth = ground_truth_volume(geo, ellipsoids)
+    projections = np.stack([render_projection(geo, ellipsoids, angle) for angle in angles]).astype(np.float32)
+
+    volume = run_fdk(projections, geo, angles, filter_type='hamming', backend='cpu')
+
+    assert volume.shape == truth.shape
+    nrmse = np.sqrt(np.mean((volume - truth)**2)) / (truth.max() - truth.min())
+    correlation = np.corrcoef(volume.ravel(), truth.ravel())[0, 1]
+    assert nrmse < 0.11
+    assert correlation > 0.75
+
+def test_uniform_cylinder_stays_flat():
+    geo = create_geometry(image_size=48, detector_size=48)
+    angles = create_angles(90)
+    radius = 0.35 * geo.sVoxel[1]
+    # Line integrals through an infinitely tall cylinder of unit attenuation on the rotation axis
+    v, u = np.meshgrid(*fdk_cpu.detector_coordinates(geo), indexing='ij')
+    in_plane = np.sqrt(geo.DSO**2 + u**2)
+    distance = geo.DSO * np.abs(u) / in_plane
+    chord = 2 * np.sqrt(np.clip(radius**2 - distance**2, 0, None)) * np.sqrt(in_plane**2 + v**2) / in_plane
+    projections = np.repeat(chord[None].astype(np.float32), len(angles), axis=0)
+
+    volume = fdk_cpu.fdk(projections, geo, angles, filter='ram_lak')
+
+    nz, ny, nx = volume.shape
+    y, x = np.mgrid[:ny, :nx]
+    r = np.hypot((y - (ny - 1) / 2) * geo.dVoxel[1], (x - (nx - 1) / 2) * geo.dVoxel[2])
+    core = volume[nz // 2 - 4:nz // 2 + 4][:, r < 0.7 * radius]
+    assert abs(core.mean() - 1) < 0.02
+    assert core.std() / core.mean() < 0.01
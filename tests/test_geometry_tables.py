@@ -0,0 +1,18 @@
+import geometry_tables
+from geometry_config import create_geometry
+from geometry_tables import clear_tables, tables_for
+
+def test_least_recently_used_geometry_is_dropped():
+    clear_tables()
+    geometries = [create_geometry(image_size=16 + 8 * i, detector_size=16 + 8 * i)
+                  for i in range(geometry_tables.MAX_GEOMETRIES + 1)]
+    first = tables_for(geometries[0])
+    for geo in geometries[1:-1]:
+        tables_for(geo)
+    assert tables_for(geometries[0]) is first  # Now the most recently used
+
+    tables_for(geometries[-1])
+    kept = [geometry_tables._geometry_fields(geo) in geometry_tables._tables for geo in geometries]
+    assert kept == [True, False] + [True] * (geometry_tables.MAX_GEOMETRIES - 1)
+    assert tables_for(geometries[0]) is first
+    clear_tables()
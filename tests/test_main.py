@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from geometry_config import create_angles, create_geometry
+from main import Job, ProcessingQueue
+from phantom import attenuation_for_contrast, phantom_ellipsoids, write_phantom_video
+
+def test_processing_queue_job_with_mesh_workers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    size, num_frames = 48, 60
+    geo = create_geometry(image_size=size, detector_size=size)
+    ellipsoids = phantom_ellipsoids(geo)
+    video_path = write_phantom_video(tmp_path / "phantom.avi", geo, create_angles(num_frames), ellipsoids,
+                                     attenuation_for_contrast(geo, ellipsoids))
+    overrides = {
+        'GEOMETRY_CONFIG': {'image_size': size, 'detector_size': size},
+        'VIDEO_CONFIG': {'num_frames': num_frames, 'rotation_period': None},
+        # Several blocks on a process pool started by the job's process
+        'RECONSTRUCTION_CONFIG': {'backend': 'cpu', 'mesh_workers': 2, 'mesh_block_size': 16},
+        'CACHE_CONFIG': {'enabled': False},
+    }
+    processing = ProcessingQueue(spool_dir=tmp_path / "spool")
+    job = Job(0, str(video_path), tmp_path / "run", None)
+    try:
+        processing.submit(job, overrides)
+        daemonic = []
+        while True:
+            kind, _, *details = processing.messages.get(timeout=300)
+            if kind == 'stage' and processing.process is not None:
+                daemonic.append(processing.process.daemon)
+            elif kind != 'start':
+                break
+    finally:
+        processing.close()
+
+    assert kind == 'done', details
+    assert daemonic and not any(daemonic)
+    assert (Path(details[0]) / "model" / "model.stl").exists()
+    assert processing.standby is None and not processing.thread.is_alive()
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from precision import LutProjections, wrap_projections
+from preprocessing import Clip, LogLut, Mask, Preprocessor, SubtractBackground, log_lut
+
+def test_scalar_ops_are_folded_into_the_table():
+    preprocessor = Preprocessor([LogLut(250.0), SubtractBackground(0.1), Clip(0.0, 3.0),
+                                 SubtractBackground(np.zeros((4, 4)))])
+    np.testing.assert_array_equal(preprocessor.lut, np.clip(log_lut(250.0) - np.float32(0.1), 0.0, 3.0))
+    # Folding stops at the first operation that needs the pixel position
+    assert [type(op) for op in preprocessor.pixel_ops] == [SubtractBackground]
+
+@pytest.mark.parametrize('flat_field', [256.0, 200.0])
+def test_uint8_decode_matches_float32_within_one_step(flat_field):
+    mask = np.ones((16, 24), dtype=bool)
+    mask[:4] = False
+    preprocessor = Preprocessor([LogLut(flat_field), Clip(0.0, 10.0), Mask(mask)])
+    intensities = np.random.default_rng(0).integers(0, 256, size=(5, 16, 24), dtype=np.uint8)
+
+    expected = preprocessor.process_block(intensities)
+    codes = np.empty(intensities.shape, dtype=np.uint8)
+    preprocessor.encode_block(intensities, codes)
+    projections = wrap_projections(codes, preprocessor.lut)
+
+    assert isinstance(projections, LutProjections)
+    decoded = np.asarray(projections)
+    assert np.all(decoded[:, ~mask] == 0)
+    step = np.max(np.abs(np.diff(preprocessor.lut)))
+    assert np.max(np.abs(decoded - expected)) <= step
+
+def test_table_is_not_pinned_without_an_exact_zero():
+    # No intensity of a 255.5 backlight has exactly zero attenuation
+    table = log_lut(255.5)
+    preprocessor = Preprocessor([LogLut(255.5), Mask(np.ones((4, 4), dtype=bool))])
+    np.testing.assert_array_equal(preprocessor.lut, table)
+    assert preprocessor.zero_code is None and not preprocessor.encodes_intensities
+    with pytest.raises(ValueError, match='zero attenuation'):
+        preprocessor.encode_block(np.zeros((1, 4, 4), dtype=np.uint8), np.empty((1, 4, 4), dtype=np.uint8))
+
+    projections = LutProjections(np.full((2, 4, 4), 254, dtype=np.uint8), table)
+    np.testing.assert_array_equal(projections.lut, table)
+    with pytest.raises(ValueError, match='zero-attenuation'):
+        projections[:, 0] = 0
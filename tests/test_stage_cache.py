@@ -0,0 +1,44 @@
+import os
+import time
+
+import numpy as np
+
+from stage_cache import StageCache
+
+PARAMS = {'filter_type': 'hamming', 'stl_threshold': 0.3, 'num_frames': 800, 'apply_circular_mask': True,
+          'target_size': (512, 512), 'background': np.arange(6, dtype=np.float32).reshape(2, 3)}
+CHANGED = {'filter_type': 'hann', 'stl_threshold': 0.35, 'num_frames': 801, 'apply_circular_mask': False,
+           'target_size': (512, 256), 'background': np.arange(1, 7, dtype=np.float32).reshape(2, 3)}
+
+def test_key_is_stable_and_covers_every_param(tmp_path):
+    cache = StageCache(tmp_path, max_bytes=1024**2)
+    key = cache.key('volume', 'abc123', PARAMS)
+
+    reordered = dict(reversed(list(PARAMS.items())))
+    copied = {name: np.copy(value) if isinstance(value, np.ndarray) else value for name, value in PARAMS.items()}
+    assert cache.key('volume', 'abc123', reordered) == key
+    assert cache.key('volume', 'abc123', copied) == key
+
+    assert cache.key('mesh', 'abc123', PARAMS) != key
+    assert cache.key('volume', 'abc124', PARAMS) != key
+    for name, value in CHANGED.items():
+        assert cache.key('volume', 'abc123', dict(PARAMS, **{name: value})) != key, name
+
+def test_eviction_removes_least_recently_used_first(tmp_path):
+    entry = np.zeros(1000)
+    entry_bytes = entry.nbytes + 128  # .npy header
+    cache = StageCache(tmp_path, max_bytes=3 * entry_bytes)
+    paths = {name: cache.store('volume', name, entry) for name in ('a', 'b', 'c')}
+    # Distinct access times, oldest first, independent of the file system's timestamp resolution
+    start = time.time() - 100
+    for age, name in enumerate(('a', 'b', 'c')):
+        os.utime(paths[name], (start + age, start + age))
+
+    # Reading 'a' makes it the most recently used entry
+    assert cache.load('volume', 'a') is not None
+    cache.store('volume', 'd', entry)
+
+    assert not paths['b'].exists()
+    assert paths['a'].exists() and paths['c'].exists()
+    assert cache.load('volume', 'd') is not None
+    assert cache.load('volume', 'b') is None
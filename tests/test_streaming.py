@@ -0,0 +1,20 @@
+from test_video_processor import rotating_video
+
+import streaming
+from config import VIDEO_CONFIG
+from video_processor import VideoProcessor
+
+def test_auto_period_is_detected_before_streaming(tmp_path, monkeypatch):
+    monkeypatch.setitem(VIDEO_CONFIG, 'rotation_period', 'auto')
+    video_path = rotating_video(tmp_path / "rotation.avi", period=100, num_frames=150)
+    with VideoProcessor(video_path, target_size=(48, 48)) as processor:
+        assert abs(streaming.streaming_period(processor) - 100) < 0.05
+
+def test_auto_period_falls_back_with_a_warning(tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(VIDEO_CONFIG, 'rotation_period', 'auto')
+    monkeypatch.setitem(VIDEO_CONFIG, 'num_frames', 40)
+    video_path = rotating_video(tmp_path / "partial.avi", period=100, num_frames=60)
+    with VideoProcessor(video_path, target_size=(48, 48)) as processor:
+        assert streaming.streaming_period(processor) == 40
+    assert streaming.streaming_period() == 40
+    assert capsys.readouterr().out.count("Warning:") == 2
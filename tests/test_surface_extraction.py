@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+from skimage import measure
+
+from surface_extraction import SurfaceIndex, marching_cubes_blocks
+
+def sphere_volume(shape=(30, 34, 38), radius=11):
+    z, y, x = np.indices(shape)
+    center = np.array(shape) / 2 - 0.5
+    distance = np.sqrt((z - center[0])**2 + (y - center[1])**2 + (x - center[2])**2)
+    return (radius - distance).astype(np.float32)
+
+def triangle_set(vertices, faces):
+    """
+    Triangles as sorted vertex coordinates, independent of vertex and face order.
+    """
+    triangles = np.round(vertices[faces], 4).tolist()
+    return sorted(tuple(sorted(map(tuple, triangle))) for triangle in triangles)
+
+def test_marching_cubes_blocks_matches_single_pass():
+    volume = sphere_volume()
+    level = 0.0
+    vertices, faces, _, _ = measure.marching_cubes(volume > level, 0.5)
+
+    block_vertices, block_faces = marching_cubes_blocks(volume, level, block_size=8, num_workers=1)
+
+    assert len(block_faces) == len(faces)
+    assert len(block_vertices) == len(vertices)
+    assert triangle_set(block_vertices, block_faces) == triangle_set(vertices, faces)
+
+def test_surface_index_rebuilds_after_volume_changes(tmp_path):
+    volume_path = tmp_path / "reconstruction.npy"
+    volume = sphere_volume()
+    np.save(volume_path, volume)
+    index = SurfaceIndex.for_volume_file(volume_path, block_size=8)
+    assert SurfaceIndex.path_for(volume_path).exists()
+    assert index.value_range == (volume.min(), volume.max())
+
+    # Same size, new contents, as when a run folder is reconstructed again
+    np.save(volume_path, volume + 5)
+    status = os.stat(volume_path)
+    os.utime(volume_path, ns=(status.st_atime_ns, status.st_mtime_ns + 1_000_000_000))
+    rebuilt = SurfaceIndex.for_volume_file(volume_path, block_size=8)
+
+    assert rebuilt.value_range == (volume.min() + 5, volume.max() + 5)
+    np.testing.assert_array_equal(rebuilt.mins, index.mins + 5)
+    np.testing.assert_array_equal(rebuilt.maxs, index.maxs + 5)
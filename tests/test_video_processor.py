@@ -0,0 +1,48 @@
+import numpy as np
+
+from geometry_config import create_angles, create_geometry
+from phantom import attenuation_for_contrast, phantom_ellipsoids, write_phantom_video
+from video_processor import VideoProcessor, find_revolution, select_revolution_frames
+
+def rotating_video(path, period, num_frames, size=48):
+    geo = create_geometry(image_size=size, detector_size=size)
+    ellipsoids = phantom_ellipsoids(geo)
+    angles = 2 * np.pi * np.arange(num_frames) / period
+    return write_phantom_video(path, geo, angles, ellipsoids, attenuation_for_contrast(geo, ellipsoids))
+
+def test_estimate_rotation_period(tmp_path):
+    video_path = rotating_video(tmp_path / "rotation.avi", period=100, num_frames=150)
+    with VideoProcessor(video_path, target_size=(48, 48)) as processor:
+        period = processor.estimate_rotation_period()
+    assert abs(period - 100) < 0.05
+
+def test_find_revolution_rejects_half_period():
+    # An object that looks almost the same after half a turn: the curve also peaks at frame 50
+    frames = np.arange(150)
+    turn = 2 * np.pi * frames / 100
+    correlation = 0.6 + 0.05 * np.cos(turn) + 0.35 * np.cos(2 * turn)
+    # Frame 0 mirrored is the view half a turn later
+    mirror_correlation = 0.6 - 0.05 * np.cos(turn) + 0.35 * np.cos(2 * turn)
+    assert correlation[50] > 0.85
+
+    assert abs(find_revolution(correlation, mirror_correlation) - 100) < 1e-6
+
+def test_find_revolution_without_a_full_turn():
+    frames = np.arange(60)
+    correlation = np.cos(2 * np.pi * frames / 100)
+    assert find_revolution(correlation, correlation[::-1]) is None
+
+def test_extract_revolution_falls_back_to_first_frames(tmp_path):
+    video_path = rotating_video(tmp_path / "partial.avi", period=100, num_frames=60)
+    with VideoProcessor(video_path, target_size=(48, 48)) as processor:
+        projections, angles, period = processor.extract_revolution(num_frames=40, rotation_period='auto')
+    assert period is None
+    assert projections.shape == (40, 48, 48)
+    np.testing.assert_allclose(angles, create_angles(40))
+
+def test_select_revolution_frames():
+    indices, angles = select_revolution_frames(100, 50)
+    np.testing.assert_array_equal(indices, np.arange(0, 100, 2))
+    np.testing.assert_allclose(angles, 2 * np.pi * indices / 100)
+    # One revolution has no more distinct frames than its period
+    assert len(select_revolution_frames(100, 150)[0]) == 100
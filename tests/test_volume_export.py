@@ -0,0 +1,35 @@
+import numpy as np
+import tifffile
+
+from volume_export import write_ome_tiff_volume
+
+def _volume():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(5, 40, 70)).astype(np.float32)
+
+def test_ome_tiff_float32_round_trip_is_exact(tmp_path):
+    volume = _volume()
+    path = tmp_path / 'volume.ome.tiff'
+    write_ome_tiff_volume(volume, path, tile_size=32, pyramid_levels=2, num_workers=2)
+
+    with tifffile.TiffFile(path) as tif:
+        series = tif.series[0]
+        stored = series.asarray()  # ZCYX with one channel is squeezed to ZYX
+        level_shapes = [level.shape for level in series.levels]
+    assert stored.dtype == np.float32
+    np.testing.assert_array_equal(stored, volume)
+    assert level_shapes == [(5, 40, 70), (5, 20, 35), (5, 10, 18)]
+
+def test_ome_tiff_uint16_round_trip_is_within_quantization_error(tmp_path):
+    volume = _volume()
+    path = tmp_path / 'volume.ome.tiff'
+    export = write_ome_tiff_volume(volume, path, codec='none', quantization='uint16', tile_size=32,
+                                   pyramid_levels=1)
+
+    with tifffile.TiffFile(path) as tif:
+        stored = tif.series[0].asarray()
+        assert f"value = stored * {export['scale']!r} + {export['offset']!r}" in tif.ome_metadata
+    assert stored.dtype == np.uint16
+    assert export['offset'] == float(volume.min())
+    decoded = stored * export['scale'] + export['offset']
+    assert np.abs(decoded - volume).max() <= export['scale'] / 2 + 1e-6
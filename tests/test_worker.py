@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import config
+from geometry_config import create_angles, create_geometry
+from phantom import attenuation_for_contrast, phantom_ellipsoids, write_phantom_video
+from worker import run_job
+
+def test_run_job_with_geometry_override(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    size, num_frames = 48, 60
+    geo = create_geometry(image_size=size, detector_size=size)
+    ellipsoids = phantom_ellipsoids(geo)
+    video_path = write_phantom_video(tmp_path / "phantom.avi", geo, create_angles(num_frames), ellipsoids,
+                                     attenuation_for_contrast(geo, ellipsoids))
+    target_size = config.VIDEO_CONFIG['target_size']
+    record = {
+        'id': 'test',
+        'video_path': str(video_path),
+        'crop_rect': None,
+        # target_size is not overridden: it has to follow image_size
+        'config': {
+            'GEOMETRY_CONFIG': {'image_size': size, 'detector_size': size},
+            'VIDEO_CONFIG': {'num_frames': num_frames, 'rotation_period': None},
+            'RECONSTRUCTION_CONFIG': {'backend': 'cpu'},
+            'CACHE_CONFIG': {'cache_dir': str(tmp_path / "cache")},
+        },
+        'output_dir': str(tmp_path / "run"),
+        'output_root': str(tmp_path),
+    }
+
+    result = run_job(record, tmp_path / "job.log")
+
+    assert result['error'] is None, (tmp_path / "job.log").read_text()
+    assert (Path(result['output_dir']) / "config.txt").exists()
+    assert any((tmp_path / "cache" / "geometry").iterdir())
+    assert config.VIDEO_CONFIG['target_size'] == target_size
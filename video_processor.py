@@ -1,63 +1,470 @@
 import cv2
+import queue
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import instrumented
 from pathlib import Path
 import matplotlib.pyplot as plt
-from config import VISUALIZATION_CONFIG
+from geometry_config import create_angles
+from precision import storage_dtype, wrap_projections
+from preprocessing import Preprocessor
+
+# Frames decoded before their intensities go through the log table in one call
+BLOCK_FRAMES = 16
+
+def _return_peaks(correlation, trough):
+    """
+    Sub-frame positions of the returns of a correlation curve to its start.
+    
+    A peak is only reported once the curve has fallen off it again.
+    """
+    high = 1.0 - 0.25 * (1.0 - trough)
+    departed = np.flatnonzero(correlation < (1.0 + trough) / 2)
+    position = departed[0] if departed.size else correlation.size
+    while position < correlation.size:
+        returned = np.flatnonzero(correlation[position:] >= high)
+        if returned.size == 0:
+            return
+        left = position + returned[0]
+        fell = np.flatnonzero(correlation[left:] < high)
+        if fell.size == 0:
+            return
+        right = left + fell[0]
+        
+        peak = left + int(np.argmax(correlation[left:right]))
+        # Parabolic refinement of the peak position
+        before, at, after = correlation[peak - 1:peak + 2]
+        curvature = before - 2 * at + after
+        yield peak + 0.5 * (before - after) / curvature if curvature < 0 else float(peak)
+        position = right
+
+def find_revolution(correlation, mirror_correlation):
+    """
+    Locate the end of the first revolution from frame-0 correlation curves.
+    
+    The correlation with frame 0 starts at 1, falls while the object turns
+    away and rises again as it returns to its starting pose. Objects that
+    look alike from opposite sides also return after half a turn, so a
+    candidate period is only accepted if the frame half-way through it
+    matches the mirror image of frame 0, as the view from the far side must.
+    
+    Args:
+        correlation (numpy.ndarray): Normalized correlation of each frame with frame 0
+        mirror_correlation (numpy.ndarray): Correlation of each frame with mirrored frame 0
+        
+    Returns:
+        float or None: Frames per revolution (sub-frame), or None if no full revolution is seen
+    """
+    correlation = np.asarray(correlation, dtype=np.float64)
+    mirror_correlation = np.asarray(mirror_correlation, dtype=np.float64)
+    trough = correlation.min() if correlation.size else 1.0
+    if 1.0 - trough < 0.05:
+        # The object barely changes; nothing to lock on to
+        return None
+    
+    for period in _return_peaks(correlation, trough):
+        opposite = mirror_correlation[:int(period) + 1]
+        half_turn = opposite[int(round(period / 2))]
+        if half_turn >= opposite.max() - 0.25 * (opposite.max() - opposite.min()):
+            return period
+    return None
+
+def select_revolution_frames(period, num_frames):
+    """
+    Evenly spaced frames within one revolution and their true angles.
+    
+    Args:
+        period (float): Frames per revolution
+        num_frames (int): Requested number of projections
+        
+    Returns:
+        tuple: (frame indices, angles in radians)
+    """
+    # One revolution cannot provide more distinct frames than it contains
+    num_frames = max(1, min(int(num_frames), int(period)))
+    indices = np.round(np.arange(num_frames) * period / num_frames).astype(int)
+    return indices, 2 * np.pi * indices / period
+
+class CroppedVideoWriter:
+    """
+    Encodes cropped frames to an mp4v preview video on a background thread.
+    """
+    def __init__(self, output_path, fps, frame_size, max_queued=64):
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.writer = cv2.VideoWriter(str(output_path), fourcc, fps, frame_size)
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        
+    def _run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            self.writer.write(frame)
+        self.writer.release()
+        
+    def write(self, frame):
+        # Copy so the decoder can reuse its buffer while the frame is queued
+        self.queue.put(np.ascontiguousarray(frame).copy())
+        
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
 
 class VideoProcessor:
-    def __init__(self, video_path, target_size=(512, 512)):
+    def __init__(self, video_path, target_size=(512, 512), crop_rect=None, preview_path=None, flat_field=256.0,
+                 projection_dtype='float32', preprocessor=None):
+        """
+        Args:
+            video_path (str or Path): Source video
+            target_size (tuple): (width, height) of the processed projections
+            crop_rect (tuple, optional): (x1, y1, x2, y2) region cropped from each source frame
+            preview_path (Path, optional): Also write the cropped frames to this mp4v video
+            flat_field (float): Unattenuated intensity used for log inversion
+            projection_dtype (str): Storage of extracted stacks: 'float32', 'float16' or
+                'uint8' (intensities decoded through the log table on read)
+            preprocessor (Preprocessor, optional): Operations applied to each frame; replaces
+                the standard crop_rect / target_size / flat_field preprocessing
+        """
         self.video_path = Path(video_path)
+        self.preprocessor = preprocessor or Preprocessor.standard(crop_rect, target_size, flat_field)
         self.target_size = target_size
+        self.crop_rect = self.preprocessor.crop_rect
+        self.lut = self.preprocessor.lut
+        self.projection_dtype = projection_dtype
+        self.storage_dtype = storage_dtype(projection_dtype)
+        if projection_dtype == 'uint8' and not self.preprocessor.encodes_intensities:
+            raise ValueError(self.preprocessor.uint8_error())
+        self.preview_path = preview_path
+        self.preview_writer = None
         self.cap = None
         
     def __enter__(self):
         self.cap = cv2.VideoCapture(str(self.video_path))
         if not self.cap.isOpened():
             raise ValueError(f"Could not open video file: {self.video_path}")
+        if self.preview_path is not None:
+            if self.crop_rect is not None:
+                x1, y1, x2, y2 = self.crop_rect
+                frame_size = (x2 - x1, y2 - y1)
+            else:
+                frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            self.preview_writer = CroppedVideoWriter(self.preview_path, self.cap.get(cv2.CAP_PROP_FPS), frame_size)
         return self
         
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.cap is not None:
             self.cap.release()
+        if self.preview_writer is not None:
+            self.preview_writer.close()
+            self.preview_writer = None
+            
+    def crop_frame(self, frame):
+        """
+        Return the crop_rect view of a source frame (no copy).
+        """
+        if self.crop_rect is None:
+            return frame
+        x1, y1, x2, y2 = self.crop_rect
+        return frame[y1:y2, x1:x2]
+            
+    def to_intensity(self, frame):
+        """
+        Run the preprocessor's image operations (crop, gray, rotate, resize), keeping uint8 intensities.
+        """
+        return self.preprocessor.intensities(frame)
             
-    def process_frame(self, frame):
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    def process_frame(self, frame, out=None):
+        """
+        Preprocess a source frame into a float32 projection (written into out if given).
+        """
+        return self.preprocessor(frame, out=out)
         
-        # Rotate 90 degrees clockwise
-        rotated = cv2.rotate(gray, cv2.ROTATE_90_CLOCKWISE)
+    def encode_frame(self, frame, out):
+        """
+        Preprocess a source frame straight into a slot of an extracted stack.
         
-        # Resize
-        resized = cv2.resize(rotated, self.target_size)
+        Args:
+            frame (numpy.ndarray): BGR source frame
+            out (numpy.ndarray): (H, W) slot in the storage precision; uint8 slots hold
+                intensities, float16 slots the narrowed projection
+        """
+        self.preprocessor.encode(frame, out)
         
-        # Log inversion
-        log_inverted = -np.log((resized.astype(float) + 1) / 256.0)
+    def decode_frame(self, stored):
+        """
+        float32 projection of a frame stored by encode_frame.
+        """
+        return self.preprocessor.decode(stored)
         
-        return log_inverted
+    def process_frames(self, frames, out=None):
+        """
+        Preprocess a block of source frames with one log-table pass over the block.
         
-    def extract_projection_frames(self, num_frames=200, output_dir=None):
-        frames = []
-        first_frame = None
-        first_original = None
+        Args:
+            frames (sequence): BGR source frames
+            out (numpy.ndarray, optional): (N, H, W) float32 buffer to write into
+            
+        Returns:
+            numpy.ndarray: (N, H, W) float32 projections
+        """
+        intensities = np.empty((len(frames),) + self.frame_shape(), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            intensities[i] = self.to_intensity(frame)
+        return self.preprocessor.process_block(intensities, out=out)
+        
+    def frame_shape(self):
+        """
+        Shape (H, W) of a processed projection frame.
+        """
+        return (self.target_size[1], self.target_size[0])
+        
+    def estimate_rotation_period(self, max_frames=None, size=32):
+        """
+        Estimate the frames per turntable revolution from the video.
         
-        for i in range(num_frames):
+        Frames are read with a private VideoCapture, cropped, reduced to
+        size x size gray thumbnails and correlated against frame 0 and its
+        mirror image; reading stops as soon as the first return to the
+        starting pose is confirmed.
+        
+        Args:
+            max_frames (int, optional): Give up after this many frames (default: whole video)
+            size (int): Thumbnail edge length
+            
+        Returns:
+            float or None: Frames per revolution, or None if no revolution was found
+        """
+        cap = cv2.VideoCapture(str(self.video_path))
+        reference = None
+        correlation = []
+        mirror_correlation = []
+        try:
+            while max_frames is None or len(correlation) < max_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                gray = cv2.cvtColor(self.crop_frame(frame), cv2.COLOR_BGR2GRAY)
+                thumbnail = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+                # Same orientation as the projections, so columns run across the rotation axis
+                thumbnail = cv2.rotate(thumbnail, cv2.ROTATE_90_CLOCKWISE)
+                thumbnail -= thumbnail.mean()
+                thumbnail /= np.linalg.norm(thumbnail) or 1.0
+                if reference is None:
+                    reference, mirrored = thumbnail.ravel(), thumbnail[:, ::-1].ravel()
+                correlation.append(float(thumbnail.ravel() @ reference))
+                mirror_correlation.append(float(thumbnail.ravel() @ mirrored))
+                if len(correlation) % 32 == 0 and find_revolution(correlation, mirror_correlation) is not None:
+                    break
+        finally:
+            cap.release()
+        return find_revolution(correlation, mirror_correlation)
+        
+    def iter_projection_frames(self, num_frames=200, output_dir=None, frame_indices=None, out=None):
+        """
+        Yield processed projection frames one at a time.
+        
+        Args:
+            num_frames (int): Maximum number of frames to read
+            output_dir (Path, optional): Directory for the first frame comparison
+            frame_indices (sequence, optional): Increasing source frame numbers to
+                use instead of the first num_frames; skipped frames are only grabbed
+            out (numpy.ndarray, optional): Stack to encode frame i into (see encode_frame)
+            
+        Yields:
+            numpy.ndarray: Processed frame of shape frame_shape(): float32, or the
+                slot of out it was written to
+        """
+        wanted = range(num_frames) if frame_indices is None else frame_indices[:num_frames]
+        position = 0
+        for i, index in enumerate(wanted):
+            # Advance past unused frames without retrieving or converting them
+            while position < index and self.cap.grab():
+                position += 1
+            if position < index:
+                break
             ret, frame = self.cap.read()
             if not ret:
                 break
+            position += 1
                 
-            if i == 0:
-                first_original = frame.copy()
-                
-            processed_frame = self.process_frame(frame)
-            frames.append(processed_frame)
+            if out is not None:
+                processed_frame = out[i]
+                self.encode_frame(frame, processed_frame)
+            else:
+                processed_frame = self.process_frame(frame)
+            
+            if self.preview_writer is not None:
+                self.preview_writer.write(self.crop_frame(frame))
             
             # Save visualization of first frame
             if i == 0 and output_dir is not None:
-                first_frame = processed_frame
                 # The output_dir for projections is now the main output directory
-                save_first_frame_comparison(first_frame, first_original, output_dir)
+                save_first_frame_comparison(self.decode_frame(processed_frame), self.crop_frame(frame), output_dir)
+                
+            yield processed_frame
+        
+    def extract_revolution(self, num_frames=200, output_dir=None, memmap_path=None, num_workers=1,
+                           rotation_period='auto'):
+        """
+        Extract projections spread evenly over one revolution, with their angles.
+        
+        Args:
+            num_frames (int): Requested number of projections
+            output_dir (Path, optional): Directory for the first frame comparison
+            memmap_path (Path, optional): Back the stack with a .npy memmap on disk
+            num_workers (int): Number of parallel decode workers
+            rotation_period (str, float or None): Frames per revolution; 'auto' estimates it,
+                None assumes the first num_frames frames span exactly one revolution
+            
+        Returns:
+            tuple: (projections, angles in radians, frames per revolution or None)
+        """
+        period = rotation_period
+        if period == 'auto':
+            print("Estimating rotation period...")
+            period = self.estimate_rotation_period()
+            if period is None:
+                print("Warning: no full revolution detected; assuming the first frames span 360 degrees")
+            else:
+                print(f"One revolution takes {period:.2f} frames")
+        
+        if period is None:
+            projections = self.extract_projection_frames(num_frames, output_dir, memmap_path, num_workers)
+            return projections, create_angles(projections.shape[0]), None
+        
+        frame_indices, angles = select_revolution_frames(period, num_frames)
+        projections = self.extract_projection_frames(len(frame_indices), output_dir, memmap_path, num_workers,
+                                                     frame_indices=frame_indices)
+        return projections, angles[:projections.shape[0]], float(period)
+        
+    @instrumented('extract_projection_frames')
+    def extract_projection_frames(self, num_frames=200, output_dir=None, memmap_path=None, num_workers=1,
+                                  frame_indices=None):
+        """
+        Extract projection frames into a single preallocated stack.
+        
+        Frames are preprocessed in blocks (see process_frames). With
+        num_workers > 1 the frame range is split into contiguous segments,
+        each decoded by its own VideoCapture on a worker thread. The ordered,
+        frame-by-frame path is kept when the frame count is unknown or a
+        preview video is being written, since both need frames in sequence.
+        
+        Args:
+            num_frames (int): Maximum number of frames to read
+            output_dir (Path, optional): Directory for the first frame comparison
+            memmap_path (Path, optional): Back the stack with a .npy memmap on disk
+            num_workers (int): Number of parallel decode workers
+            frame_indices (numpy.ndarray, optional): Increasing source frame numbers to
+                extract instead of the first num_frames
             
-        return np.array(frames)
+        Returns:
+            numpy.ndarray: (frames_read, H, W) projections in the storage precision
+                (precision.LutProjections for 'uint8')
+        """
+        if frame_indices is None:
+            frame_indices = np.arange(num_frames)
+        frame_indices = np.asarray(frame_indices, dtype=int)[:num_frames]
+        
+        # Do not reserve more frames than the container reports
+        frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count > 0:
+            frame_indices = frame_indices[frame_indices < frame_count]
+        num_frames = len(frame_indices)
+        
+        shape = (num_frames,) + self.frame_shape()
+        if memmap_path is not None:
+            projections = np.lib.format.open_memmap(str(memmap_path), mode='w+', dtype=self.storage_dtype,
+                                                    shape=shape)
+        else:
+            projections = np.empty(shape, dtype=self.storage_dtype)
+        
+        if frame_count > 0 and self.preview_writer is None and num_frames > 0:
+            count = self._extract_segments(projections, frame_indices, max(1, num_workers), output_dir)
+            return wrap_projections(projections[:count], self.lut)
+        
+        count = 0
+        for _ in self.iter_projection_frames(num_frames, output_dir, frame_indices, out=projections):
+            count += 1
+            
+        return wrap_projections(projections[:count], self.lut)
+        
+    def _extract_segment(self, projections, frame_indices, start, stop):
+        """
+        Decode projections [start, stop) with a private VideoCapture.
+        
+        Frames are reduced to uint8 intensities as they are decoded and
+        preprocessed BLOCK_FRAMES at a time with Preprocessor.encode_block.
+        
+        Returns:
+            tuple: (frames read, cropped first frame if start == 0 else None)
+        """
+        cap = cv2.VideoCapture(str(self.video_path))
+        first_original = None
+        block = np.empty((min(BLOCK_FRAMES, stop - start),) + self.frame_shape(), dtype=np.uint8)
+        scratch = np.empty(block.shape, dtype=np.float32) if self.storage_dtype == np.float16 else None
+        block_start = start
+        read = stop - start
+        try:
+            position = int(frame_indices[start])
+            if position > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            for i in range(start, stop):
+                # Advance past unused frames without retrieving or converting them
+                while position < frame_indices[i] and cap.grab():
+                    position += 1
+                ret, frame = cap.read() if position == frame_indices[i] else (False, None)
+                if not ret:
+                    read = i - start
+                    break
+                position += 1
+                if i == 0:
+                    first_original = self.crop_frame(frame).copy()
+                block[i - block_start] = self.to_intensity(frame)
+                if i + 1 - block_start == len(block):
+                    self.preprocessor.encode_block(block, projections[block_start:i + 1], scratch)
+                    block_start = i + 1
+            # The last, partial block
+            end = start + read
+            if end > block_start:
+                count = end - block_start
+                self.preprocessor.encode_block(block[:count], projections[block_start:end],
+                                               None if scratch is None else scratch[:count])
+        finally:
+            cap.release()
+        return read, first_original
+        
+    def _extract_segments(self, projections, frame_indices, num_workers, output_dir=None):
+        """
+        Fill projections in parallel, one contiguous segment per worker.
+        
+        Returns:
+            int: Number of leading frames that were read successfully
+        """
+        num_frames = projections.shape[0]
+        num_segments = max(1, min(num_workers, num_frames))
+        bounds = np.linspace(0, num_frames, num_segments + 1).astype(int)
+        
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(self._extract_segment, projections, frame_indices, start, stop)
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            results = [future.result() for future in futures]
+        
+        # Stop at the first short segment so the stack stays contiguous in frame order
+        count = 0
+        for (start, stop), (read, _) in zip(zip(bounds[:-1], bounds[1:]), results):
+            count = start + read
+            if read < stop - start:
+                break
+        
+        # Plot from the calling thread; matplotlib is not thread-safe
+        first_original = results[0][1]
+        if output_dir is not None and count > 0 and first_original is not None:
+            save_first_frame_comparison(self.decode_frame(projections[0]), first_original, output_dir)
+        
+        return count
 
 def save_first_frame_comparison(frame, original_frame, output_dir):
     """
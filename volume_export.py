@@ -0,0 +1,290 @@
+"""
+Tiled, compressed volume export with parallel chunk encoding.
+
+The volume is read slice by slice (normally from the memory-mapped
+reconstruction.npy), cut into tiles, optionally quantized, and the tiles are
+compressed on a thread pool while earlier tiles are written, so only a few
+slices are ever held in memory. Output is an OME-TIFF with a 2x downsampled
+pyramid in SubIFDs, or a Zarr (v2) chunked array, which also supports LZ4.
+"""
+import json
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import tifffile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+CODECS = ('none', 'zlib', 'zstd', 'lz4')
+QUANTIZATIONS = (None, 'float16', 'uint16')
+FORMATS = ('ome-tiff', 'zarr')
+
+# TIFF compression scheme per codec; TIFF has no LZ4 scheme
+TIFF_COMPRESSION = {'none': None, 'zlib': 'zlib', 'zstd': 'zstd'}
+
+# Zarr compressor per codec, as numcodecs configurations
+ZARR_COMPRESSOR = {
+    'none': None,
+    'zlib': {'id': 'zlib', 'level': 6},
+    'zstd': {'id': 'zstd', 'level': 3},
+    'lz4': {'id': 'lz4', 'acceleration': 1},
+}
+
+def _encoder(codec):
+    """
+    Function compressing one tile's bytes with the codec.
+    """
+    if codec == 'none':
+        return lambda data: data
+    if codec == 'zlib':
+        return lambda data: zlib.compress(data, ZARR_COMPRESSOR['zlib']['level'])
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("The 'zstd' codec needs the zstandard package (pip install zstandard)")
+        # Compressor objects are not thread-safe, so each call makes its own
+        return lambda data: zstandard.ZstdCompressor(level=ZARR_COMPRESSOR['zstd']['level']).compress(data)
+    if codec == 'lz4':
+        if lz4_block is None:
+            raise ImportError("The 'lz4' codec needs the lz4 package (pip install lz4)")
+        # A little-endian uncompressed-size header, as numcodecs.LZ4 writes
+        return lambda data: lz4_block.compress(data, store_size=True)
+    raise ValueError(f"Unknown codec '{codec}'. Valid codecs are: {CODECS}")
+
+def quantization_scale(volume, quantization):
+    """
+    Linear mapping from stored values back to the reconstructed values.
+
+    Args:
+        volume (numpy.ndarray): (nz, ny, nx) volume, read one slice at a time
+        quantization (str or None): None, 'float16' or 'uint16'
+
+    Returns:
+        tuple: (scale, offset) with value = stored * scale + offset
+    """
+    if quantization != 'uint16':
+        return 1.0, 0.0
+    low, high = np.inf, -np.inf
+    for z in range(volume.shape[0]):
+        image = volume[z]
+        low, high = min(low, float(image.min())), max(high, float(image.max()))
+    scale = (high - low) / 65535 if high > low else 1.0
+    return scale, low
+
+def _quantize(tile, quantization, scale, offset):
+    if quantization is None:
+        return tile.astype('<f4', copy=False)
+    if quantization == 'float16':
+        return tile.astype('<f2')
+    return np.clip(np.rint((tile - offset) / scale), 0, 65535).astype('<u2')
+
+def _stored_dtype(quantization):
+    return np.dtype({None: '<f4', 'float16': '<f2', 'uint16': '<u2'}[quantization])
+
+def _downsample(image):
+    """
+    2x2 mean of a slice, replicating the last row/column of odd sizes.
+    """
+    h, w = image.shape
+    if h % 2 or w % 2:
+        image = np.pad(image, ((0, h % 2), (0, w % 2)), mode='edge')
+    return (image[0::2, 0::2] + image[1::2, 0::2] + image[0::2, 1::2] + image[1::2, 1::2]) * np.float32(0.25)
+
+def _tiles(image, tile_size):
+    """
+    Zero-padded tiles of a 2D image in row-major order.
+    """
+    h, w = image.shape
+    for y in range(0, h, tile_size):
+        for x in range(0, w, tile_size):
+            tile = image[y:y + tile_size, x:x + tile_size]
+            if tile.shape != (tile_size, tile_size):
+                tile = np.pad(tile, ((0, tile_size - tile.shape[0]), (0, tile_size - tile.shape[1])))
+            yield tile
+
+def _in_order(executor, func, items, max_pending):
+    """
+    executor.map with at most max_pending items in flight.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def write_ome_tiff_volume(volume, output_path, codec='zlib', quantization=None, tile_size=256, pyramid_levels=4,
+                          num_workers=None, pixel_size=(1.0, 1.0, 1.0), unit='um', channel_name='shadow'):
+    """
+    Write a volume as a tiled OME-TIFF, compressing tiles in parallel.
+
+    Args:
+        volume (numpy.ndarray): (nz, ny, nx) volume; a memory map is read slice by slice
+        output_path (str or Path): .ome.tiff file
+        codec (str): 'none', 'zlib' or 'zstd'
+        quantization (str or None): None (float32) or 'uint16' (scaled to the volume range)
+        tile_size (int): Tile edge in pixels (multiple of 16)
+        pyramid_levels (int): 2x downsampled levels stored as SubIFDs
+        num_workers (int, optional): Compression threads (default: all cores)
+        pixel_size (tuple): Physical voxel size (x, y, z)
+        unit (str): Unit of pixel_size
+        channel_name (str): Name of the single channel
+
+    Returns:
+        dict: Export settings including the quantization scale and offset
+    """
+    if codec not in TIFF_COMPRESSION:
+        raise ValueError(f"Codec '{codec}' cannot be stored in TIFF; use one of {tuple(TIFF_COMPRESSION)} "
+                         f"or the 'zarr' format")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}'. Valid options are: {QUANTIZATIONS}")
+    if quantization == 'float16':
+        raise ValueError("OME-TIFF has no float16 pixel type; use 'uint16' or the 'zarr' format")
+    if tile_size % 16:
+        raise ValueError("tile_size must be a multiple of 16")
+    encode = _encoder(codec)
+    scale, offset = quantization_scale(volume, quantization)
+    dtype = _stored_dtype(quantization)
+    num_workers = num_workers or os.cpu_count() or 1
+    nz, ny, nx = volume.shape
+
+    def encode_tile(tile):
+        return encode(_quantize(tile, quantization, scale, offset).tobytes())
+
+    def level_shape(level):
+        h, w = ny, nx
+        for _ in range(level):
+            h, w = (h + 1) // 2, (w + 1) // 2
+        return (nz, 1, h, w)
+
+    def level_tile_size(level):
+        # Small pyramid levels get smaller tiles instead of mostly padding
+        return min(tile_size, -(-max(level_shape(level)[2:]) // 16) * 16)
+
+    def level_tiles(level):
+        for z in range(nz):
+            image = np.asarray(volume[z], dtype=np.float32)
+            for _ in range(level):
+                image = _downsample(image)
+            yield from _tiles(image, level_tile_size(level))
+
+    metadata = {
+        'axes': 'ZCYX',
+        'PhysicalSizeX': pixel_size[0],
+        'PhysicalSizeXUnit': unit,
+        'PhysicalSizeY': pixel_size[1],
+        'PhysicalSizeYUnit': unit,
+        'PhysicalSizeZ': pixel_size[2],
+        'PhysicalSizeZUnit': unit,
+        'Channel': {'Name': [channel_name]},
+        'Description': f"value = stored * {scale!r} + {offset!r}",
+    }
+    options = dict(dtype=dtype, compression=TIFF_COMPRESSION[codec], photometric='minisblack')
+    with ThreadPoolExecutor(max_workers=num_workers) as executor, \
+            tifffile.TiffWriter(output_path, bigtiff=True, ome=True, byteorder='<') as tif:
+        for level in range(pyramid_levels + 1):
+            tiles = _in_order(executor, encode_tile, level_tiles(level), num_workers * 4)
+            size = level_tile_size(level)
+            if level == 0:
+                tif.write(tiles, shape=level_shape(0), tile=(size, size), subifds=pyramid_levels,
+                          metadata=metadata, **options)
+            else:
+                tif.write(tiles, shape=level_shape(level), tile=(size, size), subfiletype=1, metadata=None,
+                          **options)
+    return {'format': 'ome-tiff', 'codec': codec, 'quantization': quantization, 'scale': scale, 'offset': offset}
+
+def write_zarr_volume(volume, output_path, codec='zlib', quantization=None, tile_size=256, chunk_depth=64,
+                      num_workers=None, pixel_size=(1.0, 1.0, 1.0), unit='um', channel_name='shadow'):
+    """
+    Write a volume as a Zarr (v2) directory of compressed chunks, in parallel.
+
+    Chunks are (chunk_depth, tile_size, tile_size) and can be read with zarr
+    or any Zarr v2 reader. The quantization scale and physical metadata go
+    to .zattrs.
+
+    Args:
+        volume (numpy.ndarray): (nz, ny, nx) volume; a memory map is read chunk_depth slices at a time
+        output_path (str or Path): .zarr directory (replaced if it exists)
+        codec (str): One of CODECS
+        quantization (str or None): None (float32), 'float16' or 'uint16' (scaled to the volume range)
+        tile_size (int): Chunk edge in y and x
+        chunk_depth (int): Chunk edge in z
+        num_workers (int, optional): Compression threads (default: all cores)
+        pixel_size (tuple): Physical voxel size (x, y, z)
+        unit (str): Unit of pixel_size
+        channel_name (str): Name of the volume
+
+    Returns:
+        dict: Export settings including the quantization scale and offset
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}'. Valid options are: {QUANTIZATIONS}")
+    encode = _encoder(codec)
+    scale, offset = quantization_scale(volume, quantization)
+    dtype = _stored_dtype(quantization)
+    num_workers = num_workers or os.cpu_count() or 1
+    nz, ny, nx = volume.shape
+    chunks = (min(chunk_depth, nz), tile_size, tile_size)
+
+    output_path = Path(output_path)
+    if output_path.exists():
+        for child in output_path.iterdir():
+            child.unlink()
+    output_path.mkdir(parents=True, exist_ok=True)
+    with open(output_path / '.zarray', 'w') as f:
+        json.dump({'zarr_format': 2, 'shape': [nz, ny, nx], 'chunks': list(chunks), 'dtype': dtype.str,
+                   'compressor': ZARR_COMPRESSOR[codec], 'fill_value': 0, 'order': 'C', 'filters': None,
+                   'dimension_separator': '.'}, f, indent=2)
+    settings = {'format': 'zarr', 'codec': codec, 'quantization': quantization, 'scale': scale, 'offset': offset}
+    with open(output_path / '.zattrs', 'w') as f:
+        json.dump(dict(settings, name=channel_name, axes='zyx', pixel_size=list(pixel_size), unit=unit), f, indent=2)
+
+    def blocks():
+        for iz, z in enumerate(range(0, nz, chunks[0])):
+            slab = np.asarray(volume[z:z + chunks[0]], dtype=np.float32)
+            if slab.shape[0] < chunks[0]:
+                slab = np.pad(slab, ((0, chunks[0] - slab.shape[0]), (0, 0), (0, 0)))
+            for iy, y in enumerate(range(0, ny, tile_size)):
+                for ix, x in enumerate(range(0, nx, tile_size)):
+                    block = slab[:, y:y + tile_size, x:x + tile_size]
+                    if block.shape[1:] != (tile_size, tile_size):
+                        block = np.pad(block, ((0, 0), (0, tile_size - block.shape[1]), (0, tile_size - block.shape[2])))
+                    yield f"{iz}.{iy}.{ix}", block
+
+    def write_block(item):
+        name, block = item
+        with open(output_path / name, 'wb') as f:
+            f.write(encode(np.ascontiguousarray(_quantize(block, quantization, scale, offset)).tobytes()))
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for _ in _in_order(executor, write_block, blocks(), num_workers * 2):
+            pass
+    return settings
+
+def write_volume(volume, output_path, format='ome-tiff', codec='zlib', quantization=None, tile_size=256,
+                 pyramid_levels=4, num_workers=None, pixel_size=(1.0, 1.0, 1.0), unit='um', channel_name='shadow'):
+    """
+    Export a volume in the given format; see write_ome_tiff_volume and write_zarr_volume.
+
+    Returns:
+        dict: Export settings including the quantization scale and offset
+    """
+    if format == 'ome-tiff':
+        return write_ome_tiff_volume(volume, output_path, codec=codec, quantization=quantization,
+                                     tile_size=tile_size, pyramid_levels=pyramid_levels, num_workers=num_workers,
+                                     pixel_size=pixel_size, unit=unit, channel_name=channel_name)
+    if format == 'zarr':
+        return write_zarr_volume(volume, output_path, codec=codec, quantization=quantization, tile_size=tile_size,
+                                 num_workers=num_workers, pixel_size=pixel_size, unit=unit, channel_name=channel_name)
+    raise ValueError(f"Unknown export format '{format}'. Valid formats are: {FORMATS}")
@@ -0,0 +1,506 @@
+"""
+Warm reconstruction worker fed from a local job queue.
+
+Importing TIGRE, scikit-image and the export libraries and building the
+geometry tables takes longer than reconstructing a small object, so the
+worker keeps a pool of warm processes that pay that cost once and then
+take jobs from a directory spool:
+
+    <spool>/queued/   jobs waiting, claimed oldest first
+    <spool>/running/  jobs being reconstructed
+    <spool>/done/     finished jobs with their stage timings
+    <spool>/failed/   failed jobs with the error
+    <spool>/logs/     output of each job
+
+Each job is one JSON record (video path, ROI, config overrides) that moves
+between the folders with atomic renames, so clients and the worker never
+see partial files. Run one worker per spool: on start it requeues the jobs
+a killed worker left in running/.
+At most 'workers' jobs run at once, and submit() waits (or refuses) while
+'max_queued' jobs are waiting.
+
+Usage:
+    python worker.py serve --workers 2
+    python worker.py submit recording.mov --roi 100 50 900 850 --set RECONSTRUCTION_CONFIG.stl_threshold=0.3 --wait
+    python worker.py status
+    python worker.py status <job id>
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+import uuid
+from pathlib import Path
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import matplotlib
+matplotlib.use('Agg')
+import config
+from config import WORKER_CONFIG
+
+STATES = ('queued', 'running', 'done', 'failed')
+
+class QueueFull(RuntimeError):
+    """
+    Raised by submit() when max_queued jobs are already waiting.
+    """
+
+def _spool(spool_dir=None):
+    spool = Path(spool_dir or WORKER_CONFIG['spool_dir'])
+    for folder in STATES + ('logs',):
+        (spool / folder).mkdir(parents=True, exist_ok=True)
+    return spool
+
+def _write_record(path, record):
+    # Write to a temporary name and rename, so readers never see partial files
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _read_record(path):
+    with open(path) as f:
+        return json.load(f)
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+def check_overrides(overrides):
+    """
+    Validate config overrides of the form {'RECONSTRUCTION_CONFIG': {'stl_threshold': 0.3}}.
+
+    Raises:
+        ValueError: For unknown config sections or keys
+    """
+    for section, values in overrides.items():
+        params = getattr(config, section, None)
+        if not section.endswith('_CONFIG') or not isinstance(params, dict):
+            raise ValueError(f"Unknown config section: {section}")
+        unknown = [key for key in values if key not in params]
+        if unknown:
+            raise ValueError(f"Unknown {section} keys: {', '.join(unknown)}")
+
+def parse_override(text):
+    """
+    Parse 'SECTION.key=value' into (section, key, value); the value is read as JSON
+    where possible, e.g. 0.3, true, null or [1, 2], and as a string otherwise.
+    """
+    name, sep, value = text.partition('=')
+    section, dot, key = name.partition('.')
+    if not sep or not dot:
+        raise ValueError(f"Config overrides look like SECTION.key=value, got {text}")
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    return section, key, value
+
+def submit(video_path, crop_rect=None, overrides=None, output_dir=None, output_root="final_config",
+           spool_dir=None, block=False):
+    """
+    Queue a reconstruction for the worker.
+
+    Args:
+        video_path (str or Path): Source video
+        crop_rect (tuple, optional): (x1, y1, x2, y2) region of the source frames to reconstruct
+        overrides (dict, optional): Config values for this job, {section: {key: value}}
+        output_dir (str or Path, optional): Run folder; default: a new folder in output_root
+        output_root (str or Path): Parent of the default run folder
+        spool_dir (str or Path, optional): Job spool (default: WORKER_CONFIG['spool_dir'])
+        block (bool): Wait for room in the queue instead of raising QueueFull
+
+    Returns:
+        str: Job id
+    """
+    overrides = overrides or {}
+    check_overrides(overrides)
+    spool = _spool(spool_dir)
+    while len(list((spool / 'queued').glob('*.json'))) >= WORKER_CONFIG['max_queued']:
+        if not block:
+            raise QueueFull(f"{WORKER_CONFIG['max_queued']} jobs are already queued in {spool}")
+        time.sleep(WORKER_CONFIG['poll_interval'])
+
+    # Timestamped ids sort in submission order
+    job_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:6]}"
+    record = {
+        'id': job_id,
+        'state': 'queued',
+        'video_path': str(Path(video_path).resolve()),
+        'crop_rect': list(crop_rect) if crop_rect is not None else None,
+        'config': overrides,
+        'output_dir': str(Path(output_dir).resolve()) if output_dir is not None else None,
+        'output_root': str(Path(output_root).resolve()),
+        'submitted': _now()
+    }
+    _write_record(spool / 'queued' / f"{job_id}.json", record)
+    return job_id
+
+def job_status(job_id, spool_dir=None):
+    """
+    Current record of a job, or None if it is unknown.
+    """
+    spool = _spool(spool_dir)
+    for state in STATES:
+        path = spool / state / f"{job_id}.json"
+        try:
+            return _read_record(path)
+        except FileNotFoundError:
+            # Not in this folder, or moved on while being read
+            continue
+    return None
+
+def list_jobs(spool_dir=None):
+    """
+    Records of all jobs in the spool, oldest first.
+    """
+    spool = _spool(spool_dir)
+    records = []
+    for state in STATES:
+        for path in (spool / state).glob('*.json'):
+            try:
+                records.append(_read_record(path))
+            except FileNotFoundError:
+                continue
+    return sorted(records, key=lambda record: record['id'])
+
+def wait(job_ids, spool_dir=None, poll_interval=None):
+    """
+    Yield the records of the given jobs as they finish, in completion order.
+    """
+    poll_interval = poll_interval or WORKER_CONFIG['poll_interval']
+    remaining = list(job_ids)
+    while remaining:
+        for job_id in list(remaining):
+            record = job_status(job_id, spool_dir)
+            if record is None or record['state'] in ('done', 'failed'):
+                remaining.remove(job_id)
+                yield record or {'id': job_id, 'state': 'failed', 'error': 'job is not in the spool'}
+        if remaining:
+            time.sleep(poll_interval)
+
+def claim_job(job_id, spool_dir=None):
+    """
+    Move a queued job to running/.
+
+    Returns:
+        dict: The job's record, or None if another worker claimed it first
+    """
+    spool = _spool(spool_dir)
+    running_path = spool / 'running' / f"{job_id}.json"
+    try:
+        # Atomic: only one worker can claim a job
+        os.replace(spool / 'queued' / f"{job_id}.json", running_path)
+    except FileNotFoundError:
+        return None
+    record = _read_record(running_path)
+    record.update(state='running', started=_now())
+    _write_record(running_path, record)
+    return record
+
+def job_log(job_id, spool_dir=None):
+    """
+    Path of a job's output log.
+    """
+    return _spool(spool_dir) / 'logs' / f"{job_id}.log"
+
+def finish_job(record, result, spool_dir=None):
+    """
+    Move a running job to done/ or failed/ with the result of run_job.
+
+    Returns:
+        str: 'done' or 'failed'
+    """
+    spool = _spool(spool_dir)
+    queued = datetime.datetime.fromisoformat(record['started']) - \
+        datetime.datetime.fromisoformat(record['submitted'])
+    state = 'failed' if result['error'] else 'done'
+    record.update(state=state, finished=_now(), queue_seconds=queued.total_seconds(), **result)
+    _write_record(spool / state / f"{record['id']}.json", record)
+    (spool / 'running' / f"{record['id']}.json").unlink(missing_ok=True)
+    return state
+
+def warm_up():
+    """
+    Import the reconstruction stack and build the geometry tables.
+    """
+    from config import CACHE_CONFIG, GEOMETRY_CONFIG, RECONSTRUCTION_CONFIG
+    import pipeline
+    from geometry_config import create_geometry
+    from geometry_tables import tables_for
+    from stage_cache import StageCache
+
+    if RECONSTRUCTION_CONFIG.get('backend', 'tigre') == 'tigre':
+        try:
+            import tigre.algorithms
+        except ImportError as e:
+            # Jobs report the error; the worker itself stays up
+            print(f"Could not import TIGRE: {e}")
+    geo = create_geometry(image_size=GEOMETRY_CONFIG['image_size'], detector_size=GEOMETRY_CONFIG['detector_size'])
+    cache = None
+    if CACHE_CONFIG.get('enabled', False):
+        # Map the tables from the stage cache, so the workers share one copy
+        cache = StageCache(CACHE_CONFIG['cache_dir'], max_bytes=CACHE_CONFIG['max_size_gb'] * 1024**3)
+    tables = tables_for(geo, cache=cache)
+    tables.cosine_weights()
+    tables.ramp_filter(RECONSTRUCTION_CONFIG['filter_type'])
+    tables.circular_mask()
+
+def _init_worker():
+    # Ctrl+C stops the dispatcher, which lets running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        warm_up()
+    except Exception:
+        # A broken warm-up would break the pool; the jobs report the error instead
+        traceback.print_exc()
+
+def _ready():
+    return os.getpid()
+
+# Config values config.py derives from others: (section, key) -> (source section, source key, derive)
+DERIVED_CONFIG = {
+    ('VIDEO_CONFIG', 'target_size'): ('GEOMETRY_CONFIG', 'image_size', lambda size: (size, size)),
+}
+
+@contextlib.contextmanager
+def _config_overrides(overrides):
+    """
+    Apply config overrides for one job and restore the previous values afterwards.
+
+    The config dicts are changed in place, since modules import them by name.
+    Derived values follow an overridden source unless they are overridden too,
+    and the shared geometry tables are dropped when the cache settings change.
+    """
+    from geometry_tables import clear_tables
+
+    sections = set(overrides)
+    for (section, key), (source_section, source_key, _) in DERIVED_CONFIG.items():
+        if source_key in overrides.get(source_section, {}):
+            sections.add(section)
+    saved = {section: dict(getattr(config, section)) for section in sections}
+    try:
+        for section, values in overrides.items():
+            getattr(config, section).update(values)
+        for (section, key), (source_section, source_key, derive) in DERIVED_CONFIG.items():
+            if source_key in overrides.get(source_section, {}) and key not in overrides.get(section, {}):
+                getattr(config, section)[key] = derive(getattr(config, source_section)[source_key])
+        if 'CACHE_CONFIG' in overrides:
+            # The tables keep the stage cache they were loaded with
+            clear_tables()
+        yield
+    finally:
+        for section, values in saved.items():
+            params = getattr(config, section)
+            params.clear()
+            params.update(values)
+        if 'CACHE_CONFIG' in overrides:
+            clear_tables()
+
+def run_job(record, log_path):
+    """
+    Reconstruct one job in a warm worker process, logging its output to log_path.
+
+    Returns:
+        dict: output_dir, seconds, timings (seconds per top-level stage) and
+            error (None on success)
+    """
+    from pipeline import process_video
+    from run_folders import run_folder_name
+    from instrumentation import add_stage_listener, remove_stage_listener
+
+    timings = {}
+    started = {}
+
+    def on_stage(event, name, depth):
+        # Stages directly inside process_video, e.g. extract_projection_frames
+        if depth == 1:
+            if event == 'start':
+                started[name] = time.perf_counter()
+            else:
+                timings[name] = round(timings.get(name, 0.0) + time.perf_counter() - started.pop(name), 3)
+
+    start = time.perf_counter()
+    output_dir = record['output_dir']
+    error = None
+    add_stage_listener(on_stage)
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            with _config_overrides(record['config']):
+                if output_dir is None:
+                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                    output_dir = str(Path(record['output_root']) / run_folder_name(record['video_path'], timestamp))
+                Path(output_dir).mkdir(parents=True, exist_ok=True)
+                crop_rect = tuple(record['crop_rect']) if record['crop_rect'] is not None else None
+                print(f"Job: {record['id']}")
+                print(f"Video: {record['video_path']}")
+                print(f"Crop rectangle: {crop_rect}")
+                process_video(record['video_path'], Path(output_dir), crop_rect=crop_rect)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            remove_stage_listener(on_stage)
+    return {'output_dir': output_dir, 'seconds': round(time.perf_counter() - start, 3),
+            'timings': timings, 'error': error}
+
+class Worker:
+    """
+    Dispatches spooled jobs to a pool of warm worker processes.
+
+    Jobs are only claimed when a process is free, so waiting jobs stay in
+    the spool, where clients can see them and submit() applies backpressure.
+    """
+    def __init__(self, spool_dir=None, workers=None):
+        """
+        Args:
+            spool_dir (str or Path, optional): Job spool (default: WORKER_CONFIG['spool_dir'])
+            workers (int, optional): Jobs run at once (default: WORKER_CONFIG['workers'])
+        """
+        self.spool = _spool(spool_dir)
+        self.workers = workers or WORKER_CONFIG['workers']
+        # Spawn, as in the GUI: workers start clean on every platform
+        self.context = multiprocessing.get_context('spawn')
+        self.executor = None
+        self.running = {}
+
+    def _start_pool(self):
+        print(f"Starting {self.workers} warm worker process(es)...")
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.context, initializer=_init_worker)
+        # Processes start on demand; start them all now so the first jobs find them warm
+        start = time.perf_counter()
+        for future in [self.executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+        print(f"Workers ready in {time.perf_counter() - start:.1f}s")
+
+    def requeue_interrupted(self):
+        """
+        Put jobs left in running/ by a stopped worker back in the queue.
+        """
+        for path in sorted((self.spool / 'running').glob('*.json')):
+            record = _read_record(path)
+            print(f"Requeueing interrupted job {record['id']}")
+            record.update(state='queued', started=None)
+            _write_record(self.spool / 'queued' / path.name, record)
+            path.unlink()
+
+    def claim(self):
+        """
+        Start queued jobs, oldest first, while worker processes are free.
+        """
+        for path in sorted((self.spool / 'queued').glob('*.json')):
+            if len(self.running) >= self.workers:
+                return
+            record = claim_job(path.stem, self.spool)
+            if record is None:
+                continue
+            log_path = job_log(record['id'], self.spool)
+            self.running[record['id']] = (record, time.perf_counter(),
+                                          self.executor.submit(run_job, record, str(log_path)))
+            print(f"Started {record['id']}: {Path(record['video_path']).name}")
+
+    def collect(self):
+        """
+        Record the outcome of finished jobs.
+        """
+        broken = False
+        for job_id, (record, start, future) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[job_id]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                broken = True
+                result = {'seconds': round(time.perf_counter() - start, 3), 'timings': {},
+                          'error': "worker process died"}
+            except Exception as e:
+                result = {'seconds': round(time.perf_counter() - start, 3), 'timings': {},
+                          'error': f"{type(e).__name__}: {e}"}
+            state = finish_job(record, result, self.spool)
+            print(f"{state.capitalize()} {job_id} in {result['seconds']:.1f}s"
+                  + (f": {result['error']}" if result['error'] else ""))
+        if broken:
+            # A crashed process breaks the whole pool; start a fresh one
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self._start_pool()
+
+    def serve(self):
+        """
+        Run jobs until interrupted; running jobs are finished before exiting.
+        """
+        self.requeue_interrupted()
+        self._start_pool()
+        print(f"Waiting for jobs in {self.spool} (Ctrl+C to stop)")
+        try:
+            while True:
+                self.collect()
+                self.claim()
+                time.sleep(WORKER_CONFIG['poll_interval'])
+        except KeyboardInterrupt:
+            print(f"Stopping; finishing {len(self.running)} running job(s)...")
+            self.executor.shutdown(wait=True)
+            self.collect()
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+def _print_jobs(records):
+    for record in records:
+        line = f"{record['id']}  {record['state']:<8} {Path(record['video_path']).name}"
+        if 'seconds' in record:
+            line += f"  {record['seconds']:.1f}s"
+        if record.get('error'):
+            line += f"  {record['error']}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm reconstruction worker and its client.")
+    parser.add_argument('--spool', help="Job spool directory (default: WORKER_CONFIG['spool_dir'])")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="Run the worker")
+    serve_parser.add_argument('--workers', type=int, help="Jobs run at once (default: WORKER_CONFIG['workers'])")
+
+    submit_parser = commands.add_parser('submit', help="Queue a video")
+    submit_parser.add_argument('video', help="Source video")
+    submit_parser.add_argument('--roi', type=int, nargs=4, metavar=('X1', 'Y1', 'X2', 'Y2'), help="Crop rectangle")
+    submit_parser.add_argument('--set', action='append', default=[], metavar='SECTION.key=value',
+                               help="Config override for this job, e.g. RECONSTRUCTION_CONFIG.filter_type=hann")
+    submit_parser.add_argument('--output', help="Run folder (default: a new folder in final_config/)")
+    submit_parser.add_argument('--wait', action='store_true', help="Wait for the job and print its timings")
+
+    status_parser = commands.add_parser('status', help="List jobs, or show one")
+    status_parser.add_argument('job_id', nargs='?', help="Job to show")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        Worker(args.spool, args.workers).serve()
+    elif args.command == 'submit':
+        overrides = {}
+        try:
+            for text in args.set:
+                section, key, value = parse_override(text)
+                overrides.setdefault(section, {})[key] = value
+            job_id = submit(args.video, args.roi, overrides, output_dir=args.output, spool_dir=args.spool)
+        except (ValueError, QueueFull) as e:
+            parser.error(str(e))
+        print(job_id)
+        if args.wait:
+            record = next(wait([job_id], args.spool))
+            print(json.dumps(record, indent=2))
+            sys.exit(0 if record['state'] == 'done' else 1)
+    elif args.job_id is not None:
+        record = job_status(args.job_id, args.spool)
+        if record is None:
+            parser.error(f"Unknown job: {args.job_id}")
+        print(json.dumps(record, indent=2))
+    else:
+        _print_jobs(list_jobs(args.spool))
+
+if __name__ == "__main__":
+    main()